@@ -1,49 +1,120 @@
 #include <Servo.h>
+#include <Wire.h>
+#include "INA3221.h"
 
-Servo servo_0;
-Servo servo_1;
-Servo servo_2;
-Servo servo_3;
-Servo servo_4;
-Servo servo_5;
+Servo servos[6];
 
 #define trigPin 13
 #define echoPin 12
 
-int duration;
+// Binary frame: 0xFF, servo bitmask, one angle byte per set bit, checksum (mask + angles) & 0xFF.
+// Angles never exceed 180 and text commands are ASCII, so 0xFF always starts a frame.
+#define FRAME_HEADER 0xFF
+#define PROTOCOL_VERSION 5
+#define DEFAULT_BAUD 9600
+#define BAUD_CONFIRM_TIMEOUT 2000
+
+// Slew interpolation: servos move towards targetPos at up to maxVelocity (deg/s) with
+// maxAccel (deg/s^2), updated every SLEW_PERIOD ms. A limit of 0 disables it (jump, as in protocol 2).
+#define SLEW_PERIOD 10
+#define SERVO_MIN_PULSE 544   // Servo.h defaults, writeMicroseconds() gives sub-degree steps
+#define SERVO_MAX_PULSE 2400
+
+// Ultrasonic ranging: a trigger every rangingPeriod ms, the echo pulse is timed by a pin change
+// interrupt on echoPin, so loop() never waits for it. Reports the median of the last RANGING_MEDIAN echoes.
+#define RANGING_DEFAULT_HZ 20
+#define RANGING_MAX_HZ 25              // the HC-SR04 echo lasts up to 38 ms without a target
+#define ECHO_TIMEOUT 30000             // us after the trigger (~5 m); later echoes count as misses
+#define RANGING_MEDIAN 5
+#define RANGING_MISSES_DISCONNECTED 20 // consecutive misses before reporting a disconnect
+
+// INA3221 power telemetry: "Power: <bus mV> <mA>" for the three channels every powerPeriod ms.
+// Off until the host sends POWER <hz>; the host watches it for stalls and overcurrent.
+#define POWER_MAX_HZ 50
+
+char lineBuf[32];
+byte lineLen = 0;
+
+byte frameBuf[8];
+byte frameLen = 0;
+byte frameExpected = 0;
+bool inFrame = false;
+
+uint32_t baudConfirmDeadline = 0;
+
 int distance;
 
+uint16_t rangingPeriod = 1000 / RANGING_DEFAULT_HZ;  // ms, 0 stops ranging (RANGE <hz>)
+uint32_t lastTrigger = 0;
+uint32_t triggerTime = 0;
+bool rangingPending = false;
+volatile uint32_t echoStart = 0;
+volatile uint32_t echoDuration = 0;
+volatile bool echoDone = false;
+int distanceSamples[RANGING_MEDIAN];
+byte distanceCount = 0;
+byte distanceNext = 0;
+int missCount = 0;
+
+INA3221 INA(0x40);
+bool powerAvailable = false;
+uint16_t powerPeriod = 0;  // ms, 0 = off (POWER <hz>)
+uint32_t lastPower = 0;
+
 int servoPins[] = {6, 5, 11, 9, 3, 10};
 
-int currentPos[6] = {90, 90, 90, 90, 90, 90};
+float currentPos[6] = {90, 90, 90, 90, 90, 90};
+float currentVel[6] = {0, 0, 0, 0, 0, 0};
 int targetPos[6] = {90, 90, 90, 90, 90, 90};
+int writtenPulse[6] = {0, 0, 0, 0, 0, 0};
+float maxVelocity[6] = {90, 90, 90, 120, 120, 120};
+float maxAccel[6] = {360, 360, 360, 480, 480, 480};
+uint32_t lastSlew = 0;
 
 bool ultrasonicConnected = true;
 
 void setup() {
   pinMode(trigPin, OUTPUT);
   pinMode(echoPin, INPUT);
+  // Pin change interrupt for the echo pin (D12 is PCINT4, serviced by PCINT0_vect)
+  *digitalPinToPCMSK(echoPin) |= bit(digitalPinToPCMSKbit(echoPin));
+  PCIFR |= bit(digitalPinToPCICRbit(echoPin));
+  PCICR |= bit(digitalPinToPCICRbit(echoPin));
 
-  Serial.begin(9600);
-  servo_0.attach(servoPins[0]);
-  servo_1.attach(servoPins[1]);
-  servo_2.attach(servoPins[2]);
-  servo_3.attach(servoPins[3]);
-  servo_4.attach(servoPins[4]);
-  servo_5.attach(servoPins[5]);
+  Serial.begin(DEFAULT_BAUD);
+  Wire.begin();
+  Wire.setClock(400000);  // one sample of all channels takes about 1.5 ms
+  powerAvailable = INA.begin();
+  if (powerAvailable) {
+    INA.setShuntR(0, 0.100);
+    INA.setShuntR(1, 0.102);
+    INA.setShuntR(2, 0.099);
+  }
+  for (int i = 0; i < 6; i++) {
+    servos[i].attach(servoPins[i]);
+    writeServo(i, currentPos[i]);
+  }
+  lastSlew = millis();
 }
 
+void writeServo(int servoIndex, float angle) {
+  int pulse = SERVO_MIN_PULSE + (long)(angle * (SERVO_MAX_PULSE - SERVO_MIN_PULSE) / 180.0);
+  if (pulse != writtenPulse[servoIndex]) {
+    servos[servoIndex].writeMicroseconds(pulse);
+    writtenPulse[servoIndex] = pulse;
+  }
+}
+
+// Validates the angle and sets the target; updateSlew() moves the servo there
 void moveServo(int servoIndex, int servoValue) {
-  if (servoIndex < 5 && servoValue >= 0 && servoValue <= 180) {
-    switch (servoIndex) {
-      case 0: servo_0.write(servoValue); break;
-      case 1: servo_1.write(servoValue); break;
-      case 2: servo_2.write(servoValue); break;
-      case 3: servo_3.write(servoValue); break;
-      case 4: servo_4.write(servoValue); break;
+  if ((servoIndex < 5 && servoValue >= 0 && servoValue <= 180) ||
+      (servoIndex == 5 && servoValue >= 17 && servoValue <= 90)) {
+    targetPos[servoIndex] = servoValue;
+    if (maxVelocity[servoIndex] <= 0 || maxAccel[servoIndex] <= 0) {
+      currentPos[servoIndex] = servoValue;
+      currentVel[servoIndex] = 0;
+      writeServo(servoIndex, servoValue);
     }
-  } else if (servoIndex == 5 && servoValue >= 17 && servoValue <= 90) {
-    servo_5.write(servoValue);
   } else {
     Serial.print("Error: Servo ");
     Serial.print(servoIndex);
@@ -52,73 +123,315 @@ void moveServo(int servoIndex, int servoValue) {
   }
 }
 
-void loop() {
-  if (Serial.available() > 0) {
-    String input = Serial.readStringUntil('\n');
-    int separatorIndex = input.indexOf(' ');
-    if (separatorIndex != -1) {
-      int servoIndex = input.substring(0, separatorIndex).toInt();
-      int servoValue = input.substring(separatorIndex + 1).toInt();
-
-      if (servoIndex >= 0 && servoIndex < 6) {
-        moveServo(servoIndex, servoValue);
-      } else {
-        Serial.println("Error: Invalid servo index.");
-      }
+// Trapezoidal velocity profile per servo: accelerate towards maxVelocity, brake in time to stop on the target
+void updateSlew() {
+  uint32_t now = millis();
+  if (now - lastSlew < SLEW_PERIOD) return;
+  // A stalled loop() pauses the motion instead of turning into one big step
+  float dt = min(now - lastSlew, 5 * SLEW_PERIOD) / 1000.0;
+  lastSlew = now;
+
+  for (int i = 0; i < 6; i++) {
+    float remaining = targetPos[i] - currentPos[i];
+    if (remaining == 0 && currentVel[i] == 0) continue;
+
+    float direction = remaining >= 0 ? 1 : -1;
+    float speed = currentVel[i] * direction;  // negative while still moving away from the target
+    if (maxVelocity[i] <= 0 || maxAccel[i] <= 0) {
+      speed = fabs(remaining) / dt;  // limits switched off mid-move: finish it now
+    } else if (speed > 0 && speed * speed / (2 * maxAccel[i]) >= fabs(remaining)) {
+      // Brake, but keep creeping so the target is always reached
+      speed = max(speed - maxAccel[i] * dt, maxAccel[i] * dt);
+    } else {
+      speed = min(speed + maxAccel[i] * dt, maxVelocity[i]);
     }
+
+    float step = speed * dt;
+    if (step >= fabs(remaining)) {
+      currentPos[i] = targetPos[i];
+      currentVel[i] = 0;
+    } else {
+      currentPos[i] += direction * step;
+      currentVel[i] = direction * speed;
+    }
+    writeServo(i, currentPos[i]);
   }
+}
 
-  static uint32_t tmr;
-  if (millis() - tmr >= 5000) {
-    ultra_sonic();
-    tmr = millis();
+ISR(PCINT0_vect) {
+  if (digitalRead(echoPin) == HIGH) {
+    echoStart = micros();
+  } else if (echoStart != 0) {
+    echoDuration = micros() - echoStart;
+    echoStart = 0;
+    echoDone = true;
   }
 }
 
-void ultra_sonic() {
+void updateRanging() {
+  if (rangingPending) {
+    noInterrupts();
+    bool done = echoDone;
+    uint32_t duration = echoDuration;
+    echoDone = false;
+    interrupts();
+
+    if (done) {
+      rangingPending = false;
+      handleEcho(duration / 58);  // us -> cm, there and back
+    } else if (micros() - triggerTime > ECHO_TIMEOUT) {
+      rangingPending = false;
+      handleEcho(0);
+    }
+    return;
+  }
+
+  if (rangingPeriod == 0 || millis() - lastTrigger < rangingPeriod) return;
+  lastTrigger = millis();
+
+  noInterrupts();
+  echoStart = 0;  // drop a late echo of the previous trigger
+  echoDone = false;
+  interrupts();
   digitalWrite(trigPin, LOW);
-  delayMicroseconds(5);
+  delayMicroseconds(2);
   digitalWrite(trigPin, HIGH);
   delayMicroseconds(10);
   digitalWrite(trigPin, LOW);
+  triggerTime = micros();
+  rangingPending = true;
+}
+
+void handleEcho(int cm) {
+  if (cm <= 0) {
+    if (++missCount == RANGING_MISSES_DISCONNECTED && ultrasonicConnected) {
+      ultrasonicConnected = false;
+      Serial.println("Error: Ultrasonic sensor disconnected.");
+    }
+    return;
+  }
+
+  missCount = 0;
+  if (!ultrasonicConnected) {
+    ultrasonicConnected = true;
+    Serial.println("Message: Ultrasonic sensor connected.");
+  }
+
+  distanceSamples[distanceNext] = cm;
+  distanceNext = (distanceNext + 1) % RANGING_MEDIAN;
+  if (distanceCount < RANGING_MEDIAN) distanceCount++;
+  distance = medianDistance();
+  Serial.print("Distance: ");
+  Serial.println(distance);
+}
+
+void updatePower() {
+  if (powerPeriod == 0 || millis() - lastPower < powerPeriod) return;
+  lastPower = millis();
 
-  duration = pulseIn(echoPin, HIGH);
-  distance = (duration / 2) / 29.1;
+  Serial.print("Power:");
+  for (int ch = 0; ch < 3; ch++) {
+    Serial.print(' ');
+    Serial.print((int)(INA.getBusVoltage(ch) * 1000));
+    Serial.print(' ');
+    Serial.print((int)INA.getCurrent_mA(ch));
+  }
+  Serial.println();
+}
 
-  if (distance > 0) {
-    Serial.print("Distance: ");
-    Serial.println(distance);
+// Hold every servo where it is now; the next command starts a new move
+void stopMotion() {
+  for (int i = 0; i < 6; i++) {
+    targetPos[i] = (int)(currentPos[i] + 0.5);
+    currentPos[i] = targetPos[i];
+    currentVel[i] = 0;
+    writeServo(i, currentPos[i]);
+  }
+}
+
+int medianDistance() {
+  int sorted[RANGING_MEDIAN];
+  for (byte i = 0; i < distanceCount; i++) {
+    int value = distanceSamples[i];
+    byte j = i;
+    for (; j > 0 && sorted[j - 1] > value; j--) sorted[j] = sorted[j - 1];
+    sorted[j] = value;
+  }
+  return sorted[distanceCount / 2];
+}
+
+// "VEL <servo> <deg/s>" / "ACC <servo> <deg/s^2>", or without a servo for all six
+void handleLimit(char *args, float *limits, const char *name) {
+  char *separator = strchr(args, ' ');
+  int first = 0;
+  int last = 5;
+  float value;
+  if (separator != NULL) {
+    first = last = atoi(args);
+    value = atof(separator + 1);
   } else {
-    checkUltrasonicSensor();
+    value = atof(args);
+  }
+  if (first < 0 || first > 5 || value < 0) {
+    Serial.println("Error: Invalid limit.");
+    return;
   }
+  for (int i = first; i <= last; i++) limits[i] = value;
+  Serial.print("Ack: ");
+  Serial.print(name);
+  Serial.print(' ');
+  Serial.println(args);
 }
 
-void checkUltrasonicSensor() {
-  digitalWrite(trigPin, LOW);
-  delayMicroseconds(5);
-  digitalWrite(trigPin, HIGH);
-  delayMicroseconds(10);
-  digitalWrite(trigPin, LOW);
+void handleLine(char *line) {
+  if (strcmp(line, "HELLO") == 0) {
+    baudConfirmDeadline = 0;
+    Serial.print("Ack: HELLO ");
+    Serial.println(PROTOCOL_VERSION);
+    return;
+  }
 
-  duration = pulseIn(echoPin, HIGH);
-  distance = (duration / 2) / 29.1;
+  if (strncmp(line, "BAUD ", 5) == 0) {
+    long baud = atol(line + 5);
+    if (baud == 9600 || baud == 19200 || baud == 38400 || baud == 57600 || baud == 115200) {
+      Serial.print("Ack: BAUD ");
+      Serial.println(baud);
+      Serial.flush();
+      Serial.end();
+      Serial.begin(baud);
+      // Fall back to the default rate unless the host confirms with HELLO in time
+      baudConfirmDeadline = millis() + BAUD_CONFIRM_TIMEOUT;
+    } else {
+      Serial.println("Error: Unsupported baud rate.");
+    }
+    return;
+  }
 
-  static int debounceCounter = 0;
-  const int debounceThreshold = 3;
+  if (strcmp(line, "STOP") == 0) {
+    stopMotion();
+    // The angles every servo is held at, so the host can re-sync its setpoints
+    Serial.print("Ack: STOP");
+    for (int i = 0; i < 6; i++) {
+      Serial.print(' ');
+      Serial.print(targetPos[i]);
+    }
+    Serial.println();
+    return;
+  }
 
-  if (distance == 0) {
-    debounceCounter++;
-    if (debounceCounter >= debounceThreshold) {
-      ultrasonicConnected = false;
-      Serial.println("Error: Ultrasonic sensor disconnected.");
-      debounceCounter = 0;
+  if (strncmp(line, "POWER ", 6) == 0) {
+    int hz = atoi(line + 6);
+    if (!powerAvailable) {
+      Serial.println("Error: INA3221 not found.");
+    } else if (hz >= 0 && hz <= POWER_MAX_HZ) {
+      powerPeriod = hz == 0 ? 0 : 1000 / hz;
+      Serial.print("Ack: POWER ");
+      Serial.println(hz);
+    } else {
+      Serial.println("Error: Unsupported power rate.");
     }
-  } else {
-    debounceCounter = 0;
-    if (!ultrasonicConnected) {
-      ultrasonicConnected = true;
-      Serial.println("Message: Ultrasonic sensor connected.");
+    return;
+  }
+
+  if (strncmp(line, "RANGE ", 6) == 0) {
+    int hz = atoi(line + 6);
+    if (hz >= 0 && hz <= RANGING_MAX_HZ) {
+      rangingPeriod = hz == 0 ? 0 : 1000 / hz;
+      Serial.print("Ack: RANGE ");
+      Serial.println(hz);
+    } else {
+      Serial.println("Error: Unsupported ranging rate.");
+    }
+    return;
+  }
+
+  if (strncmp(line, "VEL ", 4) == 0) {
+    handleLimit(line + 4, maxVelocity, "VEL");
+    return;
+  }
+  if (strncmp(line, "ACC ", 4) == 0) {
+    handleLimit(line + 4, maxAccel, "ACC");
+    return;
+  }
+
+  char *separator = strchr(line, ' ');
+  if (separator != NULL) {
+    int servoIndex = atoi(line);
+    int servoValue = atoi(separator + 1);
+
+    if (servoIndex >= 0 && servoIndex < 6) {
+      moveServo(servoIndex, servoValue);
+    } else {
+      Serial.println("Error: Invalid servo index.");
+    }
+  }
+}
+
+void handleFrameByte(byte b) {
+  frameBuf[frameLen++] = b;
+
+  if (frameLen == 1) {
+    byte mask = b & 0x3F;
+    byte count = 0;
+    for (int i = 0; i < 6; i++) {
+      if (mask & (1 << i)) count++;
+    }
+    frameExpected = 1 + count + 1;  // mask + angles + checksum
+    if (b != mask || count == 0) {
+      inFrame = false;
+      Serial.println("Error: Bad frame mask.");
+    }
+    return;
+  }
+
+  if (frameLen < frameExpected) return;
+  inFrame = false;
+
+  byte checksum = 0;
+  for (int i = 0; i < frameLen - 1; i++) checksum += frameBuf[i];
+  if (checksum != frameBuf[frameLen - 1]) {
+    Serial.println("Error: Bad frame checksum.");
+    return;
+  }
+
+  byte angleIndex = 1;
+  for (int servo = 0; servo < 6; servo++) {
+    if (frameBuf[0] & (1 << servo)) {
+      moveServo(servo, frameBuf[angleIndex++]);
     }
   }
-  Serial.println("Message: Ultrasonic checked.");
+}
+
+// Non-blocking reader: consumes whatever bytes are available without waiting for a full line
+void readSerial() {
+  while (Serial.available() > 0) {
+    byte b = Serial.read();
+
+    if (inFrame) {
+      handleFrameByte(b);
+    } else if (b == FRAME_HEADER) {
+      inFrame = true;
+      frameLen = 0;
+    } else if (b == '\n') {
+      lineBuf[lineLen] = '\0';
+      handleLine(lineBuf);
+      lineLen = 0;
+    } else if (b != '\r' && lineLen < sizeof(lineBuf) - 1) {
+      lineBuf[lineLen++] = b;
+    }
+  }
+}
+
+void loop() {
+  readSerial();
+  updateSlew();
+
+  if (baudConfirmDeadline != 0 && (long)(millis() - baudConfirmDeadline) >= 0) {
+    baudConfirmDeadline = 0;
+    Serial.end();
+    Serial.begin(DEFAULT_BAUD);
+  }
+
+  updateRanging();
+  updatePower();
 }
@@ -0,0 +1,130 @@
+import logging
+import math
+
+import numpy as np
+
+from globals import ARM_LINK_LENGTHS, ARM_BASE_HEIGHT, ARM_SERVO_MAPPING, SERVO_LIMITS
+import kinematics
+
+logger = logging.getLogger(__name__)
+
+
+class ArmModel:
+    """
+    Single description of the arm shared by the UI, jogging and kinematics.
+
+    The planar chain has three joints driven by the servos in servo_mapping
+    (shoulder, elbow, wrist). Joint limits come from the servo limit table, the
+    trig of the current pose is cached and only recomputed when the pose changes.
+    """
+
+    def __init__(self, link_lengths=ARM_LINK_LENGTHS, base_height=ARM_BASE_HEIGHT,
+                 servo_mapping=ARM_SERVO_MAPPING, servo_limits=SERVO_LIMITS):
+        self.link_lengths = np.asarray(link_lengths, dtype=np.float64)
+        self.base_height = base_height
+        self.servo_mapping = list(servo_mapping)
+        self.servo_limits = [tuple(limits) for limits in servo_limits]
+
+        # Limit tables for the kinematic joints, in degrees
+        self.joint_low = np.array([self.servo_limits[s][0] for s in self.servo_mapping], dtype=np.float64)
+        self.joint_high = np.array([self.servo_limits[s][1] for s in self.servo_mapping], dtype=np.float64)
+        self.reach = float(self.link_lengths.sum())
+
+        self._workspace = None
+        self.set_angles([90, 90, 90])
+
+    # --- Current pose ---
+
+    def set_angles(self, angles_deg):
+        """Set the current joint angles (clamped to the limits) and refresh the cached trig."""
+        self.angles_deg = self.clamp(angles_deg)
+        cumulative = np.cumsum(np.radians(self.angles_deg))
+        self._link_x = self.link_lengths * np.cos(cumulative)
+        self._link_y = self.link_lengths * np.sin(cumulative)
+        return self.angles_deg
+
+    def set_servo_angle(self, servo, angle):
+        """Keep the model in sync when a kinematic servo is moved directly (slider, script)."""
+        if servo in self.servo_mapping:
+            joint = self.servo_mapping.index(servo)
+            # Integer echoes of our own setpoints must not erase sub-degree jog progress
+            if abs(self.angles_deg[joint] - angle) < 0.5:
+                return
+            angles = self.angles_deg.copy()
+            angles[joint] = angle
+            self.set_angles(angles)
+
+    @property
+    def position(self):
+        """Gripper position (x, y, z) of the current pose, from the cached trig."""
+        return float(self._link_x.sum()), float(self._link_y.sum()), float(self.base_height)
+
+    @property
+    def jacobian(self):
+        """2x3 XY Jacobian of the current pose (per radian), from the cached trig."""
+        return np.array([
+            -np.cumsum(self._link_y[::-1])[::-1],
+            np.cumsum(self._link_x[::-1])[::-1],
+        ])
+
+    # --- Limits ---
+
+    def clamp(self, angles_deg):
+        return np.clip(np.asarray(angles_deg, dtype=np.float64), self.joint_low, self.joint_high)
+
+    def clamp_servo(self, servo, angle):
+        low, high = self.servo_limits[servo]
+        return max(low, min(high, angle))
+
+    def servo_targets(self, angles_deg=None):
+        """Map joint angles to {servo: integer angle} for the serial writer."""
+        angles = self.angles_deg if angles_deg is None else self.clamp(angles_deg)
+        return {servo: int(round(angle)) for servo, angle in zip(self.servo_mapping, angles)}
+
+    # --- Kinematics ---
+
+    def forward_kinematics(self, angles_deg):
+        """Gripper position for joint angles; accepts one pose (3,) or a batch (N, 3)."""
+        return kinematics.forward_kinematics_batch(angles_deg, self.link_lengths, self.base_height)
+
+    def jacobians(self, angles_deg):
+        """XY Jacobians for a batch of poses, (N, 3) -> (N, 2, 3)."""
+        return kinematics.jacobian_batch(angles_deg, self.link_lengths)
+
+    def inverse_kinematics(self, target_x, target_y):
+        """Joint angles reaching (x, y) with the wrist straight, or None if out of reach."""
+        angles = self.inverse_kinematics_batch([[target_x, target_y]])[0]
+        return None if np.isnan(angles).any() else angles
+
+    def inverse_kinematics_batch(self, targets_xy):
+        angles = kinematics.inverse_kinematics_batch(targets_xy, self.link_lengths)
+        reachable = ~np.isnan(angles).any(axis=-1)
+        angles[reachable] = self.clamp(angles[reachable])
+        return angles
+
+    def move_gripper_direction(self, direction, step=1.0):
+        """
+        One Jacobian step of the gripper in the XY direction (dx, dy, dz); step is in
+        degrees. Only the first two joints move, as in the original jog code.
+        """
+        jacobian = self.jacobian
+        det = jacobian[0, 0] * jacobian[1, 1] - jacobian[0, 1] * jacobian[1, 0]
+        if abs(det) < 1e-6:
+            logger.warning("Якобиан вырожден. Невозможно двигать.")
+            return self.angles_deg
+
+        dx, dy, _ = direction
+        scale = math.radians(step) / det
+        dtheta1 = (jacobian[1, 1] * dx - jacobian[0, 1] * dy) * scale
+        dtheta2 = (-jacobian[1, 0] * dx + jacobian[0, 0] * dy) * scale
+        return self.set_angles(self.angles_deg + np.degrees([dtheta1, dtheta2, 0.0]))
+
+    @property
+    def workspace(self):
+        """Reachable-workspace grid for these joint limits, built on first use."""
+        if self._workspace is None:
+            self._workspace = kinematics.Workspace(
+                joint_limits=list(zip(self.joint_low, self.joint_high)),
+                lengths=self.link_lengths, height=self.base_height
+            )
+        return self._workspace
@@ -0,0 +1,159 @@
+import logging
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+import requests
+
+from globals import CAMERA_STREAM_PORT, CAMERA_STREAM_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_LENGTH_RE = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+_HEADER_END = b"\r\n\r\n"
+
+
+def stream_url_from_capture_url(capture_url):
+    """Build the ESP32 '/stream' URL from the '/capture' URL found during discovery."""
+    if not capture_url.startswith("http://"):
+        return None
+    host = capture_url[len("http://"):].split("/", 1)[0].split(":", 1)[0]
+    return f"http://{host}:{CAMERA_STREAM_PORT}/stream"
+
+
+def decode_jpeg(jpeg):
+    """Decode a JPEG buffer into a BGR image without copying the bytes."""
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class MjpegStreamClient:
+    """
+    Holds one connection to the ESP32 multipart '/stream' endpoint and keeps
+    only the newest JPEG. Parts are cut out of a single receive buffer using
+    the Content-Length header sent by stream_handler in app_httpd.cpp.
+    """
+
+    def __init__(self, stream_url, timeout=5, chunk_size=CAMERA_STREAM_CHUNK_SIZE, reconnect_delay=1.0):
+        self.stream_url = stream_url
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.reconnect_delay = reconnect_delay
+
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.connected = False
+        self.listeners = []  # called with every raw JPEG as it arrives, e.g. FrameRecorder.write
+
+        self._latest = None  # (seq, timestamp, jpeg bytes)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._response = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            response.close()
+        with self._cond:
+            self._cond.notify_all()
+
+    def latest(self):
+        """Return the newest (seq, timestamp, jpeg) tuple or None if nothing arrived yet."""
+        with self._cond:
+            return self._latest
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        """Block until a frame newer than after_seq arrives; return it or None on timeout."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stop.is_set() or (self._latest is not None and self._latest[0] > after_seq),
+                timeout
+            )
+            if self._latest is not None and self._latest[0] > after_seq:
+                return self._latest
+        return None
+
+    def read_image(self):
+        """Decode the newest frame, or return None if the stream has nothing yet."""
+        frame = self.latest()
+        if frame is None:
+            return None
+        return decode_jpeg(frame[2])
+
+    def _publish(self, jpeg):
+        with self._cond:
+            self.frames_received += 1
+            # perf_counter, the clock of SerialEvent.received_at, so frames can be matched to telemetry
+            self._latest = (self.frames_received, time.perf_counter(), jpeg)
+            self._cond.notify_all()
+        for listener in list(self.listeners):
+            listener(jpeg)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._response = requests.get(self.stream_url, stream=True, timeout=self.timeout)
+                self._response.raise_for_status()
+                self.connected = True
+                self._read_parts(self._response.raw)
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning("Camera stream error: %s", e)
+            finally:
+                self.connected = False
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+            self._stop.wait(self.reconnect_delay)
+
+    def _read_parts(self, raw):
+        buf = bytearray()
+        view_start = 0  # consumed prefix of buf, trimmed lazily to avoid memmoves per part
+        while not self._stop.is_set():
+            header_end = buf.find(_HEADER_END, view_start)
+            if header_end < 0:
+                if not self._fill(raw, buf):
+                    return
+                continue
+
+            match = _CONTENT_LENGTH_RE.search(buf, view_start, header_end)
+            body_start = header_end + len(_HEADER_END)
+            if match is None:
+                # Part without Content-Length: fall back to locating the JPEG end marker
+                body_end = buf.find(b"\xff\xd9", body_start)
+                while body_end < 0:
+                    if not self._fill(raw, buf):
+                        return
+                    body_end = buf.find(b"\xff\xd9", body_start)
+                body_end += 2
+            else:
+                body_end = body_start + int(match.group(1))
+                while len(buf) < body_end:
+                    if not self._fill(raw, buf, body_end - len(buf)):
+                        return
+
+            self._publish(bytes(memoryview(buf)[body_start:body_end]))
+            view_start = body_end
+
+            if view_start > len(buf) // 2:
+                del buf[:view_start]
+                view_start = 0
+
+    def _fill(self, raw, buf, wanted=0):
+        # read1 returns whatever the socket has instead of waiting for a full chunk
+        chunk = raw.read1(max(self.chunk_size, wanted))
+        if not chunk:
+            return False
+        self.bytes_received += len(chunk)
+        buf += chunk
+        return True
@@ -0,0 +1,291 @@
+import argparse
+import logging
+import threading
+import time
+
+import numpy as np
+import requests
+
+from globals import (DETECTOR_BACKEND, DETECTOR_MODELS, CAMERA_PROBE_TIMEOUT, CAMERA_TARGET_FPS, CAMERA_QUALITY_BEST,
+                     CAMERA_QUALITY_WORST, CAMERA_QUALITY_STEP, CAMERA_MIN_FRAMESIZE, CAMERA_DECODE_BUDGET,
+                     CAMERA_TUNE_INTERVAL, CAMERA_TUNE_HYSTERESIS, CAMERA_TUNE_UP_INTERVALS)
+
+logger = logging.getLogger(__name__)
+
+# ESP32 framesize codes of the CameraWebServer firmware (sensor.h, framesize_t) and their resolutions
+FRAMESIZES = {
+    0: (96, 96), 1: (160, 120), 2: (176, 144), 3: (240, 176), 4: (240, 240), 5: (320, 240), 6: (400, 296),
+    7: (480, 320), 8: (640, 480), 9: (800, 600), 10: (1024, 768), 11: (1280, 720), 12: (1280, 1024),
+    13: (1600, 1200),
+}
+FRAMESIZE_CODES = {
+    "96X96": 0, "QQVGA": 1, "QCIF": 2, "HQVGA": 3, "240X240": 4, "QVGA": 5, "CIF": 6, "HVGA": 7, "VGA": 8,
+    "SVGA": 9, "XGA": 10, "HD": 11, "SXGA": 12, "UXGA": 13,
+}
+FRAMESIZE_NAMES = {code: name for name, code in FRAMESIZE_CODES.items()}
+
+# Sizes the tuner steps through; the square and 16:9 ones would change the picture shape
+TUNING_FRAMESIZES = (1, 3, 5, 6, 7, 8, 9, 10, 12, 13)
+
+# Good intervals after which a saturated bandwidth is forgotten and a better level is tried again
+CAPACITY_MEMORY = 30
+
+
+def camera_base_url(capture_url):
+    """'http://host[:port]' of the control server from the '/capture' URL found during discovery."""
+    if not capture_url.startswith("http://"):
+        return None
+    return "http://" + capture_url[len("http://"):].split("/", 1)[0]
+
+
+def set_camera_control(base_url, variable, value, timeout=CAMERA_PROBE_TIMEOUT):
+    """Set one sensor option through '/control' (cmd_handler in app_httpd.cpp). Returns True on success."""
+    try:
+        response = requests.get(f"{base_url}/control", params={"var": variable, "val": int(value)}, timeout=timeout)
+    except requests.RequestException as e:
+        logger.warning("Could not set camera %s: %s", variable, e)
+        return False
+    if response.status_code != 200:
+        logger.warning("Camera rejected %s=%s (status %s)", variable, value, response.status_code)
+        return False
+    return True
+
+
+def read_camera_status(base_url, timeout=CAMERA_PROBE_TIMEOUT):
+    """Current sensor settings from '/status', or None."""
+    try:
+        response = requests.get(f"{base_url}/status", timeout=timeout)
+        if response.status_code == 200:
+            return response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Could not read camera status: %s", e)
+    return None
+
+
+def framesize_for_input(input_size):
+    """Smallest tuning framesize that the detector does not have to upscale on either axis."""
+    for code in TUNING_FRAMESIZES:
+        if min(FRAMESIZES[code]) >= input_size:
+            return code
+    return TUNING_FRAMESIZES[-1]
+
+
+def tuning_levels(input_size, best=CAMERA_QUALITY_BEST, worst=CAMERA_QUALITY_WORST, step=CAMERA_QUALITY_STEP,
+                  min_framesize=CAMERA_MIN_FRAMESIZE):
+    """
+    (framesize, quality) settings from the best to the cheapest. The smallest
+    framesize that fits the detector input comes first with the quality
+    lowered step by step; only then the framesize goes below it.
+    """
+    floor = framesize_for_input(input_size)
+    levels = [(floor, quality) for quality in range(best, worst, step)] + [(floor, worst)]
+    smaller = [code for code in TUNING_FRAMESIZES if FRAMESIZE_CODES[min_framesize] <= code < floor]
+    levels += [(code, worst) for code in reversed(smaller)]
+    return levels
+
+
+class CameraTuner:
+    """
+    Keeps the ESP32 framesize and JPEG quality as high as the link and the
+    decoder allow at target_fps.
+
+    Every interval it measures the stream rate and bandwidth (MjpegStreamClient
+    counters) and the JPEG decode time (the metrics stage "jpeg"), then moves one
+    step along tuning_levels(): cheaper at once when the rate falls below the
+    target or decoding takes more than decode_budget of a frame period, back
+    towards the best level after up_intervals good intervals in a row and only if
+    the bandwidth the step needs was not seen to saturate the link during the
+    last CAPACITY_MEMORY intervals.
+    """
+
+    def __init__(self, base_url, stream=None, metrics=None, input_size=None, target_fps=CAMERA_TARGET_FPS,
+                 interval=CAMERA_TUNE_INTERVAL, hysteresis=CAMERA_TUNE_HYSTERESIS, up_intervals=CAMERA_TUNE_UP_INTERVALS,
+                 decode_budget=CAMERA_DECODE_BUDGET, decode_stage="jpeg", on_change=None):
+        self.base_url = base_url
+        self.stream = stream
+        self.metrics = metrics
+        self.target_fps = target_fps
+        self.interval = interval
+        self.hysteresis = hysteresis
+        self.up_intervals = up_intervals
+        self.decode_budget = decode_budget
+        self.decode_stage = decode_stage
+        self.on_change = on_change
+
+        input_size = input_size or DETECTOR_MODELS[DETECTOR_BACKEND]["input_size"]
+        self.levels = tuning_levels(input_size)
+        self.level = 0
+        self.capacity = None  # bytes/s at which the link was seen to saturate
+        self.frame_bytes = {}  # level -> mean JPEG size measured there
+        self.history = []  # (time, level, fps, bandwidth, decode seconds)
+        self.counters = {"intervals": 0, "down": 0, "up": 0, "failed": 0}
+
+        self._good = 0
+        self._last_sample = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def setting(self):
+        framesize, quality = self.levels[self.level]
+        return FRAMESIZE_NAMES[framesize], quality
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="camera-tuner", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def apply(self, level):
+        """Send a level to the camera; the level is kept only if both options were accepted."""
+        framesize, quality = self.levels[level]
+        current_framesize, current_quality = self.levels[self.level]
+        ok = True
+        # Re-applying the current level (at start) sends both options
+        if framesize != current_framesize or level == self.level:
+            ok = set_camera_control(self.base_url, "framesize", framesize)
+        if ok and (quality != current_quality or level == self.level):
+            ok = set_camera_control(self.base_url, "quality", quality)
+        if not ok:
+            self.counters["failed"] += 1
+            return False
+
+        self.level = level
+        self._good = 0
+        self._last_sample = None  # the next interval only starts counting from here
+        logger.info("Camera set to %s, quality %d", *self.setting)
+        if self.on_change is not None:
+            self.on_change(*self.setting)
+        return True
+
+    def update(self, now=None):
+        """Take one measurement and move at most one level. Returns the measurement or None."""
+        now = time.perf_counter() if now is None else now
+        sample = self._measure(now)
+        if sample is None:
+            return None
+        fps, bandwidth, decode = sample
+        self.counters["intervals"] += 1
+        self.history.append((now, self.level, fps, bandwidth, decode))
+
+        period = 1.0 / self.target_fps
+        if fps:
+            self.frame_bytes[self.level] = bandwidth / fps
+        slow_link = fps < self.target_fps * (1 - self.hysteresis)
+        slow_decode = decode > self.decode_budget * period
+
+        if slow_link or slow_decode:
+            if slow_link and not slow_decode:
+                self.capacity = bandwidth if self.capacity is None else min(self.capacity, bandwidth)
+            if self.level + 1 < len(self.levels) and self.apply(self.level + 1):
+                self.counters["down"] += 1
+            return sample
+
+        if self.level == 0 or decode > self.decode_budget * period * (1 - self.hysteresis):
+            self._good = 0
+            return sample
+        self._good += 1
+        if self._good >= CAPACITY_MEMORY:
+            self.capacity = None  # the link may have improved since it saturated
+        if self._good >= self.up_intervals and self._fits(self.level - 1) and self.apply(self.level - 1):
+            self.counters["up"] += 1
+        return sample
+
+    def _fits(self, level):
+        """Would the target rate at this level stay below the saturated bandwidth?"""
+        if self.capacity is None:
+            return True
+        frame_bytes = self.frame_bytes.get(level)
+        if frame_bytes is None:
+            # Not measured yet: assume JPEG size grows with the pixel count
+            framesize = self.levels[level][0]
+            pixels = np.prod(FRAMESIZES[framesize]) / np.prod(FRAMESIZES[self.levels[self.level][0]])
+            frame_bytes = self.frame_bytes.get(self.level, 0) * max(pixels, 1.0) * (1 + self.hysteresis)
+        return frame_bytes * self.target_fps < self.capacity * (1 - self.hysteresis)
+
+    def _measure(self, now):
+        """(fps, bytes/s, median decode seconds) since the previous call; None on the first call after a change."""
+        if self.stream is None:
+            return None
+        counts = (now, self.stream.frames_received, self.stream.bytes_received)
+        previous, self._last_sample = self._last_sample, counts
+        if previous is None or now <= previous[0]:
+            return None
+        elapsed = now - previous[0]
+        fps = (counts[1] - previous[1]) / elapsed
+        bandwidth = (counts[2] - previous[2]) / elapsed
+
+        decode = 0.0
+        if self.metrics is not None and self.decode_stage in self.metrics.stages:
+            timestamps, durations = self.metrics.stages[self.decode_stage].samples()
+            recent = durations[timestamps >= previous[0]]
+            if len(recent):
+                decode = float(np.median(recent))
+        return fps, bandwidth, decode
+
+    def _run(self):
+        status = read_camera_status(self.base_url)
+        if status:
+            logger.info("Camera reports framesize %s, quality %s", status.get("framesize"), status.get("quality"))
+        while not self._stop.is_set() and not self.apply(0):
+            self._stop.wait(self.interval)
+        while not self._stop.wait(self.interval):
+            self.update()
+
+
+if __name__ == "__main__":
+    from camera import MjpegStreamClient, decode_jpeg
+    from metrics import Metrics
+
+    parser = argparse.ArgumentParser(description="Camera framesize/quality auto-tuning against a camera or the simulator")
+    parser.add_argument("--url", help="camera '/capture' URL; a bandwidth-limited simulator camera otherwise")
+    parser.add_argument("--stream-url", help="'/stream' URL (default: port + 1 of --url)")
+    parser.add_argument("--bandwidth", type=float, default=400, help="simulator link speed, KB/s")
+    parser.add_argument("--recording", help="recording for the simulator camera")
+    parser.add_argument("--target-fps", type=float, default=CAMERA_TARGET_FPS)
+    parser.add_argument("--input-size", type=int)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=CAMERA_TUNE_INTERVAL)
+    args = parser.parse_args()
+
+    fake_camera = None
+    if args.url:
+        capture_url = args.url
+        host, _, port = camera_base_url(capture_url)[len("http://"):].partition(":")
+        stream_url = args.stream_url or f"http://{host}:{int(port or 80) + 1}/stream"
+    else:
+        from simulator import FakeCamera
+        fake_camera = FakeCamera(args.recording, port=0, stream_port=0, fps=25,
+                                 bandwidth=args.bandwidth * 1024).start()
+        capture_url, stream_url = fake_camera.capture_url, fake_camera.stream_url
+
+    bench_metrics = Metrics()
+    client = MjpegStreamClient(stream_url).start()
+    tuner = CameraTuner(camera_base_url(capture_url), client, bench_metrics, args.input_size, args.target_fps,
+                        interval=args.interval)
+    print("Levels:", ", ".join(f"{FRAMESIZE_NAMES[f]} q{q}" for f, q in tuner.levels))
+    tuner.start()
+
+    seq = 0
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        frame = client.wait_for_frame(seq, timeout=1.0)
+        if frame is not None:
+            seq = frame[0]
+            with bench_metrics.timed("jpeg"):
+                decode_jpeg(frame[2])
+    tuner.stop()
+    client.stop()
+    if fake_camera is not None:
+        fake_camera.stop()
+
+    started = tuner.history[0][0] if tuner.history else 0
+    for t, level, fps, bandwidth, decode in tuner.history:
+        framesize, quality = tuner.levels[level]
+        print(f"{t - started:6.1f} s  {FRAMESIZE_NAMES[framesize]:>5} q{quality:<2}  {fps:5.1f} FPS  "
+              f"{bandwidth / 1024:7.1f} KB/s  decode {decode * 1000:5.1f} ms")
+    print(f"Final: {tuner.setting[0]}, quality {tuner.setting[1]}  {tuner.counters}")
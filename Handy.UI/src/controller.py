@@ -0,0 +1,364 @@
+import collections
+import logging
+import threading
+import time
+
+import serial
+
+from globals import (SERIAL_PROTOCOL, SERIAL_FAST_BAUDRATE, SERVO_FIRMWARE_SLEW, SERVO_MAX_VELOCITY,
+                     SERVO_MAX_ACCELERATION, ULTRASONIC_RATE_HZ, DISTANCE_HISTORY_SIZE, POWER_RATE_HZ,
+                     POWER_HISTORY_SIZE, POWER_CHANNEL_NAMES, POWER_STOP_ACK_TIMEOUT, SERIAL_EVENT_QUEUE_SIZE)
+import arm
+import jog
+import metrics
+import script_engine
+import serial_link
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+BAUDRATE = 9600
+INITIAL_ANGLES = {0: 90, 1: 90, 2: 90, 3: 90, 4: 90, 5: 45}  # where the UI sliders start
+TELEMETRY_EVENTS = ("distance", "power")  # dropped rather than queued without limit for a slow listener
+
+
+class ArmController:
+    """
+    Everything that drives one arm, without any UI: the serial port (protocol
+    negotiation, ServoCommandWriter, SerialReader), distance and power telemetry,
+    the power watchdog, the script executor and Cartesian jogging.
+
+    Every method is safe to call from any thread. Listeners added with
+    add_listener() get JSON-friendly event dicts, in order, on the controller's
+    own event thread, so a slow listener never holds up serial reads, the power
+    watchdog, scripts or jogging. While the listeners lag more than
+    SERIAL_EVENT_QUEUE_SIZE events behind, new telemetry is dropped:
+
+      {"type": "setpoints", "targets": {servo: angle}}  servos that moved
+      {"type": "distance", "value": cm}
+      {"type": "power", "value": [mV, mA, ...]}         one INA3221 sample
+      {"type": "message" | "error", "text": ...}        firmware Message:/Error: lines
+      {"type": "script", "state": ..., "progress": ...}
+      {"type": "stopped", "reason": ...}                emergency stop
+      {"type": "serial", "port": ..., "protocol": ..., "version": ...}
+    """
+
+    def __init__(self, arm_model=None, baudrate=BAUDRATE, app_metrics=None):
+        self.arm_model = arm_model or arm.ArmModel()
+        self.baudrate = baudrate
+        self.metrics = app_metrics or metrics.Metrics()
+
+        self.port = None
+        self.port_name = None
+        self.protocol = None
+        self.firmware_version = 0
+        self.firmware_slew = False  # True once the firmware accepted the slew limits
+
+        self.angles = dict(INITIAL_ANGLES)
+        for servo, angle in self.angles.items():
+            self.arm_model.set_servo_angle(servo, angle)
+        self.current_distance = 0
+        # Timestamped readings (perf_counter), for frame tagging and the power plot
+        self.distance_history = telemetry.SampleRing(DISTANCE_HISTORY_SIZE)
+        self.power_history = telemetry.SampleRing(POWER_HISTORY_SIZE, 2 * len(POWER_CHANNEL_NAMES))
+        self.power_monitor = telemetry.PowerMonitor()
+
+        # Coalescing, rate-limited writer for servo commands (the port is attached after negotiation)
+        self.writer = serial_link.ServoCommandWriter(baudrate=baudrate).start()
+        self.metrics.register("serial write", self.writer.write_time)
+        self.reader = None
+        self.script = None
+        self.script_state = "idle"
+
+        self._listeners = []
+        self._lock = threading.Lock()  # guards angles and arm_model
+        self._halted_at = None  # monotonic time of a STOP whose ack has not arrived yet
+        self.jog = jog.JogController(self.arm_model, send=self.set_servos, arm_lock=self._lock).start()
+        self._events = collections.deque()
+        self._events_ready = threading.Condition()
+        self._closed = False
+        self.dropped_events = 0
+        threading.Thread(target=self._dispatch, name="arm-events", daemon=True).start()
+
+    # --- Events ---
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event):
+        """Any thread: queue an event for the listeners."""
+        with self._events_ready:
+            if len(self._events) >= SERIAL_EVENT_QUEUE_SIZE and event["type"] in TELEMETRY_EVENTS:
+                self.dropped_events += 1
+                return
+            self._events.append(event)
+            self._events_ready.notify()
+
+    def _dispatch(self):
+        """Event thread: pass queued events to the listeners."""
+        while True:
+            with self._events_ready:
+                while not self._events and not self._closed:
+                    self._events_ready.wait()
+                if not self._events:
+                    return
+                events = list(self._events)
+                self._events.clear()
+            for event in events:
+                for listener in list(self._listeners):
+                    try:
+                        listener(event)
+                    except Exception:
+                        logger.exception("Event listener failed on %s", event["type"])
+
+    # --- Serial port ---
+
+    @property
+    def connected(self):
+        port = self.writer.port
+        return port is not None and port.is_open
+
+    def open_port(self, name):
+        """Open a serial port (raises serial.SerialException); negotiation and I/O start in the background."""
+        self.close_port()
+        # Short read timeout so the reader thread notices when it is stopped
+        port = serial.Serial(name, self.baudrate, timeout=0.5)
+        self.port, self.port_name = port, name
+        logger.info("Connected to serial port: %s", name)
+        threading.Thread(target=self._negotiate, args=(port,), daemon=True).start()
+
+    def close_port(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+        self.writer.port = None
+        if self.port is not None and self.port.is_open:
+            self.port.close()
+        self.port = None
+
+    def _negotiate(self, port):
+        """Pick the binary protocol and faster baud rate if the firmware supports them, then start I/O."""
+        protocol, version = "text", 0
+        if SERIAL_PROTOCOL == "binary":
+            try:
+                protocol, version = serial_link.negotiate(port, SERIAL_FAST_BAUDRATE)
+            except serial.SerialException as e:
+                logger.warning("Protocol negotiation failed: %s", e)
+        logger.info("Serial protocol: %s (firmware protocol %d) at %d baud", protocol, version, port.baudrate)
+
+        self.firmware_slew = False
+        self.firmware_version = version
+        try:
+            if SERVO_FIRMWARE_SLEW and version >= serial_link.SLEW_PROTOCOL_VERSION:
+                self.firmware_slew = serial_link.configure_slew(port, SERVO_MAX_VELOCITY, SERVO_MAX_ACCELERATION)
+            if version >= serial_link.RANGING_PROTOCOL_VERSION:
+                serial_link.configure_ranging(port, ULTRASONIC_RATE_HZ)
+            if version >= serial_link.POWER_PROTOCOL_VERSION:
+                # Power lines are ~36 bytes: 50 Hz needs the fast baud rate
+                rate = POWER_RATE_HZ if port.baudrate >= 57600 else min(POWER_RATE_HZ, 5)
+                if not serial_link.configure_power(port, rate):
+                    logger.warning("No INA3221 power telemetry, stall detection is off")
+        except serial.SerialException as e:
+            logger.warning("Could not configure the firmware: %s", e)
+
+        if port is not self.port:
+            return  # another port was opened meanwhile
+        self.protocol = protocol
+        self.writer.encode = serial_link.PROTOCOLS[protocol]
+        self.writer.baudrate = port.baudrate
+        self.writer.reset()
+        with self._lock:
+            self._halted_at = None  # no ack will come for a STOP sent on another connection
+        self.writer.port = port
+
+        reader = serial_link.SerialReader(port, notify=lambda: self._drain(reader), on_event=self._record_telemetry)
+        self.reader = reader.start()
+        self.metrics.register("serial read", reader.latency)
+        self._emit({"type": "serial", "port": self.port_name, "protocol": protocol, "version": version})
+
+    def _record_telemetry(self, event):
+        """Reader thread: store readings with their arrival time and run the power watchdog."""
+        if event.kind == "distance":
+            self.distance_history.add(event.received_at, event.value)
+        elif event.kind == "power" and len(event.value) == self.power_history.channels:
+            self.power_history.add(event.received_at, event.value)
+            fault = self.power_monitor.check(event.received_at, event.value)
+            if fault is not None:
+                self.emergency_stop(fault)
+
+    def _drain(self, reader):
+        """Reader thread: queue the firmware lines for the listeners."""
+        for event in reader.drain():
+            if event.kind == "distance":
+                self.current_distance = event.value
+                self._emit({"type": "distance", "value": event.value})
+            elif event.kind == "power":
+                self._emit({"type": "power", "value": list(event.value)})
+            elif event.kind == "info":
+                self._emit({"type": "message", "text": event.text})
+            elif event.kind == "error":
+                self._emit({"type": "error", "text": event.text})
+            elif event.kind == "ack" and event.text.startswith("STOP "):
+                self._sync_held_angles(event.text.split()[1:])
+
+    def _sync_held_angles(self, values):
+        """Take the angles the firmware holds after STOP as the setpoints, so nothing resends the old targets."""
+        try:
+            held = [int(value) for value in values]
+        except ValueError:
+            return
+        if len(held) != len(self.angles):
+            return
+        changed = {}
+        with self._lock:
+            self._halted_at = None
+            for servo, angle in enumerate(held):
+                self.arm_model.set_servo_angle(servo, angle)
+                if self.angles[servo] != angle:
+                    self.angles[servo] = changed[servo] = angle
+        if changed:
+            self._emit({"type": "setpoints", "targets": changed})
+
+    # --- Motion ---
+
+    def set_servos(self, targets):
+        """
+        Move servos to {servo: angle}, clamped to their limits. Called by the UI, scripts, jogging and clients.
+        Between an emergency stop and the firmware's STOP ack, targets are ignored.
+        """
+        changed = {}
+        with self._lock:
+            if self._halted_at is not None:
+                if time.monotonic() - self._halted_at < POWER_STOP_ACK_TIMEOUT:
+                    return
+                logger.warning("No STOP acknowledgement from the firmware, accepting servo targets again")
+                self._halted_at = None
+            for servo, angle in targets.items():
+                servo = int(servo)
+                if servo not in self.angles:
+                    raise ValueError(f"No servo {servo}")
+                angle = int(self.arm_model.clamp_servo(servo, int(float(angle))))
+                self.arm_model.set_servo_angle(servo, angle)
+                if self.connected:
+                    self.writer.submit(servo, angle)
+                if self.angles[servo] != angle:
+                    self.angles[servo] = changed[servo] = angle
+        if changed:
+            self._emit({"type": "setpoints", "targets": changed})
+
+    def jog_press(self, direction):
+        self.jog.press(direction)
+
+    def jog_release(self, direction):
+        self.jog.release(direction)
+
+    def emergency_stop(self, reason):
+        """
+        Abort all motion right away: script, jogging and the firmware's current moves.
+        The setpoints follow the angles the firmware reports holding in its STOP ack; until
+        it arrives set_servos() ignores targets, e.g. from a script or jog tick already running.
+        """
+        halt = self.connected and self.firmware_version >= serial_link.POWER_PROTOCOL_VERSION
+        if halt:
+            with self._lock:
+                self._halted_at = time.monotonic()
+        if self.script is not None and self.script.running:
+            self._set_script_state("stopped")
+            self.script.abort()
+        self.jog.release_all()
+        if halt:
+            self.writer.halt()
+        logger.error("Motion stopped: %s", reason)
+        self._emit({"type": "stopped", "reason": reason})
+
+    # --- Scripts ---
+
+    @property
+    def script_status(self):
+        progress = self.script.progress if self.script is not None else 0.0
+        return {"state": self.script_state, "progress": round(progress, 3)}
+
+    def run_script(self, data):
+        """Compile a JSON command script (the Load Commands format) and run it from the current angles."""
+        with self._lock:
+            start_angles = dict(self.angles)
+        # With firmware slew, moves are timed by the board's trapezoid so they never overlap
+        max_acceleration = SERVO_MAX_ACCELERATION if self.firmware_slew else None
+        trajectory = script_engine.compile_script(data, start_angles, max_acceleration=max_acceleration)
+        self.abort_script()
+
+        def finished(completed):
+            if executor is self.script and self.script_state != "stopped":
+                self._set_script_state("finished" if completed else "aborted")
+
+        executor = script_engine.TrajectoryExecutor(trajectory, send=self.set_servos, on_finished=finished,
+                                                    firmware_slew=self.firmware_slew)
+        self.script = executor
+        self._set_script_state("running")
+        executor.start()
+        logger.info("Running script: %d moves, %.1f s", len(trajectory.segments), trajectory.duration)
+        return trajectory
+
+    def pause_script(self):
+        if self.script is not None and self.script.running and not self.script.paused:
+            self.script.pause()
+            self._set_script_state("paused")
+
+    def resume_script(self):
+        if self.script is not None and self.script.running and self.script.paused:
+            self.script.resume()
+            self._set_script_state("running")
+
+    def abort_script(self):
+        if self.script is not None and self.script.running:
+            self.script.abort()
+
+    def _set_script_state(self, state):
+        self.script_state = state
+        self._emit({"type": "script", **self.script_status})
+
+    # --- Snapshots for clients ---
+
+    def state(self):
+        with self._lock:
+            angles = dict(self.angles)
+        latest_power = self.power_history.latest()
+        return {
+            "port": self.port_name,
+            "connected": self.connected,
+            "protocol": self.protocol,
+            "firmware_version": self.firmware_version,
+            "firmware_slew": self.firmware_slew,
+            "angles": angles,
+            "distance": self.current_distance,
+            "power": None if latest_power is None else latest_power.tolist(),
+            "power_faults": self.power_monitor.faults,
+            "last_fault": self.power_monitor.last_fault,
+            "script": self.script_status,
+            "writer": dict(self.writer.counters),
+            "reader": None if self.reader is None else dict(self.reader.counters),
+            "dropped_events": self.dropped_events,
+        }
+
+    def telemetry(self, seconds):
+        """Distance and power samples of the last `seconds`, as ages in seconds (newest last)."""
+        now = time.perf_counter()
+        result = {}
+        for name, ring in (("distance", self.distance_history), ("power", self.power_history)):
+            timestamps, values = ring.samples(since=now - seconds)
+            result[name] = {"age": (now - timestamps).round(3).tolist(), "values": values.tolist()}
+        return result
+
+    def close(self):
+        self.abort_script()
+        self.jog.stop()
+        self.writer.flush()
+        self.close_port()
+        self.writer.stop(flush=False)
+        with self._events_ready:
+            self._closed = True  # the event thread delivers what is queued, then exits
+            self._events_ready.notify()
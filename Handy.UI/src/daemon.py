@@ -0,0 +1,690 @@
+import argparse
+import asyncio
+import collections
+import functools
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+from globals import (DAEMON_HOST, DAEMON_PORT, DAEMON_URL, DAEMON_CLIENT_QUEUE_SIZE, CAMERA_URL, CAMERA_REPLAY,
+                     SIMULATOR_SERIAL_PORT, DISTANCE_HISTORY_SIZE, POWER_HISTORY_SIZE, POWER_CHANNEL_NAMES,
+                     ARM_SESSIONS)
+import controller
+import logs
+import session
+import telemetry
+import websocket_link
+
+logger = logging.getLogger(__name__)
+
+STREAM_BOUNDARY = "handyframe"
+MAX_BODY_SIZE = 1 << 20
+# Sampled telemetry: a slow client loses the oldest of these, never control events
+TELEMETRY_EVENTS = ("distance", "power", "detections")
+SCRIPT_ACTIONS = ("pause", "resume", "abort")
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class LatestFrame:
+    """Newest annotated JPEG for the /stream viewers (event loop only). Viewers skip what they were too slow for."""
+
+    def __init__(self):
+        self.seq = 0
+        self.jpeg = None
+        self._changed = asyncio.Event()
+
+    def publish(self, jpeg):
+        self.seq += 1
+        self.jpeg = jpeg
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_newer(self, seq):
+        while self.seq <= seq:
+            await self._changed.wait()
+        return self.seq, self.jpeg
+
+
+class Subscriber:
+    """
+    Outgoing messages of one WebSocket client. Telemetry sits in a bounded queue
+    that drops the oldest, setpoints are merged into one message, and control
+    events (script, stop, serial, errors) are never dropped.
+    """
+
+    def __init__(self, queue_size=DAEMON_CLIENT_QUEUE_SIZE):
+        self.telemetry = collections.deque(maxlen=queue_size)
+        self.events = collections.deque()
+        self.setpoints = {}
+        self.dropped = 0
+        self.wake = asyncio.Event()
+
+    def put(self, event, frame):
+        kind = event["type"]
+        if kind == "setpoints":
+            self.setpoints.update(event["targets"])
+        elif kind in TELEMETRY_EVENTS:
+            if len(self.telemetry) == self.telemetry.maxlen:
+                self.dropped += 1
+            self.telemetry.append(frame)
+        else:
+            self.events.append(frame)
+        self.wake.set()
+
+    def put_frame(self, frame):
+        self.events.append(frame)
+        self.wake.set()
+
+    def take(self):
+        frames = list(self.events)
+        self.events.clear()
+        if self.setpoints:
+            frames.append(websocket_link.encode_frame(json.dumps({"type": "setpoints", "targets": self.setpoints})))
+            self.setpoints = {}
+        frames.extend(self.telemetry)
+        self.telemetry.clear()
+        return frames
+
+
+class ArmChannel:
+    """The daemon's side of one ArmSession: the newest /stream frame and the WebSocket subscribers."""
+
+    def __init__(self, session):
+        self.session = session
+        self.name = session.name
+        self.arm = session.arm
+        self.video = session.video
+        self.frames = LatestFrame()
+        self.subscribers = set()
+        self.listener = None
+
+
+class ControlDaemon:
+    """
+    asyncio HTTP/WebSocket server in front of one or more ArmSessions (each an
+    ArmController and a camera). The control path runs on the controllers' own
+    threads, so no client (and no GUI event loop) sits between a command and the
+    serial writer.
+
+      GET  /api/arms                    the arms and the shared detector
+      GET  /api/state                   controller, video and client status
+      GET  /api/telemetry?seconds=10    distance and power samples
+      GET  /stream                      annotated MJPEG, same framing as the ESP32
+      POST /api/servos                  {"<servo>": angle, ...}
+      POST /api/script                  a command script, as loaded from a JSON file
+      POST /api/script/pause|resume|abort
+      POST /api/stop                    {"reason": ...}, emergency stop
+      POST /api/serial                  {"port": "/dev/ttyUSB0"}
+      GET  /ws                          WebSocket: every controller event and the detections as
+                                        JSON; clients send commands like {"type": "servos", "targets": {...}}
+
+    Every path except /api/arms also exists as /arms/<name>/...; without the
+    prefix it addresses the first arm.
+
+    Browsers are kept out: requests with a non-local Origin or a Host other than
+    the daemon's are refused, and POST bodies must be application/json, which a
+    page cannot send cross-site without a CORS preflight.
+
+    Backpressure: a viewer only ever gets the newest frame once its socket has
+    drained, and each WebSocket client has its own bounded telemetry queue.
+    """
+
+    def __init__(self, sessions, inference=None, host=DAEMON_HOST, port=DAEMON_PORT,
+                 queue_size=DAEMON_CLIENT_QUEUE_SIZE):
+        self.sessions = sessions
+        self.inference = inference
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+
+        self.channels = {}
+        self.loop = None
+        self.server = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for name, arm_session in self.sessions.items():
+            channel = self.channels[name] = ArmChannel(arm_session)
+            channel.listener = functools.partial(self._post, channel)
+            channel.arm.add_listener(channel.listener)
+            if channel.video is not None:
+                channel.video.publish = functools.partial(self._publish_frame, channel)
+                channel.video.on_detections = channel.listener
+            arm_session.start()
+        if self.inference is not None:
+            self.inference.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Control daemon listening on http://%s:%d for %s", self.host, self.port,
+                    ", ".join(self.channels))
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def stop(self):
+        if self.inference is not None:
+            self.inference.stop()
+        for channel in self.channels.values():
+            channel.arm.remove_listener(channel.listener)
+            channel.session.stop()
+        if self.server is not None:
+            self.server.close()
+
+    def state(self, channel):
+        state = channel.arm.state()
+        state["name"] = channel.name
+        state["clients"] = len(channel.subscribers)
+        state["dropped"] = sum(subscriber.dropped for subscriber in channel.subscribers)
+        if channel.video is not None:
+            state["video"] = dict(channel.video.status, viewers=channel.video.viewers)
+        return state
+
+    def arms(self):
+        result = {"arms": [{"name": name, "port": channel.arm.port_name, "connected": channel.arm.connected,
+                            "camera": None if channel.video is None else channel.video.status["camera"]}
+                           for name, channel in self.channels.items()]}
+        if self.inference is not None:
+            result["inference"] = {"status": self.inference.status, **self.inference.counters}
+        return result
+
+    # --- Events ---
+
+    def _post(self, channel, event):
+        """Any thread: broadcast an event to the arm's subscribers on the event loop."""
+        try:
+            self.loop.call_soon_threadsafe(self._broadcast, channel, event)
+        except RuntimeError:
+            pass  # the loop is closed, the daemon is shutting down
+
+    def _publish_frame(self, channel, jpeg):
+        try:
+            self.loop.call_soon_threadsafe(channel.frames.publish, jpeg)
+        except RuntimeError:
+            pass
+
+    @staticmethod
+    def _broadcast(channel, event):
+        if not channel.subscribers:
+            return
+        frame = websocket_link.encode_frame(json.dumps(event))
+        for subscriber in channel.subscribers:
+            subscriber.put(event, frame)
+
+    # --- Commands (WebSocket messages and POST requests) ---
+
+    async def command(self, channel, message):
+        arm = channel.arm
+        kind = message.get("type")
+        if kind == "servos":
+            arm.set_servos(message["targets"])
+            return {"angles": arm.state()["angles"]}
+        if kind == "jog":
+            direction = tuple(float(v) for v in message["direction"])
+            if len(direction) != 3:
+                raise ValueError("direction needs x, y and z")
+            if message.get("pressed", True):
+                arm.jog_press(direction)
+            else:
+                arm.jog_release(direction)
+            return {}
+        if kind == "stop":
+            arm.emergency_stop(message.get("reason") or "stop requested by a client")
+            return {}
+        if kind == "script":
+            action = message.get("action", "run")
+            if action == "run":
+                trajectory = arm.run_script(message["data"])
+                return {"moves": len(trajectory.segments), "duration": round(trajectory.duration, 3)}
+            if action in SCRIPT_ACTIONS:
+                getattr(arm, f"{action}_script")()
+                return arm.script_status
+            raise ValueError(f"Unknown script action {action!r}")
+        if kind == "serial":
+            await self.loop.run_in_executor(None, arm.open_port, message["port"])
+            return {"port": message["port"]}
+        raise ValueError(f"Unknown command {kind!r}")
+
+    def _post_command(self, path, data):
+        if path == "/api/servos":
+            return {"type": "servos", "targets": data}
+        if path == "/api/script":
+            return {"type": "script", "action": "run", "data": data}
+        if path.startswith("/api/script/"):
+            return {"type": "script", "action": path.rsplit("/", 1)[1]}
+        if path == "/api/stop":
+            return {"type": "stop", "reason": (data or {}).get("reason")}
+        if path == "/api/serial":
+            return {"type": "serial", "port": (data or {}).get("port")}
+        if path == "/api/jog":
+            return {"type": "jog", **(data or {})}
+        return None
+
+    # --- HTTP ---
+
+    def _route(self, path):
+        """(channel, path within the arm) for '/arms/<name>/...'; other paths go to the first arm."""
+        if path.startswith("/arms/"):
+            _, _, name, rest = (path + "/").split("/", 3)
+            return self.channels.get(name), "/" + rest.rstrip("/")
+        return next(iter(self.channels.values())), path
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            url = urlparse(target)
+            channel, path = self._route(url.path)
+            refused = self._refuse(method, headers)
+
+            if refused:
+                self._reply(writer, *refused)
+            elif channel is None:
+                self._reply(writer, 404, {"error": f"No arm at {url.path}", **self.arms()})
+            elif path == "/ws":
+                await self._websocket(channel, reader, writer, headers)
+            elif path == "/stream" and method == "GET":
+                await self._stream(channel, writer)
+            else:
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_SIZE:
+                    self._reply(writer, 413, {"error": "Body too large"})
+                else:
+                    body = await reader.readexactly(length)
+                    self._reply(writer, *await self._api(channel, method, path, url.query, body))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, websocket_link.ProtocolError, ValueError) as e:
+            logger.debug("Client connection closed: %s", e)
+        finally:
+            writer.close()
+
+    def _refuse(self, method, headers):
+        """
+        (status, error) for requests a web page could have sent: any page in the operator's
+        browser can POST to localhost or open a WebSocket to it, and a DNS rebinding page
+        reaches it under its own host name. None for a request from a local client.
+        """
+        origin = headers.get("origin")
+        if origin is not None and urlparse(origin).hostname not in LOCAL_HOSTS:
+            return 403, {"error": f"Origin {origin} is not allowed"}
+        if not self._local_host(headers.get("host", "")):
+            return 403, {"error": f"Host {headers.get('host')!r} is not this daemon"}
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            return 415, {"error": "POST bodies must be application/json"}
+        return None
+
+    def _local_host(self, host):
+        """A Host header naming the bound address or a loopback name, on the bound port."""
+        try:
+            parsed = urlparse(f"//{host}")
+            port = parsed.port or 80
+        except ValueError:
+            return False
+        if port != self.port:
+            return False
+        if parsed.hostname in LOCAL_HOSTS or parsed.hostname == self.host:
+            return True
+        # Bound to every interface: allow any IP address, never a DNS name that could be rebound
+        if self.host in ("", "0.0.0.0", "::"):
+            try:
+                ipaddress.ip_address(parsed.hostname or "")
+                return True
+            except ValueError:
+                return False
+        return False
+
+    async def _api(self, channel, method, path, query, body):
+        if method == "GET" and path == "/api/arms":
+            return 200, self.arms()
+        if method == "GET" and path == "/api/state":
+            return 200, self.state(channel)
+        if method == "GET" and path == "/api/telemetry":
+            try:
+                seconds = float(parse_qs(query).get("seconds", ["10"])[0])
+            except ValueError:
+                return 400, {"error": "seconds must be a number"}
+            return 200, channel.arm.telemetry(seconds)
+        if method != "POST":
+            return 404, {"error": f"No endpoint {method} {path}"}
+        try:
+            message = self._post_command(path, json.loads(body) if body else None)
+        except ValueError:
+            return 400, {"error": "Body is not JSON"}
+        if message is None:
+            return 404, {"error": f"No endpoint {method} {path}"}
+        try:
+            return 200, await self.command(channel, message)
+        except Exception as e:
+            return 400, {"error": str(e) or type(e).__name__}
+
+    @staticmethod
+    def _reply(writer, status, result):
+        body = json.dumps(result).encode()
+        reason = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 413: "Payload Too Large",
+                  415: "Unsupported Media Type"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+
+    async def _stream(self, channel, writer):
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace;boundary={STREAM_BOUNDARY}\r\n"
+                     f"Cache-Control: no-cache\r\nConnection: close\r\n\r\n".encode())
+        if channel.video is not None:
+            channel.video.viewers += 1
+        try:
+            seq = 0
+            while True:
+                seq, jpeg = await channel.frames.wait_newer(seq)
+                writer.write(f"\r\n--{STREAM_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                             f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg)
+                await writer.drain()  # a slow viewer waits here and then gets the newest frame
+        finally:
+            if channel.video is not None:
+                channel.video.viewers -= 1
+
+    # --- WebSocket ---
+
+    async def _websocket(self, channel, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            self._reply(writer, 400, {"error": "Expected a WebSocket upgrade"})
+            return
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {websocket_link.accept_key(key)}\r\n\r\n").encode())
+
+        subscriber = Subscriber(self.queue_size)
+        subscriber.put_frame(websocket_link.encode_frame(json.dumps({"type": "state", **self.state(channel)})))
+        channel.subscribers.add(subscriber)
+        sender = asyncio.create_task(self._send_loop(subscriber, writer))
+        assembler = websocket_link.MessageAssembler()
+        try:
+            while not sender.done():
+                message = assembler.feed(*await websocket_link.read_frame_async(reader))
+                if message is None:
+                    continue
+                opcode, payload = message
+                if opcode == websocket_link.OP_CLOSE:
+                    subscriber.put_frame(websocket_link.encode_frame(payload[:2], websocket_link.OP_CLOSE))
+                    break
+                if opcode == websocket_link.OP_PING:
+                    subscriber.put_frame(websocket_link.encode_frame(payload, websocket_link.OP_PONG))
+                elif opcode == websocket_link.OP_TEXT:
+                    await self._client_command(channel, subscriber, payload)
+        finally:
+            channel.subscribers.discard(subscriber)
+            await asyncio.sleep(0)  # let the sender flush a close reply
+            sender.cancel()
+
+    async def _client_command(self, channel, subscriber, payload):
+        try:
+            await self.command(channel, json.loads(payload))
+        except Exception as e:
+            # Only the client that sent the command hears about its failure
+            error = {"type": "error", "text": f"Command failed: {str(e) or type(e).__name__}"}
+            subscriber.put_frame(websocket_link.encode_frame(json.dumps(error)))
+
+    @staticmethod
+    async def _send_loop(subscriber, writer):
+        try:
+            while True:
+                await subscriber.wake.wait()
+                subscriber.wake.clear()
+                frames = subscriber.take()
+                writer.write(b"".join(frames))
+                await writer.drain()  # telemetry piles up (and is dropped) while a slow client drains
+        except ConnectionError:
+            pass
+
+
+class DaemonClient:
+    """
+    Client of a running daemon with the ArmController interface the Tk app uses:
+    set_servos, jog_press/jog_release, run_script and the script controls,
+    emergency_stop, open_port, add_listener, angles, current_distance and the
+    telemetry rings. Commands go over one WebSocket; a reader thread receives
+    the events, stamps telemetry with its own perf_counter arrival time and
+    passes the events to the listeners. It reconnects by itself.
+    """
+
+    def __init__(self, url=DAEMON_URL, reconnect_delay=1.0, timeout=5):
+        parsed = urlparse(url)
+        self.url = url.rstrip("/")
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path.rstrip("/")  # "/arms/<name>" on a daemon with several arms
+        self.stream_url = f"{self.url}/stream"
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+
+        self.connected = False
+        self.state = {}
+        self.angles = dict(controller.INITIAL_ANGLES)
+        self.current_distance = 0
+        self.distance_history = telemetry.SampleRing(DISTANCE_HISTORY_SIZE)
+        self.power_history = telemetry.SampleRing(POWER_HISTORY_SIZE, 2 * len(POWER_CHANNEL_NAMES))
+        self.script_status = {"state": "idle", "progress": 0.0}
+
+        self._listeners = []
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="daemon-client", daemon=True)
+        self._thread.start()
+        return self
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    # --- Commands ---
+
+    def set_servos(self, targets):
+        self._send({"type": "servos", "targets": targets})
+
+    def jog_press(self, direction):
+        self._send({"type": "jog", "direction": list(direction), "pressed": True})
+
+    def jog_release(self, direction):
+        self._send({"type": "jog", "direction": list(direction), "pressed": False})
+
+    def emergency_stop(self, reason):
+        self._send({"type": "stop", "reason": reason})
+
+    def run_script(self, data):
+        self._send({"type": "script", "action": "run", "data": data})
+
+    def pause_script(self):
+        self._send({"type": "script", "action": "pause"})
+
+    def resume_script(self):
+        self._send({"type": "script", "action": "resume"})
+
+    def abort_script(self):
+        self._send({"type": "script", "action": "abort"})
+
+    def open_port(self, name):
+        self._send({"type": "serial", "port": name})
+
+    def close(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            sock.close()
+
+    def _send(self, message):
+        frame = websocket_link.encode_frame(json.dumps(message), mask=True)
+        with self._send_lock:
+            if self._sock is None:
+                logger.warning("Not connected to the daemon, dropped a %s command", message["type"])
+                return False
+            try:
+                self._sock.sendall(frame)
+            except OSError as e:
+                logger.warning("Could not send to the daemon: %s", e)
+                return False
+        return True
+
+    # --- Connection ---
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # commands are tiny and latency-bound
+        key = websocket_link.new_key()
+        sock.sendall((f"GET {self.path}/ws HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        rfile = sock.makefile("rb")
+        status = rfile.readline()
+        headers = {}
+        while True:
+            line = rfile.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if b" 101 " not in status or headers.get("sec-websocket-accept") != websocket_link.accept_key(key):
+            sock.close()
+            raise ConnectionError(f"WebSocket handshake failed: {status.decode('latin-1').strip()}")
+        sock.settimeout(None)
+        return sock, rfile
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sock, rfile = self._connect()
+            except OSError as e:
+                logger.warning("Could not connect to the daemon at %s: %s", self.url, e)
+                self._stop.wait(self.reconnect_delay)
+                continue
+            with self._send_lock:
+                self._sock = sock
+            self.connected = True
+            logger.info("Connected to the daemon at %s", self.url)
+            try:
+                self._receive(rfile)
+            except (OSError, websocket_link.ProtocolError) as e:
+                if not self._stop.is_set():
+                    logger.warning("Lost the daemon connection: %s", e)
+            finally:
+                self.connected = False
+                with self._send_lock:
+                    self._sock = None
+                sock.close()
+            self._stop.wait(self.reconnect_delay)
+
+    def _receive(self, rfile):
+        def read_exactly(count):
+            data = rfile.read(count)
+            if len(data) < count:
+                raise ConnectionError("Connection closed by the daemon")
+            return data
+
+        assembler = websocket_link.MessageAssembler()
+        while not self._stop.is_set():
+            message = assembler.feed(*websocket_link.read_frame(read_exactly))
+            if message is None:
+                continue
+            opcode, payload = message
+            if opcode == websocket_link.OP_CLOSE:
+                return
+            if opcode == websocket_link.OP_PING:
+                with self._send_lock:
+                    self._sock.sendall(websocket_link.encode_frame(payload, websocket_link.OP_PONG, mask=True))
+            elif opcode == websocket_link.OP_TEXT:
+                self._handle(json.loads(payload))
+
+    def _handle(self, event):
+        kind = event["type"]
+        now = time.perf_counter()
+        if kind == "state":
+            self.state = event
+            self.angles = {int(servo): angle for servo, angle in event["angles"].items()}
+            self.current_distance = event["distance"]
+            self.script_status = event["script"]
+            # Bring a new or reconnected client up to date through the usual events
+            self._emit({"type": "setpoints", "targets": dict(self.angles)})
+            self._emit({"type": "script", **self.script_status})
+            return
+        if kind == "setpoints":
+            event["targets"] = {int(servo): angle for servo, angle in event["targets"].items()}
+            self.angles.update(event["targets"])
+        elif kind == "distance":
+            self.current_distance = event["value"]
+            self.distance_history.add(now, event["value"])
+        elif kind == "power" and len(event["value"]) == self.power_history.channels:
+            self.power_history.add(now, event["value"])
+        elif kind == "script":
+            self.script_status = {"state": event["state"], "progress": event["progress"]}
+        self._emit(event)
+
+    def _emit(self, event):
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Event listener failed on %s", event["type"])
+
+
+def parse_arm(value):
+    """--arm name=serial[,camera]: the ARM_SESSIONS entry of one arm."""
+    name, _, rest = value.partition("=")
+    serial_port, _, camera_url = rest.partition(",")
+    if not name:
+        raise argparse.ArgumentTypeError("expected name=serial[,camera]")
+    return {"name": name, "serial": serial_port or None, "camera": camera_url or None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless control daemon: serial ports, cameras and detection "
+                                                 "behind a local HTTP/WebSocket API")
+    parser.add_argument("--serial", default=SIMULATOR_SERIAL_PORT, help="serial port of the arm")
+    parser.add_argument("--camera", default=CAMERA_URL, help="camera '/capture' URL (default: discover)")
+    parser.add_argument("--replay", default=CAMERA_REPLAY, help="recording to stream instead of the camera")
+    parser.add_argument("--arm", action="append", type=parse_arm, default=[], metavar="NAME=SERIAL[,CAMERA]",
+                        help="run several arms (repeat per arm); overrides ARM_SESSIONS")
+    parser.add_argument("--no-camera", action="store_true", help="control only, no video")
+    parser.add_argument("--no-detect", action="store_true", help="stream the camera without detection")
+    parser.add_argument("--host", default=DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    args = parser.parse_args()
+
+    logs.setup_logging()
+    configs = args.arm or ARM_SESSIONS
+    if configs:
+        if args.no_camera:
+            configs = [dict(config, camera=None, replay=None) for config in configs]
+        sessions, inference = session.create_sessions(configs, detect=not args.no_detect)
+    else:
+        single = session.ArmSession("arm", args.serial, args.camera, args.replay, video=not args.no_camera,
+                                    detect=not args.no_detect)
+        sessions, inference = {"arm": single}, None
+    daemon = ControlDaemon(sessions, inference, host=args.host, port=args.port)
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from globals import (YOLO_CLASSES, DETECTOR_MODELS, DETECTOR_BACKEND,
+                     DETECTOR_DNN_BACKEND, DETECTOR_DNN_TARGET, DETECTOR_THREADS)
+
+
+CONFIDENCE_THRESHOLD = 0.5
+NMS_THRESHOLD = 0.4
+
+DNN_BACKENDS = {
+    "default": cv2.dnn.DNN_BACKEND_DEFAULT,
+    "opencv": cv2.dnn.DNN_BACKEND_OPENCV,
+    "openvino": cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+    "cuda": cv2.dnn.DNN_BACKEND_CUDA,
+}
+
+DNN_TARGETS = {
+    "cpu": cv2.dnn.DNN_TARGET_CPU,
+    "opencl": cv2.dnn.DNN_TARGET_OPENCL,
+    "opencl_fp16": cv2.dnn.DNN_TARGET_OPENCL_FP16,
+    "cuda": cv2.dnn.DNN_TARGET_CUDA,
+    "cuda_fp16": cv2.dnn.DNN_TARGET_CUDA_FP16,
+}
+
+
+def decode_detections(outputs, width, height, conf_threshold=CONFIDENCE_THRESHOLD):
+    """
+    Vectorized YOLO output decoder.
+
+    outputs: list of (N, 5 + classes) arrays from net.forward(output_layers)
+    Returns (boxes, confidences, class_ids) as lists ready for cv2.dnn.NMSBoxes,
+    with the same integer rounding as the original per-row loop.
+    """
+    kept = []
+    for out in outputs:
+        scores = out[:, 5:]
+        # Cheap row filter first, argmax only on the few rows that survive
+        candidates = out[scores.max(axis=1) > conf_threshold]
+        if len(candidates):
+            kept.append(candidates)
+
+    if not kept:
+        return [], [], []
+    rows = np.concatenate(kept) if len(kept) > 1 else kept[0]
+
+    scores = rows[:, 5:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(rows)), class_ids]
+
+    center_x = (rows[:, 0] * width).astype(np.int32)
+    center_y = (rows[:, 1] * height).astype(np.int32)
+    w = (rows[:, 2] * width).astype(np.int32)
+    h = (rows[:, 3] * height).astype(np.int32)
+    x = (center_x - w / 2).astype(np.int32)
+    y = (center_y - h / 2).astype(np.int32)
+
+    boxes = np.stack((x, y, w, h), axis=1)
+    return boxes.tolist(), confidences.tolist(), class_ids.tolist()
+
+
+def decode_detections_loop(outputs, width, height, conf_threshold=CONFIDENCE_THRESHOLD):
+    """Original per-row decoder, kept as the reference for the benchmark below."""
+    boxes, confidences, class_ids = [], [], []
+    for out in outputs:
+        for detection in out:
+            scores = detection[5:]
+            class_id = np.argmax(scores)
+            confidence = scores[class_id]
+            if confidence > conf_threshold:
+                center_x = int(detection[0] * width)
+                center_y = int(detection[1] * height)
+                w = int(detection[2] * width)
+                h = int(detection[3] * height)
+
+                x = int(center_x - w / 2)
+                y = int(center_y - h / 2)
+
+                boxes.append([x, y, w, h])
+                confidences.append(float(confidence))
+                class_ids.append(int(class_id))
+    return boxes, confidences, class_ids
+
+
+def non_max_suppression(boxes, confidences, conf_threshold=CONFIDENCE_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+    """Return the indices kept by cv2.dnn.NMSBoxes as a flat list."""
+    if not boxes:
+        return []
+    indices = cv2.dnn.NMSBoxes(boxes, confidences, conf_threshold, nms_threshold)
+    return np.asarray(indices).flatten().tolist()
+
+
+def load_class_names(path=YOLO_CLASSES):
+    with open(path, "r") as f:
+        return [line.strip() for line in f.readlines()]
+
+
+class Detector:
+    """
+    Object detector on top of OpenCV DNN.
+
+    output_format describes the layout of the network outputs:
+      "darknet" - YOLOv4 / YOLOv4-tiny rows (cx, cy, w, h normalized, objectness, class scores)
+      "yolov5"  - ONNX rows in input pixels with objectness, class scores not yet multiplied by it
+      "yolov8"  - ONNX (1, 4 + classes, N) in input pixels without objectness
+    """
+
+    def __init__(self, weights, config=None, input_size=416, output_format="darknet",
+                 dnn_backend=DETECTOR_DNN_BACKEND, dnn_target=DETECTOR_DNN_TARGET, threads=DETECTOR_THREADS,
+                 conf_threshold=CONFIDENCE_THRESHOLD, nms_threshold=NMS_THRESHOLD, name=None):
+        self.name = name or os.path.basename(weights)
+        self.input_size = input_size
+        self.output_format = output_format
+        self.conf_threshold = conf_threshold
+        self.nms_threshold = nms_threshold
+
+        if threads:
+            cv2.setNumThreads(threads)
+
+        self.net = cv2.dnn.readNet(weights, config) if config else cv2.dnn.readNet(weights)
+        self.net.setPreferableBackend(DNN_BACKENDS[dnn_backend])
+        self.net.setPreferableTarget(DNN_TARGETS[dnn_target])
+        self.output_layers = self.net.getUnconnectedOutLayersNames()
+
+    def forward(self, image):
+        """Run the network on a BGR image and return its raw outputs."""
+        blob = cv2.dnn.blobFromImage(image, 0.00392, (self.input_size, self.input_size),
+                                     (0, 0, 0), True, crop=False)
+        self.net.setInput(blob)
+        return self.net.forward(self.output_layers)
+
+    def forward_batch(self, images):
+        """Run the network once on several BGR images (any sizes); returns the outputs of each image."""
+        blob = cv2.dnn.blobFromImages(images, 0.00392, (self.input_size, self.input_size),
+                                      (0, 0, 0), True, crop=False)
+        self.net.setInput(blob)
+        return self.split_batch(self.net.forward(self.output_layers), len(images))
+
+    def split_batch(self, outputs, count):
+        """Cut batched outputs into per-image outputs shaped like those of forward()."""
+        if self.output_format == "darknet":
+            # Region layers give (count, rows, C) for a batch, (rows, C) for a single image
+            per_layer = [np.asarray(out).reshape(count, -1, out.shape[-1]) for out in outputs]
+            return [[out[i] for out in per_layer] for i in range(count)]
+        return [[np.asarray(out)[i:i + 1] for out in outputs] for i in range(count)]
+
+    def to_darknet_rows(self, outputs):
+        """Convert raw outputs into darknet-style rows understood by decode_detections."""
+        if self.output_format == "darknet":
+            return outputs
+
+        rows = []
+        for out in outputs:
+            out = np.asarray(out)
+            if self.output_format == "yolov8":
+                out = out.reshape(out.shape[-2], out.shape[-1]).T
+                boxes, scores = out[:, :4], out[:, 4:]
+            else:
+                out = out.reshape(-1, out.shape[-1])
+                boxes, scores = out[:, :4], out[:, 5:] * out[:, 4:5]
+            row = np.empty((len(out), 5 + scores.shape[1]), dtype=np.float32)
+            row[:, :4] = boxes / self.input_size
+            row[:, 4] = 1.0
+            row[:, 5:] = scores
+            rows.append(row)
+        return rows
+
+    def detect(self, image, timings=None):
+        """
+        Return a list of (class_id, confidence, (x, y, w, h)) in image pixels after NMS.
+        If timings is a dict, the seconds spent in "forward", "boxes" and "nms" are stored in it.
+        """
+        started = time.perf_counter()
+        outputs = self.forward(image)
+        forward_done = time.perf_counter()
+        detections = self._decode(outputs, image, timings)
+        if timings is not None:
+            timings["forward"] = forward_done - started
+        return detections
+
+    def detect_batch(self, images, timings=None):
+        """
+        detect() for several images with a single blobFromImages/net.forward call; returns
+        one detection list per image. timings gets the totals for the whole batch.
+        """
+        started = time.perf_counter()
+        outputs = self.forward_batch(images)
+        forward_done = time.perf_counter()
+        decode_timings = {}
+        results = []
+        for image, image_outputs in zip(images, outputs):
+            results.append(self._decode(image_outputs, image, decode_timings))
+            if timings is not None:
+                for name, value in decode_timings.items():
+                    timings[name] = timings.get(name, 0.0) + value
+        if timings is not None:
+            timings["forward"] = forward_done - started
+        return results
+
+    def _decode(self, outputs, image, timings):
+        height, width = image.shape[:2]
+        started = time.perf_counter()
+        boxes, confidences, class_ids = decode_detections(self.to_darknet_rows(outputs), width, height,
+                                                          self.conf_threshold)
+        decode_done = time.perf_counter()
+        keep = non_max_suppression(boxes, confidences, self.conf_threshold, self.nms_threshold)
+        if timings is not None:
+            timings["boxes"] = decode_done - started
+            timings["nms"] = time.perf_counter() - decode_done
+        return [(class_ids[i], confidences[i], tuple(boxes[i])) for i in keep]
+
+
+def create_detector(name=DETECTOR_BACKEND, **overrides):
+    """Build a Detector from one of the DETECTOR_MODELS entries in globals.py."""
+    if name not in DETECTOR_MODELS:
+        raise ValueError(f"Unknown detector backend '{name}'. Choose one from: {list(DETECTOR_MODELS)}")
+    options = dict(DETECTOR_MODELS[name])
+    options.update(overrides)
+    return Detector(name=name, **options)
+
+
+def draw_detections(image, detections, class_names, distance):
+    """Draw the boxes with class, confidence and distance labels onto the BGR image."""
+    for class_id, confidence, (x, y, w, h) in detections:
+        label = f"{class_names[class_id]}: {confidence:.2f}, Dist: {distance} cm"
+
+        # Draw bounding box and label
+        color = (0, 255, 0)
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(image, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+    return image
+
+def synthetic_yolo_outputs(input_size=416, classes=80, hit_rate=0.002, seed=0):
+    """Random arrays shaped like the three YOLOv4 output layers, with a few confident rows."""
+    rng = np.random.default_rng(seed)
+    outputs = []
+    for stride in (8, 16, 32):
+        cells = (input_size // stride) ** 2 * 3
+        out = rng.random((cells, 5 + classes), dtype=np.float32)
+        out[:, 5:] *= 0.3
+        hits = rng.random(cells) < hit_rate
+        out[hits, 5 + rng.integers(0, classes, hits.sum())] = rng.uniform(0.5, 1.0, hits.sum())
+        outputs.append(out)
+    return outputs
+
+
+def benchmark_decoder(frames=50, width=800, height=600):
+    """Compare the vectorized and loop decoders on synthetic outputs; returns ms per frame."""
+    frame_outputs = [synthetic_yolo_outputs(seed=i) for i in range(frames)]
+
+    for outputs in frame_outputs:
+        fast = decode_detections(outputs, width, height)
+        slow = decode_detections_loop(outputs, width, height)
+        assert fast == slow, "vectorized decoder disagrees with the reference loop"
+        assert non_max_suppression(*fast[:2]) == non_max_suppression(*slow[:2])
+
+    timings = {}
+    for name, decode in (("loop", decode_detections_loop), ("vectorized", decode_detections)):
+        started = time.perf_counter()
+        for outputs in frame_outputs:
+            decode(outputs, width, height)
+        timings[name] = (time.perf_counter() - started) / frames * 1000
+    return timings
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def average_precision(reference, candidate, iou_threshold=0.5):
+    """
+    mAP proxy: AP@0.5 of candidate detections, treating the reference backend's
+    detections as ground truth. Both arguments are per-frame lists from Detector.detect().
+    """
+    classes = {d[0] for frame in reference for d in frame}
+    if not classes:
+        return 1.0 if not any(candidate) else 0.0
+
+    ap_per_class = []
+    for class_id in classes:
+        truth = [[d[2] for d in frame if d[0] == class_id] for frame in reference]
+        total = sum(len(t) for t in truth)
+        predictions = sorted(
+            ((d[1], index, d[2]) for index, frame in enumerate(candidate) for d in frame if d[0] == class_id),
+            reverse=True
+        )
+        matched = [[False] * len(t) for t in truth]
+        tp = fp = 0
+        precisions, recalls = [], []
+        for _, index, box in predictions:
+            ious = [box_iou(box, t) for t in truth[index]]
+            best = int(np.argmax(ious)) if ious else -1
+            if best >= 0 and ious[best] >= iou_threshold and not matched[index][best]:
+                matched[index][best] = True
+                tp += 1
+            else:
+                fp += 1
+            precisions.append(tp / (tp + fp))
+            recalls.append(tp / total)
+
+        # All-point interpolated area under the precision/recall curve
+        ap, previous_recall = 0.0, 0.0
+        for i, recall in enumerate(recalls):
+            ap += (recall - previous_recall) * max(precisions[i:])
+            previous_recall = recall
+        ap_per_class.append(ap)
+    return sum(ap_per_class) / len(ap_per_class)
+
+
+def load_frames(path, limit=None):
+    """Load a recorded frame set: a directory of JPEG/PNG files, sorted by name."""
+    files = sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.png")))
+    frames = [cv2.imread(f) for f in files[:limit]]
+    return [frame for frame in frames if frame is not None]
+
+
+def benchmark_backends(frames, backends, warmup=2, **overrides):
+    """
+    Run every backend over the same frames. The first backend is the reference
+    for the mAP proxy. Returns {name: {"fps": ..., "map_proxy": ...}}.
+    """
+    results, reference = {}, None
+    for name in backends:
+        model = create_detector(name, **overrides)
+        for frame in frames[:warmup]:
+            model.detect(frame)
+
+        started = time.perf_counter()
+        detections = [model.detect(frame) for frame in frames]
+        elapsed = time.perf_counter() - started
+
+        if reference is None:
+            reference = detections
+        results[name] = {
+            "fps": len(frames) / elapsed if elapsed > 0 else 0.0,
+            "map_proxy": average_precision(reference, detections),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detector benchmarks")
+    parser.add_argument("--frames", help="directory with recorded frames to compare backends on")
+    parser.add_argument("--backends", nargs="+", default=list(DETECTOR_MODELS),
+                        help="backends to compare, the first one is the reference")
+    parser.add_argument("--limit", type=int, default=None, help="use at most this many frames")
+    parser.add_argument("--input-size", type=int, help="override the network input size")
+    parser.add_argument("--dnn-backend", choices=DNN_BACKENDS, default=DETECTOR_DNN_BACKEND)
+    parser.add_argument("--dnn-target", choices=DNN_TARGETS, default=DETECTOR_DNN_TARGET)
+    parser.add_argument("--threads", type=int, default=DETECTOR_THREADS)
+    args = parser.parse_args()
+
+    if args.frames is None:
+        results = benchmark_decoder()
+        rows = sum(len(out) for out in synthetic_yolo_outputs())
+        print(f"YOLOv4 416x416 post-processing, {rows} rows per frame, identical boxes: yes")
+        for name, ms in results.items():
+            print(f"  {name:>10}: {ms:.2f} ms/frame")
+        print(f"  speedup: {results['loop'] / results['vectorized']:.1f}x")
+    else:
+        overrides = {"dnn_backend": args.dnn_backend, "dnn_target": args.dnn_target, "threads": args.threads}
+        if args.input_size:
+            overrides["input_size"] = args.input_size
+        frame_set = load_frames(args.frames, args.limit)
+        print(f"{len(frame_set)} frames from {args.frames}, reference backend: {args.backends[0]}")
+        for name, result in benchmark_backends(frame_set, args.backends, **overrides).items():
+            print(f"  {name:>12}: {result['fps']:6.1f} FPS, mAP proxy {result['map_proxy']:.3f}")
@@ -0,0 +1,199 @@
+import argparse
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from globals import DISPLAY_BUFFERS
+from camera import decode_jpeg
+
+
+class RgbBufferRing:
+    """
+    Preallocated RGB frames for the display, reused round-robin.
+
+    convert() writes the BGR->RGBA conversion straight into the next buffer and
+    returns a PIL image that shares its memory, so no per-frame array or pixel
+    copy is made. The two buffers written last (the frame waiting for the
+    UI and the one it may just have taken) and the one held by the UI are never
+    overwritten, so four buffers always leave one to write.
+    """
+
+    def __init__(self, count=DISPLAY_BUFFERS):
+        if count < 4:
+            raise ValueError("RgbBufferRing needs at least 4 buffers")
+        self._buffers = [None] * count
+        self._images = [None] * count
+        self._next = 0
+        self._last = None
+        self._previous = None
+        self._held = None  # buffer being copied into the Tk photo
+        self._lock = threading.Lock()
+        self.allocations = 0
+
+    def convert(self, bgr):
+        with self._lock:
+            protected = (self._last, self._previous, self._held)
+            index = self._next
+            while index in protected:
+                index = (index + 1) % len(self._buffers)
+            self._next = (index + 1) % len(self._buffers)
+
+        height, width = bgr.shape[:2]
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape[:2] != (height, width):
+            buffer = self._buffers[index] = np.empty((height, width, 4), dtype=np.uint8)
+            self.allocations += 1
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGBA, dst=buffer)
+        # A new PIL wrapper per frame (no pixel copy) tells hold() which frame the UI has.
+        # PIL only shares memory for 4-byte modes; an "RGB" frombuffer() would be a copy.
+        image = Image.frombuffer("RGBA", (width, height), buffer, "raw", "RGBA", 0, 1)
+        image.info["buffer_ring"] = self
+        with self._lock:
+            self._images[index] = image
+            self._previous, self._last = self._last, index
+        return image
+
+    def hold(self, image):
+        """
+        UI thread: keep the image's buffer from being overwritten until release().
+        False if it is a ring frame that is already being overwritten (skip it, a
+        newer frame is on its way); images not from the ring are always fine.
+        """
+        with self._lock:
+            for index in (self._last, self._previous):
+                if index is not None and self._images[index] is image:
+                    self._held = index
+                    return True
+            return image.info.get("buffer_ring") is not self
+
+    def release(self):
+        with self._lock:
+            self._held = None
+
+
+class PhotoDisplay:
+    """
+    One persistent Tk photo image for a label, updated in place with paste().
+    A new photo is only created when the frame size changes. Call from the Tk thread.
+    """
+
+    def __init__(self, label, ring=None):
+        self.label = label
+        self.ring = ring
+        self.photo = None
+        self.size = None
+        self.shown = None
+        self.photo_allocations = 0
+
+    def show(self, image):
+        from PIL import ImageTk  # tkinter stays optional for the benchmark below
+
+        if self.ring is not None and not self.ring.hold(image):
+            return
+        try:
+            if self.photo is None or image.size != self.size:
+                self.photo = ImageTk.PhotoImage(image=image)
+                self.size = image.size
+                self.photo_allocations += 1
+                self.label.imgtk = self.photo
+                self.label.configure(image=self.photo)
+            else:
+                self.photo.paste(image)
+        finally:
+            if self.ring is not None:
+                self.ring.release()
+        self.shown = image
+
+    def show_static(self, image):
+        """Show an image that never changes (the placeholder); repeated calls cost nothing."""
+        if image is not self.shown:
+            self.show(image)
+
+
+def _synthetic_jpegs(count=30, size=(640, 480)):
+    rng = np.random.default_rng(0)
+    width, height = size
+    return [cv2.imencode(".jpg", cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8),
+                                                   (15, 15), 0))[1].tobytes() for _ in range(count)]
+
+
+def _previous_path(jpeg):
+    # Display path before the buffer reuse: every step allocates a new copy
+    image = cv2.imdecode(np.array(bytearray(jpeg), dtype=np.uint8), cv2.IMREAD_COLOR)
+    return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+
+def benchmark_display(jpegs, rounds=3, photo=None):
+    """
+    Per-frame time and transient Python-tracked memory of the previous and the
+    buffer-reusing display path. photo(name, image) is an optional Tk step applied
+    to both (PhotoImage per frame before, paste into one photo after).
+    """
+    ring = RgbBufferRing()
+    paths = {
+        "previous": _previous_path,
+        "reused buffers": lambda jpeg: ring.convert(decode_jpeg(jpeg)),
+    }
+    results = {}
+    for name, path in paths.items():
+        path(jpegs[0])
+        tracemalloc.start()
+        churn = 0
+        frames = 0
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for jpeg in jpegs:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                image = path(jpeg)
+                if photo is not None:
+                    photo(name, image)
+                churn += tracemalloc.get_traced_memory()[1] - before
+                frames += 1
+        elapsed = time.perf_counter() - started
+        tracemalloc.stop()
+        results[name] = {"ms": elapsed / frames * 1000, "churn_kb": churn / frames / 1024}
+    results["reused buffers"]["buffer_allocations"] = ring.allocations
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Display path allocation benchmark")
+    parser.add_argument("--recording", help="recording to take JPEGs from; synthetic 640x480 frames otherwise")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--tk", action="store_true", help="include the Tk photo update (needs a display)")
+    args = parser.parse_args()
+
+    if args.recording:
+        from recorder import Recording
+        recording = Recording(args.recording)
+        jpeg_set = [recording.jpeg(i).tobytes() for i in range(min(60, len(recording)))]
+    else:
+        jpeg_set = _synthetic_jpegs()
+
+    if args.tk:
+        import tkinter as tk
+        from PIL import ImageTk
+
+        root = tk.Tk()
+        label = tk.Label(root)
+        label.pack()
+        display = PhotoDisplay(label)
+
+        def tk_step(name, image):
+            if name == "previous":
+                label.imgtk = ImageTk.PhotoImage(image=image)
+                label.configure(image=label.imgtk)
+            else:
+                display.show(image)
+            root.update_idletasks()
+    else:
+        tk_step = None
+
+    for name, result in benchmark_display(jpeg_set, args.rounds, tk_step).items():
+        extra = f", {result['buffer_allocations']} buffer allocations" if "buffer_allocations" in result else ""
+        print(f"{name:>15}: {result['ms']:.2f} ms/frame, {result['churn_kb']:.0f} KB transient per frame{extra}")
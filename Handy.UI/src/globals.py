@@ -5,5 +5,142 @@ YOLO_CONFIG = "../cam.ai/yolov4.cfg"
 YOLO_WEIGHTS = "../cam.ai/yolov4.weights"
 YOLO_CLASSES = "../cam.ai/coco.names"
 
+# Detector backends, see detector.create_detector()
+DETECTOR_MODELS = {
+    "yolov4": {"weights": YOLO_WEIGHTS, "config": YOLO_CONFIG, "input_size": 416},
+    "yolov4-tiny": {"weights": "../cam.ai/yolov4-tiny.weights", "config": "../cam.ai/yolov4-tiny.cfg",
+                    "input_size": 416},
+    "onnx": {"weights": "../cam.ai/model.onnx", "input_size": 640, "output_format": "yolov8"},
+}
+DETECTOR_BACKEND = "yolov4"
+DETECTOR_DNN_BACKEND = "opencv"  # opencv, openvino, cuda
+DETECTOR_DNN_TARGET = "cpu"  # cpu, opencl, opencl_fp16, cuda, cuda_fp16
+DETECTOR_THREADS = 0  # 0 keeps the OpenCV default
+
+# Motion gating (tracking.py): the network only runs when the scene changed
+DETECTOR_MOTION_GATING = True
+DETECTOR_MOTION_THRESHOLD = 0.05  # fraction of the image changed since the last detection
+DETECTOR_STILL_THRESHOLD = 0.002  # below this boxes are reused without tracking
+DETECTOR_MAX_SKIP = 15  # run the network at least every N frames
+DETECTOR_TRACKER = "auto"  # auto, mosse, kcf, csrt, mil, none
+
+# Process-pool inference (inference_pool.py); 0 keeps detection in the UI process.
+# Needs the fork start method (Linux, macOS); motion gating is not used in this mode.
+DETECTOR_WORKERS = 0
+DETECTOR_POOL_MAX_FRAME = (1600, 1200)  # largest frame (w, h) a shared-memory slot can hold
+DETECTOR_POOL_TASK_TIMEOUT = 5.0  # s without a result before a frame is skipped (its worker died or hung)
+
+# Several cameras (ARM_SESSIONS) share one detector: frames are batched into one forward pass
+DETECTOR_BATCH_WAIT = 0.07  # s a batch waits for the other cameras, about one frame at CAMERA_TARGET_FPS
+
+# ESP32-CAM stream server (app_httpd.cpp starts it on the control port + 1)
+CAMERA_STREAM_PORT = 81
+CAMERA_STREAM_CHUNK_SIZE = 16384
+
+# ESP32-CAM discovery
+CAMERA_CACHE_FILE = "../.camera_cache.json"  # last camera found, tried first on the next launch
+CAMERA_PROBE_TIMEOUT = 1.0  # per-host deadline, seconds
+CAMERA_DISCOVERY_WORKERS = 64
+CAMERA_SUBNET_SWEEP = False  # opt in: probe every host of the local /24 when the ARP cache has no camera
+
+# ESP32-CAM framesize/quality auto-tuning (camera_tuning.py). Starts at the smallest framesize
+# that fits the detector input; quality is the ESP32 JPEG scale, 0 (best) .. 63 (worst)
+CAMERA_AUTO_TUNE = True  # False leaves the framesize and quality the camera booted with
+CAMERA_TARGET_FPS = 15
+CAMERA_QUALITY_BEST = 10
+CAMERA_QUALITY_WORST = 40
+CAMERA_QUALITY_STEP = 6
+CAMERA_MIN_FRAMESIZE = "QVGA"  # never go below this, even when the link cannot keep up
+CAMERA_DECODE_BUDGET = 0.25  # share of a frame period JPEG decoding may take
+CAMERA_TUNE_INTERVAL = 2.0  # seconds per measurement
+CAMERA_TUNE_HYSTERESIS = 0.15
+CAMERA_TUNE_UP_INTERVALS = 3  # good intervals in a row before stepping back up
+
+# Serial protocol: "binary" negotiates binary frames and SERIAL_FAST_BAUDRATE with the firmware
+# and falls back to text for older firmware; "text" always uses "<servo> <angle>" lines at 9600
+SERIAL_PROTOCOL = "binary"
+SERIAL_FAST_BAUDRATE = 115200
+
+# Serial reader: parsed firmware lines waiting for the UI (oldest dropped when full)
+SERIAL_EVENT_QUEUE_SIZE = 256
+
+# Servo angle limits enforced by AllInOne.ino (servo 5 is the gripper)
+SERVO_LIMITS = [(0, 180), (0, 180), (0, 180), (0, 180), (0, 180), (17, 90)]
+
+# Arm geometry shared by arm.ArmModel and kinematics.py
+ARM_BASE_HEIGHT = 12  # см - высота основания
+ARM_LINK_LENGTHS = [7, 12, 26]  # длины звеньев
+ARM_SERVO_MAPPING = [1, 2, 4]  # servos driving the shoulder, elbow and wrist joints
+
+# Cartesian jogging with the arrow keys
+JOG_RATE_HZ = 30
+JOG_SPEED = 5.0  # cm/s while a key is held
+JOG_DAMPING = 2.0  # damped least-squares lambda, cm
+JOG_POSTURE_GAIN = 0.02  # null-space pull towards mid-range joint angles, per tick
+JOG_KEY_RELEASE_GRACE = 0.08  # s, hides the release/press gap of keyboard auto-repeat
+
+# Script engine: velocity limits in degrees per second (MG995 joints are slower under load)
+SERVO_MAX_VELOCITY = [90, 90, 90, 120, 120, 120]
+SCRIPT_CONTROL_RATE_HZ = 50
+
+# Firmware slew (AllInOne.ino protocol 3): the board moves each servo to its target at
+# SERVO_MAX_VELOCITY / SERVO_MAX_ACCELERATION, so scripts send one command per move
+SERVO_FIRMWARE_SLEW = True
+SERVO_MAX_ACCELERATION = [360, 360, 360, 480, 480, 480]  # deg/s^2
+
+# HC-SR04 ranging rate set on firmware protocol 4 (max 25 Hz), and distance readings kept for frame tagging
+ULTRASONIC_RATE_HZ = 20
+DISTANCE_HISTORY_SIZE = 256
+
+# INA3221 power telemetry (firmware protocol 5, telemetry.py). Channels in the order wired to the
+# INA3221; limits are per channel and should be tuned to the wiring. A fault stops all motion.
+POWER_CHANNEL_NAMES = ["MG995", "MG90s", "Logic"]
+POWER_RATE_HZ = 50  # one sample per script control tick; 5 Hz at baud rates below 57600
+POWER_HISTORY_SIZE = 1024  # samples kept for the plot, ~20 s at 50 Hz
+POWER_OVERCURRENT_MA = [3000, 1500, 1000]  # any single sample above this aborts
+POWER_STALL_MA = [1800, 900, 800]  # sustained for POWER_STALL_TIME counts as a stall
+POWER_STALL_TIME = 0.3  # s
+POWER_MIN_BUS_MV = 4500  # supply sag that precedes a brown-out of the Uno
+POWER_STOP_ACK_TIMEOUT = 1.0  # s new targets are refused after STOP while waiting for the firmware's ack
+POWER_PLOT_SECONDS = 10
+POWER_PLOT_INTERVAL_MS = 200
+
+# Servo command writer: maximum flushes per second (each flush sends all changed servos at once)
+SERVO_WRITE_RATE_HZ = 20
+
+# Control daemon (daemon.py): owns the serial port and camera and serves them over HTTP/WebSocket.
+# With DAEMON_URL set the Tk app is one more client of a running daemon instead of opening the hardware.
+DAEMON_HOST = "127.0.0.1"  # the API has no authentication, keep it on the local machine
+DAEMON_PORT = 8765
+DAEMON_URL = None  # e.g. "http://127.0.0.1:8765"
+DAEMON_CLIENT_QUEUE_SIZE = 256  # telemetry messages waiting per WebSocket client (oldest dropped)
+DAEMON_STREAM_QUALITY = 80  # JPEG quality of the annotated /stream feed
+
+# Arms run by one daemon (session.py), each with its own serial port and camera '/capture' URL, e.g.
+# [{"name": "left", "serial": "/dev/ttyUSB0", "camera": "http://192.168.1.20/capture"}, ...].
+# Empty runs a single arm with the settings above. A UI attaches to one arm with
+# DAEMON_URL = "http://127.0.0.1:8765/arms/<name>".
+ARM_SESSIONS = []
+
+# Display: RGB frame buffers reused by the render path (display.py)
+DISPLAY_BUFFERS = 4  # at least 4: two newest frames and the one being shown stay untouched
+
+# Camera recordings (recorder.py)
+RECORDINGS_FOLDER = "../recordings"
+CAMERA_REPLAY = None  # path of a recording to replay instead of the live camera
+
+# Hardware-free simulator (simulator.py). Point the UI at it with CAMERA_URL and
+# SIMULATOR_SERIAL_PORT, and set CAMERA_STREAM_PORT to SIMULATOR_STREAM_PORT.
+CAMERA_URL = None  # fixed '/capture' URL, skips camera discovery
+SIMULATOR_SERIAL_PORT = None  # pty printed by "simulator.py run", added to the port list
+SIMULATOR_HTTP_PORT = 8080
+SIMULATOR_STREAM_PORT = 8081
+
+# Instrumentation (metrics.py, logs.py)
+METRICS_WINDOW = 512  # samples kept per stage
+METRICS_OVERLAY_INTERVAL_MS = 500
+LOG_LEVEL = "INFO"  # DEBUG also logs every serial write and distance reading
+LOG_RATE_LIMIT = 5  # identical messages let through per LOG_RATE_WINDOW seconds
+LOG_RATE_WINDOW = 10.0
 
 ICON_FOLDER = "../icons"
\ No newline at end of file
@@ -1,12 +1,20 @@
+import ipaddress
+import json
+import logging
 import os
 import re
+import socket
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
 
 import requests
 from PIL import ImageTk
 
-from globals import sliders, ICON_FOLDER
+from globals import (sliders, ICON_FOLDER, CAMERA_CACHE_FILE, CAMERA_PROBE_TIMEOUT,
+                     CAMERA_DISCOVERY_WORKERS, CAMERA_SUBNET_SWEEP)
+
+logger = logging.getLogger(__name__)
 
 
 def increase_slider(slider_number) -> None:
@@ -25,13 +33,17 @@ def load_icon(icon_name):
         img = Image.open(icon_path).resize((24, 24), Image.Resampling.LANCZOS)
         return ImageTk.PhotoImage(img)
     except Exception as e:
-        print(f"Не удалось загрузить иконку {icon_name}: {e}")
+        logger.warning("Не удалось загрузить иконку %s: %s", icon_name, e)
         return None
 
 
 def get_connected_devices():
     devices = []
-    result = subprocess.run(['arp', '-a'], stdout=subprocess.PIPE, text=True)
+    try:
+        result = subprocess.run(['arp', '-a'], stdout=subprocess.PIPE, text=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("Could not read ARP cache: %s", e)
+        return devices
 
     pattern = r"\((.*?)\) at (.*?) on"
     matches = re.findall(pattern, result.stdout)
@@ -51,63 +63,100 @@ def is_esp32(mac_address):
     return False
 
 
-def check_esp32_camera(ip):
-    url = f"http://{ip}/capture"
+def check_esp32_camera(ip, timeout=CAMERA_PROBE_TIMEOUT):
+    """Check for the ESP32-CAM web server via its /status endpoint (cheaper than a /capture)."""
+    url = f"http://{ip}/status"
     try:
-        response = requests.get(url, timeout=5)
+        response = requests.get(url, timeout=timeout)
         if response.status_code == 200:
-            return True
-    except requests.RequestException:
+            return "framesize" in response.json()
+    except (requests.RequestException, ValueError):
         pass
     return False
 
 
-def set_resolution(url, resolution):
-    """
-    Установить разрешение на ESP32-CAM через HTTP.
+def load_cached_camera():
+    """Return the (ip, mac) of the last camera found, or None."""
+    try:
+        with open(CAMERA_CACHE_FILE, "r") as f:
+            cached = json.load(f)
+        return cached["ip"], cached.get("mac")
+    except (OSError, ValueError, KeyError):
+        return None
 
-    :param url: URL веб-сервера ESP32-CAM (например, "http://192.168.1.100")
-    :param resolution: Код разрешения (например, 9 = UXGA 1600x1200)
-    """
-    resolutions = {
-        "UXGA": 10,  # 1600x1200
-        "SXGA": 9,  # 1280x1024
-        "XGA": 8,  # 1024x768
-        "SVGA": 7,  # 800x600
-        "VGA": 6,  # 640x480
-        "CIF": 5,  # 400x296
-        "QVGA": 4,  # 320x240
-        "HQVGA": 3,  # 240x176
-        "QQVGA": 2  # 160x120
-    }
-
-    if resolution not in resolutions:
-        print("Invalid resolution. Choose one from:", resolutions.keys())
-        return
-
-    # URL для настройки разрешения
-    control_url = f"{url}/control?var=framesize&val={resolutions[resolution]}"
 
+def save_cached_camera(ip, mac=None):
     try:
-        response = requests.get(control_url)
-        if response.status_code == 200:
-            print(f"Resolution set to {resolution}.")
-        else:
-            print(f"Failed to set resolution. Status code: {response.status_code}")
-    except Exception as e:
-        print(f"Error: {e}")
+        with open(CAMERA_CACHE_FILE, "w") as f:
+            json.dump({"ip": ip, "mac": mac}, f)
+    except OSError as e:
+        logger.warning("Could not cache camera address: %s", e)
 
 
-def find_esp32_camera():
+def get_local_subnets():
+    """Guess the /24 networks to sweep from the local address and the ARP cache."""
+    subnets = set()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("10.255.255.255", 1))  # no packets are sent for UDP connect
+            subnets.add(ipaddress.ip_network(f"{s.getsockname()[0]}/24", strict=False))
+    except OSError:
+        pass
+    for ip, _ in get_connected_devices():
+        try:
+            subnets.add(ipaddress.ip_network(f"{ip}/24", strict=False))
+        except ValueError:
+            pass
+    return [net for net in subnets if not net.is_loopback]
+
+
+def probe_cameras(ips, timeout=CAMERA_PROBE_TIMEOUT, workers=CAMERA_DISCOVERY_WORKERS):
+    """Probe IPs concurrently and return the first one that answers as an ESP32 camera."""
+    ips = list(dict.fromkeys(ips))
+    if not ips:
+        return None
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(ips)))
+    try:
+        futures = {pool.submit(check_esp32_camera, ip, timeout): ip for ip in ips}
+        for future in as_completed(futures):
+            if future.result():
+                return futures[future]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return None
+
+
+def find_esp32_camera(subnet_sweep=CAMERA_SUBNET_SWEEP):
+    """
+    Find the ESP32 camera: try the cached address first, then ESP32 MACs from the
+    ARP cache in parallel, then (optionally) every host on the local /24 networks.
+    """
     devices = get_connected_devices()
-    camera_url = "Camera not found"
-    for ip, mac in devices:
-        if is_esp32(mac):
-            print(f"Found ESP32 device with IP: {ip} and MAC: {mac}")
-            set_resolution(f'http://{ip}', "SVGA")
-
-            if check_esp32_camera(ip):
-                camera_url = f"http://{ip}/capture"
-                print(f"ESP32 Camera found at: {camera_url}")
+    macs = dict(devices)
+    ip = None
+
+    cached = load_cached_camera()
+    if cached and check_esp32_camera(cached[0]):
+        ip = cached[0]
+        logger.info("Cached ESP32 camera is still at: %s", ip)
+
+    if ip is None:
+        candidates = [ip for ip, mac in devices if is_esp32(mac)]
+        for candidate in candidates:
+            logger.info("Found ESP32 device with IP: %s and MAC: %s", candidate, macs[candidate])
+        ip = probe_cameras(candidates)
+
+    if ip is None and subnet_sweep:
+        logger.info("ESP32 camera not in ARP cache, sweeping local subnets")
+        hosts = [str(host) for net in get_local_subnets() for host in net.hosts()]
+        ip = probe_cameras(hosts)
+
+    if ip is None:
+        if not subnet_sweep:
+            logger.info("ESP32 camera not found; set CAMERA_URL, or CAMERA_SUBNET_SWEEP = True to scan the local network")
+        return "Camera not found"
+
+    save_cached_camera(ip, macs.get(ip))
+    camera_url = f"http://{ip}/capture"
+    logger.info("ESP32 Camera found at: %s", camera_url)
     return camera_url
-
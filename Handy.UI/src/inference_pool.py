@@ -0,0 +1,294 @@
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from globals import DETECTOR_BACKEND, DETECTOR_WORKERS, DETECTOR_POOL_MAX_FRAME, DETECTOR_POOL_TASK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def _worker(backend, overrides, slot_names, tasks, results):
+    """Worker process: load the network once, then detect on frames found in shared memory."""
+    import detector
+
+    buffers = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    try:
+        model = detector.create_detector(backend, **overrides)
+        results.put(("ready", os.getpid()))
+    except Exception as e:
+        results.put(("failed", str(e)))
+        return
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        ticket, slot, shape = task
+        image = np.ndarray(shape, dtype=np.uint8, buffer=buffers[slot].buf)
+        timings = {}
+        try:
+            detections = [(int(c), float(conf), tuple(int(v) for v in box))
+                          for c, conf, box in model.detect(image, timings)]
+        except Exception as e:
+            logger.warning("Detection failed in worker %d: %s", os.getpid(), e)
+            detections = []
+        del image  # release the view before the slot is reused
+        results.put((ticket, slot, detections, timings))
+
+    for buffer in buffers:
+        buffer.close()
+
+
+class InferencePool:
+    """
+    Detector running in worker processes, several frames in flight.
+
+    Frames are copied into one of `slots` shared-memory buffers and only the
+    slot number travels through the task queue, so image arrays are never
+    pickled. Every worker loads the network once. get() hands results back in
+    submission order, whatever order the workers finish in; a frame without a
+    result after task_timeout (its worker died or hung) is skipped so it cannot
+    hold back the frames after it. error is set when no worker can detect:
+    every worker failed to load the model, or every worker exited.
+
+    The default start method is fork (created before the UI starts threads),
+    because spawn re-imports main.py in every worker.
+    """
+
+    def __init__(self, workers=DETECTOR_WORKERS, backend=DETECTOR_BACKEND, max_frame=DETECTOR_POOL_MAX_FRAME,
+                 slots=None, threads_per_worker=None, start_method=None, task_timeout=DETECTOR_POOL_TASK_TIMEOUT,
+                 **overrides):
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.backend = backend
+        self.slot_bytes = max_frame[0] * max_frame[1] * 3
+        self.slots = slots or workers + 1  # one frame waiting per pool keeps latency low
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.overrides = dict(overrides, threads=threads)
+        self.context = multiprocessing.get_context(start_method or ("fork" if self.fork_available() else "spawn"))
+
+        self.counters = {"submitted": 0, "completed": 0, "no_free_slot": 0, "max_in_flight": 0, "expired": 0}
+        self.ready = threading.Event()  # set once a worker loaded the model, or every worker failed to
+        self.loaded = 0
+        self.failed = 0
+        self.error = None
+
+        self._buffers = []
+        self._processes = []
+        self._free = []
+        self._tickets = itertools.count()
+        self._next_ticket = 0
+        self._tags = {}
+        self._submitted_at = {}
+        self._finished = {}  # ticket -> result, waiting for earlier tickets
+        self._in_order = []
+        self._cond = threading.Condition()
+        self._collector = None
+        self._tasks = None
+        self._results = None
+
+    @staticmethod
+    def fork_available():
+        return "fork" in multiprocessing.get_all_start_methods()
+
+    @property
+    def in_flight(self):
+        with self._cond:
+            return len(self._tags)
+
+    def start(self):
+        self._buffers = [shared_memory.SharedMemory(create=True, size=self.slot_bytes) for _ in range(self.slots)]
+        self._free = list(range(self.slots))
+        self._tasks = self.context.Queue()
+        self._results = self.context.Queue()
+        names = [buffer.name for buffer in self._buffers]
+        for _ in range(self.workers):
+            process = self.context.Process(target=_worker, name="inference-worker", daemon=True,
+                                           args=(self.backend, self.overrides, names, self._tasks, self._results))
+            process.start()
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self._collect, name="inference-collector", daemon=True)
+        self._collector.start()
+        return self
+
+    def stop(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        for buffer in self._buffers:
+            buffer.close()
+            buffer.unlink()
+        self._buffers = []
+        with self._cond:
+            self._cond.notify_all()
+
+    def submit(self, image, tag=None, timeout=None):
+        """
+        Queue a BGR frame; returns its ticket, or None when no slot frees up in
+        time (the caller drops the frame, the newest one wins).
+        """
+        if image.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {image.shape} is larger than DETECTOR_POOL_MAX_FRAME")
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free, timeout):
+                self.counters["no_free_slot"] += 1
+                return None
+            slot = self._free.pop()
+            ticket = next(self._tickets)
+            self._tags[ticket] = tag
+            self._submitted_at[ticket] = time.perf_counter()
+            self.counters["submitted"] += 1
+            self.counters["max_in_flight"] = max(self.counters["max_in_flight"], len(self._tags))
+
+        np.ndarray(image.shape, dtype=np.uint8, buffer=self._buffers[slot].buf)[...] = image
+        self._tasks.put((ticket, slot, image.shape))
+        return ticket
+
+    def get(self, timeout=None):
+        """Next result in submission order as (tag, detections, timings), or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_order, timeout):
+                return None
+            return self._in_order.pop(0)
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                self._expire()
+                continue
+            if message is None:
+                return
+            if message[0] == "ready":
+                self.loaded += 1
+                self.ready.set()
+                continue
+            if message[0] == "failed":
+                # The other workers may still load the model; the pool only fails with the last of them
+                self.failed += 1
+                logger.error("Inference worker %d/%d could not load the detector: %s",
+                             self.failed, len(self._processes), message[1])
+                if self.failed == len(self._processes):
+                    self.error = message[1]
+                    self.ready.set()
+                continue
+
+            ticket, slot, detections, timings = message
+            with self._cond:
+                self._free.append(slot)
+                if ticket in self._tags:  # not skipped by _expire() meanwhile
+                    self._finished[ticket] = (detections, timings)
+                    self.counters["completed"] += 1
+                self._release()
+                self._cond.notify_all()
+            self._expire()
+
+    def _release(self):
+        """Move finished results that are next in submission order to get() (holding _cond)."""
+        while self._next_ticket in self._finished:
+            detections, timings = self._finished.pop(self._next_ticket)
+            self._submitted_at.pop(self._next_ticket)
+            self._in_order.append((self._tags.pop(self._next_ticket), detections, timings))
+            self._next_ticket += 1
+
+    def _expire(self):
+        """Skip the oldest frame when it has waited longer than task_timeout for its result."""
+        if self._processes and not any(process.is_alive() for process in self._processes) and self.error is None:
+            self.error = "every inference worker exited"
+            logger.error("Inference pool stopped working: %s", self.error)
+            self.ready.set()
+        with self._cond:
+            ticket = self._next_ticket
+            submitted_at = self._submitted_at.get(ticket)
+            if submitted_at is None or ticket in self._finished:
+                return
+            if time.perf_counter() - submitted_at < self.task_timeout:
+                return
+            # Its slot stays taken: a hung worker may still write it, a dead one's slot is lost with it
+            logger.warning("No detection result for frame %d after %.0f s, skipping it", ticket, self.task_timeout)
+            self.counters["expired"] += 1
+            self._tags.pop(ticket)
+            self._submitted_at.pop(ticket)
+            self._next_ticket += 1
+            self._release()
+            self._cond.notify_all()
+
+
+def benchmark_workers(frames, backend=DETECTOR_BACKEND, worker_counts=(1, 2, 4), rounds=2):
+    """
+    Throughput of the in-process detector and of pools with each worker count
+    on the same frames. Returns {label: fps}.
+    """
+    import detector
+
+    results = {}
+    model = detector.create_detector(backend)
+    model.detect(frames[0])
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for frame in frames:
+            model.detect(frame)
+    results["in-process"] = len(frames) * rounds / (time.perf_counter() - started)
+
+    max_frame = max((frame.shape[1], frame.shape[0]) for frame in frames)
+    for workers in worker_counts:
+        pool = InferencePool(workers, backend, max_frame=max_frame).start()
+        pool.ready.wait(120)
+        # Warm-up: one frame per worker
+        for frame in frames[:workers]:
+            pool.submit(frame)
+        for _ in frames[:workers]:
+            pool.get()
+
+        started = time.perf_counter()
+        received = 0
+        total = len(frames) * rounds
+        for i in range(total):
+            pool.submit(frames[i % len(frames)], tag=i)
+            while True:
+                result = pool.get(timeout=0)
+                if result is None:
+                    break
+                assert result[0] == received, "results out of order"
+                received += 1
+        while received < total:
+            assert pool.get()[0] == received
+            received += 1
+        results[f"{workers} workers"] = total / (time.perf_counter() - started)
+        pool.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multiprocess inference scaling benchmark")
+    parser.add_argument("--frames", help="folder with .jpg frames; synthetic frames otherwise")
+    parser.add_argument("--backend", default=DETECTOR_BACKEND)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--limit", type=int, default=40)
+    args = parser.parse_args()
+
+    if args.frames:
+        from detector import load_frames
+        frame_set = load_frames(args.frames, args.limit)
+    else:
+        rng = np.random.default_rng(0)
+        frame_set = [cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (9, 9), 0)
+                     for _ in range(args.limit)]
+
+    print(f"{len(frame_set)} frames, backend {args.backend}, {os.cpu_count()} CPUs")
+    for label, fps in benchmark_workers(frame_set, args.backend, args.workers).items():
+        print(f"  {label:>12}: {fps:6.1f} FPS")
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import numpy as np
+
+from globals import (JOG_RATE_HZ, JOG_SPEED, JOG_DAMPING, JOG_POSTURE_GAIN, JOG_KEY_RELEASE_GRACE,
+                     SERVO_MAX_VELOCITY)
+
+
+def damped_pseudo_inverse(jacobian, damping):
+    """J^T (J J^T + lambda^2 I)^-1; stays bounded near singular poses."""
+    rows = jacobian.shape[0]
+    return jacobian.T @ np.linalg.inv(jacobian @ jacobian.T + damping ** 2 * np.eye(rows))
+
+
+def solve_jog_step(arm, dx, damping=JOG_DAMPING, posture_gain=JOG_POSTURE_GAIN, max_joint_step=None):
+    """
+    Joint angle change (degrees, all three joints) that moves the gripper by dx (cm, XY).
+
+    The damped least-squares step is combined with a null-space pull towards the
+    middle of each joint's range. When the pose is singular for the requested
+    direction, the arm is bent towards mid-range instead of stalling. Joints that
+    would cross a limit are locked and the step is re-solved with the remaining
+    joints, so the gripper keeps its direction. max_joint_step (degrees per
+    joint) scales the whole step down uniformly.
+    """
+    angles = arm.angles_deg
+    jacobian = arm.jacobian
+    posture = np.radians((arm.joint_low + arm.joint_high) / 2 - angles) * posture_gain
+    free = np.ones(len(angles), dtype=bool)
+    dq = np.zeros(len(angles))
+
+    for _ in range(len(angles)):
+        j_free = jacobian[:, free]
+        pinv = damped_pseudo_inverse(j_free, damping)
+        null_space = np.eye(int(free.sum())) - np.linalg.pinv(j_free, rcond=1e-3) @ j_free
+        dq = np.zeros(len(angles))
+        dq[free] = np.degrees(pinv @ dx + null_space @ posture[free])
+        target = angles + dq
+        blocked = ((target < arm.joint_low) & (dq < 0)) | ((target > arm.joint_high) & (dq > 0))
+        if not blocked.any():
+            break
+        free &= ~blocked
+        if not free.any():
+            return np.zeros(len(angles))
+
+    # Stretched out (or folded) the Jacobian has no component along dx: bend towards
+    # mid-range so the next tick is no longer singular
+    achieved = jacobian @ np.radians(dq)
+    if np.linalg.norm(achieved) < 0.5 * np.linalg.norm(dx):
+        dq = dq + np.degrees(posture)
+
+    if max_joint_step is not None:
+        ratio = np.max(np.abs(dq) / np.asarray(max_joint_step, dtype=np.float64))
+        if ratio > 1:
+            dq /= ratio
+    return dq
+
+
+class JogController:
+    """
+    Cartesian jogging while keys are held.
+
+    press()/release() only record key state, so any key-repeat rate is fine. A
+    control thread ticks at rate_hz, solves one damped least-squares step for the
+    combined held direction and hands one coalesced setpoint to send({servo: angle}).
+    The step is read from and applied to arm while holding arm_lock, the lock other
+    threads take to change the same model (ArmController._lock); send is called after.
+    """
+
+    def __init__(self, arm, send, arm_lock=None, rate_hz=JOG_RATE_HZ, speed=JOG_SPEED, damping=JOG_DAMPING,
+                 release_grace=JOG_KEY_RELEASE_GRACE):
+        self.arm = arm
+        self.send = send
+        self.arm_lock = arm_lock or threading.Lock()
+        self.rate_hz = rate_hz
+        self.speed = speed  # cm/s
+        self.damping = damping
+        self.release_grace = release_grace
+
+        self.max_joint_velocity = np.array([SERVO_MAX_VELOCITY[s] for s in arm.servo_mapping], dtype=np.float64)
+        self._keys = {}  # direction -> release time, None while held
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_sent = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="jog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def press(self, direction):
+        with self._lock:
+            self._keys[tuple(direction)] = None
+        self._wake.set()
+
+    def release(self, direction):
+        # Auto-repeat sends release/press pairs; the grace period hides the gap
+        with self._lock:
+            if tuple(direction) in self._keys:
+                self._keys[tuple(direction)] = time.monotonic()
+        self._wake.set()
+
+    def release_all(self):
+        """Forget every held key, e.g. when motion is aborted."""
+        with self._lock:
+            self._keys.clear()
+
+    def held_direction(self):
+        """Unit XY vector of all held keys combined, or None if nothing is held."""
+        now = time.monotonic()
+        with self._lock:
+            for direction, released in list(self._keys.items()):
+                if released is not None and now - released > self.release_grace:
+                    del self._keys[direction]
+            if not self._keys:
+                return None
+            combined = np.sum([direction[:2] for direction in self._keys], axis=0).astype(np.float64)
+        norm = np.linalg.norm(combined)
+        return combined / norm if norm > 0 else None
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        while not self._stop.is_set():
+            self._wake.clear()
+            direction = self.held_direction()
+            if direction is None:
+                self._wake.wait()
+                continue
+
+            started = time.monotonic()
+            self.tick(direction, period)
+            self._stop.wait(max(0.0, period - (time.monotonic() - started)))
+
+    def tick(self, direction, dt):
+        with self.arm_lock:
+            dq = solve_jog_step(self.arm, direction * self.speed * dt, damping=self.damping,
+                                max_joint_step=self.max_joint_velocity * dt)
+            if not dq.any():
+                return
+            self.arm.set_angles(self.arm.angles_deg + dq)
+            targets = self.arm.servo_targets()
+        if targets != self._last_sent:
+            self._last_sent = targets
+            self.send(targets)
@@ -1,11 +1,15 @@
+import argparse
 import math
+import time
 
-# Параметры роборуки
-base_height = 12  # см - высота основания
-link_lengths = [7, 12, 13]  # длины звеньев
+import numpy as np
 
-# Текущие углы суставов в градусах (0-180)
-current_angles_deg = [90, 90, 90]  # Начальные углы (сервы в среднем положении)
+from globals import ARM_LINK_LENGTHS, ARM_BASE_HEIGHT
+
+# Параметры роборуки (общие с arm.ArmModel, см. globals.py).
+# Скалярные функции ниже - эталон для сравнения с пакетными версиями.
+base_height = ARM_BASE_HEIGHT  # см - высота основания
+link_lengths = ARM_LINK_LENGTHS  # длины звеньев
 
 def degrees_to_radians(angles_deg):
     """Конвертирует углы из градусов в радианы"""
@@ -36,75 +40,281 @@ def forward_kinematics(angles_deg):
 
     return (x3, y3, z3)
 
-def move_gripper_direction(direction, step=1.0):
+def inverse_kinematics(target_x, target_y):
+    """Вычисляет углы theta1, theta2, theta3 для достижения точки (target_x, target_y)"""
+    L1, L2, L3 = link_lengths
+    x, y = target_x, target_y
+
+    dist = math.hypot(x, y)
+    if dist > L1 + L2 + L3:
+        return None
+
+    # theta3 = 0, второе и третье звенья работают как одно
+    L23 = L2 + L3
+    cos_angle2 = (x**2 + y**2 - L1**2 - L23**2) / (2 * L1 * L23)
+    if not -1 <= cos_angle2 <= 1:
+        return None
+
+    theta2 = math.acos(cos_angle2)
+    k1 = L1 + L23 * math.cos(theta2)
+    k2 = L23 * math.sin(theta2)
+    theta1 = math.atan2(y, x) - math.atan2(k2, k1)
+
+    angles = [math.degrees(theta1), math.degrees(theta2), 0.0]
+    return [max(0, min(180, a)) for a in angles]
+
+
+# --- Пакетные (NumPy) версии: N поз за один вызов ---
+
+def forward_kinematics_batch(angles_deg, lengths=None, height=None):
+    """
+    Прямая кинематика для N поз.
+    angles_deg: массив (N, 3) в градусах -> массив (N, 3) координат схвата (x, y, z)
+    """
+    lengths = link_lengths if lengths is None else lengths
+    height = base_height if height is None else height
+    cumulative = np.cumsum(np.radians(np.asarray(angles_deg, dtype=np.float64)), axis=-1)
+
+    positions = np.empty(cumulative.shape[:-1] + (3,))
+    positions[..., 0] = np.cos(cumulative) @ np.asarray(lengths, dtype=np.float64)
+    positions[..., 1] = np.sin(cumulative) @ np.asarray(lengths, dtype=np.float64)
+    positions[..., 2] = height
+    return positions
+
+
+def jacobian_batch(angles_deg, lengths=None):
+    """
+    Якобиан XY-позиции схвата по углам суставов (в радианах) для N поз.
+    angles_deg: (N, 3) -> (N, 2, 3)
+    """
+    lengths = np.asarray(link_lengths if lengths is None else lengths, dtype=np.float64)
+    cumulative = np.cumsum(np.radians(np.asarray(angles_deg, dtype=np.float64)), axis=-1)
+    link_x = lengths * np.cos(cumulative)
+    link_y = lengths * np.sin(cumulative)
+
+    # Сустав i двигает все звенья от i до конца: обратная накопленная сумма
+    jacobian = np.empty(cumulative.shape[:-1] + (2, 3))
+    jacobian[..., 0, :] = -np.flip(np.cumsum(np.flip(link_y, -1), -1), -1)
+    jacobian[..., 1, :] = np.flip(np.cumsum(np.flip(link_x, -1), -1), -1)
+    return jacobian
+
+
+def inverse_kinematics_batch(targets_xy, lengths=None):
+    """
+    Обратная кинематика для N точек (та же модель, что inverse_kinematics: theta3 = 0).
+    targets_xy: (N, 2) -> (N, 3) углов в градусах, NaN для недостижимых точек
+    """
+    L1, L2, L3 = link_lengths if lengths is None else lengths
+    targets = np.asarray(targets_xy, dtype=np.float64)
+    x, y = targets[..., 0], targets[..., 1]
+    L23 = L2 + L3
+
+    dist_sq = x ** 2 + y ** 2
+    cos_angle2 = (dist_sq - L1 ** 2 - L23 ** 2) / (2 * L1 * L23)
+    reachable = (np.sqrt(dist_sq) <= L1 + L2 + L3) & (np.abs(cos_angle2) <= 1)
+
+    theta2 = np.arccos(np.clip(cos_angle2, -1, 1))
+    theta1 = np.arctan2(y, x) - np.arctan2(L23 * np.sin(theta2), L1 + L23 * np.cos(theta2))
+
+    angles = np.stack((np.degrees(theta1), np.degrees(theta2), np.zeros_like(theta1)), axis=-1)
+    angles = np.clip(angles, 0, 180)
+    angles[~reachable] = np.nan
+    return angles
+
+
+class Workspace:
     """
-    Управление направлением движения схвата
-    direction: tuple (dx, dy, dz) - направление движения
-    step: величина изменения углов (в градусах)
+    Precomputed reachable workspace: FK evaluated on a joint-angle grid and an
+    XY occupancy grid for O(1) reachability checks.
+
+    Neighbouring grid poses land up to ~L * angle_step apart, more than a cell,
+    so the occupancy is dilated by one cell to close the holes between them
+    (points up to one cell outside the boundary count as reachable); at 5 degrees
+    holes remained along the joint-limit edges, at 3 none were found. Poses are
+    also indexed by cell, so nearest_pose() only looks at nearby cells.
     """
-    global current_angles_deg
-
-    # Конвертируем текущие углы в радианы для вычислений
-    current_angles_rad = degrees_to_radians(current_angles_deg)
-    theta1, theta2, theta3 = current_angles_rad
-
-    # Вычисляем якобиан для текущих углов
-    J11 = -link_lengths[0] * math.sin(theta1) - link_lengths[1] * math.sin(theta1 + theta2) - link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-    J12 = -link_lengths[1] * math.sin(theta1 + theta2) - link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-    J13 = -link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-
-    J21 = link_lengths[0] * math.cos(theta1) + link_lengths[1] * math.cos(theta1 + theta2) + link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-    J22 = link_lengths[1] * math.cos(theta1 + theta2) + link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-    J23 = link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-
-    # Упрощенное псевдообращение якобиана (только для XY плоскости)
-    det = J11 * J22 - J12 * J21
-    if abs(det) < 1e-6:
-        print("Матрица близка к вырожденной. Движение может быть некорректным.")
-        return current_angles_deg
-
-    # Вычисляем изменения углов
-    dx, dy, dz = direction
-    dtheta1 = (J22 * dx - J12 * dy) / det * math.radians(step)
-    dtheta2 = (-J21 * dx + J11 * dy) / det * math.radians(step)
-    dtheta3 = 0  # Для простоты не изменяем третий угол
-
-    # Обновляем углы в радианах
-    new_angles_rad = [
-        theta1 + dtheta1,
-        theta2 + dtheta2,
-        theta3 + dtheta3
-    ]
-
-    # Конвертируем обратно в градусы и ограничиваем диапазон 0-180
-    new_angles_deg = radians_to_degrees(new_angles_rad)
-    new_angles_deg = [max(0, min(180, angle)) for angle in new_angles_deg]
-
-    current_angles_deg = new_angles_deg
-    return current_angles_deg
-
-def print_status():
+
+    def __init__(self, angle_step=3.0, cell_size=0.5, joint_limits=((0, 180), (0, 180), (0, 180)),
+                 lengths=None, height=None):
+        self.cell_size = cell_size
+        axes = [np.arange(low, high + angle_step / 2, angle_step) for low, high in joint_limits]
+        grid = np.meshgrid(*axes, indexing="ij")
+        self.angles = np.stack([g.ravel() for g in grid], axis=1)
+        self.positions = forward_kinematics_batch(self.angles, lengths, height)[:, :2]
+
+        reach = float(np.sum(link_lengths if lengths is None else lengths))
+        self.origin = np.array([-reach, -reach])
+        cells = int(np.ceil(2 * reach / cell_size)) + 1
+        occupied = np.zeros((cells, cells), dtype=bool)
+        index = self._cell_index(self.positions, cells)
+        occupied[index[:, 0], index[:, 1]] = True
+        padded = np.pad(occupied, 1)
+        self.reachable_cells = np.zeros_like(occupied)
+        for dx in range(3):
+            for dy in range(3):
+                self.reachable_cells |= padded[dx:dx + cells, dy:dy + cells]
+
+        # Poses sorted by cell: the poses of cells (i, j0..j1) are one slice of _order
+        cell_ids = index[:, 0] * cells + index[:, 1]
+        self._order = np.argsort(cell_ids, kind="stable")
+        self._sorted_ids = cell_ids[self._order]
+
+    def _cell_index(self, xy, cells=None):
+        cells = self.reachable_cells.shape[0] if cells is None else cells
+        index = np.floor((np.asarray(xy, dtype=np.float64) - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(index, 0, cells - 1)
+
+    def is_reachable(self, xy):
+        """Boolean (N,) for (N, 2) points: does any grid pose land in the same or a neighbouring cell."""
+        xy = np.atleast_2d(xy)
+        index = self._cell_index(xy)
+        inside = np.all((xy >= self.origin) & (xy <= -self.origin), axis=1)
+        return inside & self.reachable_cells[index[:, 0], index[:, 1]]
+
+    def _poses_near(self, cell, radius):
+        """Indices of the grid poses in the cells within `radius` cells of `cell`."""
+        cells = self.reachable_cells.shape[0]
+        j0, j1 = max(cell[1] - radius, 0), min(cell[1] + radius, cells - 1)
+        rows = np.arange(max(cell[0] - radius, 0), min(cell[0] + radius, cells - 1) + 1) * cells
+        starts = np.searchsorted(self._sorted_ids, rows + j0)
+        ends = np.searchsorted(self._sorted_ids, rows + j1, side="right")
+        return np.concatenate([self._order[start:end] for start, end in zip(starts, ends)])
+
+    def nearest_pose(self, xy, current_angles=None, joint_weight=0.0):
+        """
+        Closest grid pose to the point (x, y). With current_angles and joint_weight > 0,
+        poses far from the current joint angles are penalized (cm per degree).
+        Returns (angles_deg, reached_xy).
+
+        The cost is never below the XY distance, so once some pose costs c only the
+        cells within c of the point can hold a better one.
+        """
+        xy = np.asarray(xy, dtype=np.float64)
+        cell = self._cell_index(xy)
+        cells = self.reachable_cells.shape[0]
+        radius = 0
+        candidates = self._poses_near(cell, radius)
+        while not len(candidates) and radius < cells:
+            radius = max(1, radius * 2)
+            candidates = self._poses_near(cell, radius)
+        if not len(candidates):
+            raise ValueError("The workspace has no poses")
+        best_cost = float(np.min(self._cost(candidates, xy, current_angles, joint_weight)))
+        candidates = self._poses_near(cell, int(np.ceil(best_cost / self.cell_size)) + 1)
+        best = candidates[int(np.argmin(self._cost(candidates, xy, current_angles, joint_weight)))]
+        return self.angles[best], self.positions[best]
+
+    def _cost(self, poses, xy, current_angles, joint_weight):
+        cost = np.sqrt(np.sum((self.positions[poses] - xy) ** 2, axis=1))
+        if current_angles is not None and joint_weight > 0:
+            cost = cost + joint_weight * np.abs(self.angles[poses] - np.asarray(current_angles)).sum(axis=1)
+        return cost
+
+    def nearest_pose_scan(self, xy, current_angles=None, joint_weight=0.0):
+        """nearest_pose() by scanning every grid pose; the reference for the benchmark."""
+        best = int(np.argmin(self._cost(np.arange(len(self.angles)), np.asarray(xy, dtype=np.float64),
+                                        current_angles, joint_weight)))
+        return self.angles[best], self.positions[best]
+
+
+def benchmark(n=10000, seed=0):
+    """Сравнение скалярных и пакетных функций: время на N поз и максимальное расхождение."""
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, 180, (n, 3))
+    # IK targets are FK of poses with theta3 = 0 (the IK model), so every one is reachable
+    reachable = np.column_stack((rng.uniform(0, 180, (n, 2)), np.zeros(n)))
+    targets = forward_kinematics_batch(reachable)[:, :2]
+    results = {}
+
+    started = time.perf_counter()
+    scalar_fk = np.array([forward_kinematics(a) for a in angles.tolist()])
+    scalar_time = time.perf_counter() - started
+    started = time.perf_counter()
+    batch_fk = forward_kinematics_batch(angles)
+    results["forward"] = (scalar_time, time.perf_counter() - started, float(np.max(np.abs(scalar_fk - batch_fk))))
+
+    started = time.perf_counter()
+    scalar_ik = [inverse_kinematics(x, y) for x, y in targets.tolist()]
+    scalar_time = time.perf_counter() - started
+    started = time.perf_counter()
+    batch_ik = inverse_kinematics_batch(targets)
+    batch_time = time.perf_counter() - started
+    assert all(a is not None for a in scalar_ik) and not np.isnan(batch_ik).any(), "IK missed reachable targets"
+    results["inverse"] = (scalar_time, batch_time, float(np.max(np.abs(np.array(scalar_ik) - batch_ik))))
+
+    # Jacobian against central differences of the scalar FK
+    step = 1e-6  # rad
+    started = time.perf_counter()
+    scalar_jacobian = []
+    for a in angles[:n // 10].tolist():
+        columns = []
+        for joint in range(3):
+            plus, minus = list(a), list(a)
+            plus[joint] += math.degrees(step)
+            minus[joint] -= math.degrees(step)
+            columns.append(np.subtract(forward_kinematics(plus)[:2], forward_kinematics(minus)[:2]) / (2 * step))
+        scalar_jacobian.append(np.column_stack(columns))
+    scalar_time = time.perf_counter() - started
+    started = time.perf_counter()
+    batch_jacobian = jacobian_batch(angles[:n // 10])
+    results["jacobian"] = (scalar_time, time.perf_counter() - started,
+                           float(np.max(np.abs(np.array(scalar_jacobian) - batch_jacobian))))
+
+    started = time.perf_counter()
+    workspace = Workspace()
+    results["workspace grid"] = (float("nan"), time.perf_counter() - started, 0.0)
+
+    # Indexed nearest_pose() against a scan over every pose (the costs must agree)
+    queries = rng.uniform(-np.sum(link_lengths), np.sum(link_lengths), (max(1, n // 100), 2))
+    started = time.perf_counter()
+    scanned = [workspace.nearest_pose_scan(q)[1] for q in queries]
+    scalar_time = time.perf_counter() - started
+    started = time.perf_counter()
+    indexed = [workspace.nearest_pose(q)[1] for q in queries]
+    batch_time = time.perf_counter() - started
+    distance = lambda reached: np.hypot(*(np.array(reached) - queries).T)
+    results["nearest pose"] = (scalar_time, batch_time, float(np.max(np.abs(distance(scanned) - distance(indexed)))))
+    return results
+
+
+def print_status(arm):
     """Выводит текущее состояние роборуки"""
-    pos = forward_kinematics(current_angles_deg)
-    print(f"Углы суставов: {[round(a, 1) for a in current_angles_deg]}°")
+    pos = arm.position
+    print(f"Углы суставов: {[round(a, 1) for a in arm.angles_deg.tolist()]}°")
     print(f"Позиция схвата: x={pos[0]:.2f} см, y={pos[1]:.2f} см, z={pos[2]:.2f} см")
 
 # Пример использования
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Кинематика роборуки")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="сравнить скалярные и пакетные функции на N позах")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, (scalar, batch, error) in benchmark(args.benchmark).items():
+            if scalar != scalar:  # NaN: no scalar counterpart
+                print(f"{name:>15}: batch {batch * 1000:8.2f} ms")
+                continue
+            print(f"{name:>15}: scalar {scalar * 1000:8.2f} ms, batch {batch * 1000:8.2f} ms, "
+                  f"speedup {scalar / batch:.0f}x, max diff {error:.2e}")
+        raise SystemExit
+
+    from arm import ArmModel
+    arm = ArmModel()
+
     print("Начальное состояние:")
-    print_status()
+    print_status(arm)
 
     # Двигаем схват в положительном направлении X
     print("\nДвижение вправо (X+)")
-    move_gripper_direction((1, 0, 0), step=5)
-    print_status()
+    arm.move_gripper_direction((1, 0, 0), step=5)
+    print_status(arm)
 
     # Двигаем схват в положительном направлении Y
     print("\nДвижение вперед (Y+)")
-    move_gripper_direction((0, 1, 0), step=5)
-    print_status()
+    arm.move_gripper_direction((0, 1, 0), step=5)
+    print_status(arm)
 
     # Двигаем схват по диагонали
     print("\nДвижение по диагонали (X+, Y+)")
-    move_gripper_direction((1, 1, 0), step=5)
-    print_status()
\ No newline at end of file
+    arm.move_gripper_direction((1, 1, 0), step=5)
+    print_status(arm)
\ No newline at end of file
@@ -1,86 +1,249 @@
-import json
-import math
 import time
+
+STARTUP_STARTED = time.perf_counter()
+
+import collections
+import json
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import serial
 import serial.tools.list_ports
 import requests
-import numpy as np
-from PIL import Image, ImageTk, ImageDraw, ImageFont
-import cv2
+from PIL import Image, ImageDraw, ImageFont
 import threading
+import logging
+import functools
 
 
-from globals import sliders, YOLO_WEIGHTS, YOLO_CONFIG, YOLO_CLASSES
+from globals import (sliders, CAMERA_REPLAY, CAMERA_URL, SIMULATOR_SERIAL_PORT, METRICS_OVERLAY_INTERVAL_MS,
+                     DETECTOR_MOTION_GATING, DETECTOR_WORKERS, CAMERA_AUTO_TUNE, POWER_PLOT_INTERVAL_MS, DAEMON_URL,
+                     SERIAL_EVENT_QUEUE_SIZE)
 import helpers
 import ui
+import camera
+import camera_tuning
+import pipeline
+import detector
+import tracking
+import inference_pool
+import display
+import controller
+import daemon
+import arm
+import recorder
+import metrics
+import telemetry
+import logs
+
+logs.setup_logging()
+logger = logging.getLogger("main")
+
+# Worker processes are forked here, before this process starts any threads or opens the window
+inference_workers = None
+if DETECTOR_WORKERS and not DAEMON_URL:
+    if inference_pool.InferencePool.fork_available():
+        inference_workers = inference_pool.InferencePool(DETECTOR_WORKERS).start()
+    else:
+        logger.warning("DETECTOR_WORKERS needs the fork start method, detecting in the UI process instead")
 
 # Constants
-current_distance = 0
 BAUDRATE = 9600
+RENDER_INTERVAL_MS = 15
 
 
-# Load YOLOv4 model
-net = cv2.dnn.readNet(YOLO_WEIGHTS, YOLO_CONFIG)
-layer_names = net.getLayerNames()
-output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
-with open(YOLO_CLASSES, "r") as f:
-    CLASS_NAMES = [line.strip() for line in f.readlines()]
+# Detector model, loaded in the background by load_model_in_background()
+yolo = None
+CLASS_NAMES = []
 
 # Global variables
-ser = None
+arm_model = arm.ArmModel()
 camera_connected = True
 
-camera_url = helpers.find_esp32_camera()
+# Camera is discovered in the background by discover_camera_in_background()
+camera_url = "Searching for camera..."
+camera_stream = None
+last_stream_seq = 0
+last_stream_time = None  # arrival time of the stream frame the capture stage returned last
+camera_tuner = None  # adapts framesize/quality to the measured stream rate
+
+# Stage timings of the video pipeline, detector and serial link (overlay and CSV export)
+app_metrics = metrics.Metrics()
+OVERLAY_STAGES = ("fetch", "jpeg", "motion", "forward", "boxes", "nms", "track", "color", "photoimage", "latency",
+                  "serial write", "serial read")
+
+# Raw JPEG recorder, active while the Record button is toggled on
+frame_recorder = None
+
+# Serial port, scripts, jogging and telemetry: in this process, or in the control daemon (daemon.py)
+# when DAEMON_URL is set. Both have the same interface; the client is started once the window exists.
+if DAEMON_URL:
+    control = daemon.DaemonClient(DAEMON_URL)
+else:
+    control = controller.ArmController(arm_model, baudrate=BAUDRATE, app_metrics=app_metrics)
+
+# Controller events waiting for the UI thread, handled in one pass by drain_control_events
+control_events = collections.deque(maxlen=SERIAL_EVENT_QUEUE_SIZE)
+control_events_lock = threading.Lock()
+
+# Seconds from process start to each startup milestone
+startup_times = {}
+startup_status = {"Model": "loading...", "Camera": "searching..."}
+
+
+def mark_startup(milestone):
+    """Record the time from process start to a startup milestone (first occurrence only)."""
+    if milestone not in startup_times:
+        startup_times[milestone] = time.perf_counter() - STARTUP_STARTED
+        logger.info("Startup: %s after %.2f s", milestone, startup_times[milestone])
+
+
+def set_startup_status(name, text):
+    """Update the startup status line; safe to call from background threads."""
+    startup_status[name] = text
+    root.after(0, lambda: status_label.config(
+        text="   ".join(f"{key}: {value}" for key, value in startup_status.items())
+    ))
+
+
+def load_model_in_background():
+    """Load the detector off the UI thread; detection turns on once it is ready."""
+
+    def load():
+        global yolo, CLASS_NAMES
+        if inference_workers is not None:
+            CLASS_NAMES = detector.load_class_names()
+            inference_workers.ready.wait()
+            if not inference_workers.error:
+                mark_startup("model ready")
+                set_startup_status("Model", f"{DETECTOR_WORKERS} worker processes ready "
+                                            f"({startup_times['model ready']:.1f} s)")
+                return
+            # The pipeline stops using the pool on its error; try the detector in this process instead
+            set_startup_status("Model", "worker processes failed, loading in the UI process...")
+        try:
+            names = detector.load_class_names()
+            model = detector.create_detector()
+        except Exception as e:
+            logger.error("Could not load detector: %s", e)
+            set_startup_status("Model", "failed, detection disabled")
+            return
+        CLASS_NAMES = names
+        # Static scenes (most of manual jogging) reuse or track the last boxes instead of a forward pass
+        yolo = tracking.InferenceScheduler(model) if DETECTOR_MOTION_GATING else model
+        mark_startup("model ready")
+        set_startup_status("Model", f"{model.name} ready ({startup_times['model ready']:.1f} s)")
 
-slider_history = {}
+    threading.Thread(target=load, daemon=True).start()
 
 
-def on_scale_change(slider_number, val):
-    """Send slider change to serial if open and value difference is significant."""
-    if ser and ser.is_open:
-        value = int(float(val))
-        message = f"{slider_number} {value}"
+def discover_camera_in_background():
+    """Find the ESP32 camera off the UI thread and start streaming once it is found."""
 
-        history = slider_history.get(slider_number, [])
+    def discover():
+        url = helpers.find_esp32_camera()
+        mark_startup("camera discovery finished")
+        root.after(0, on_camera_discovered, url)
+
+    threading.Thread(target=discover, daemon=True).start()
+
+
+def start_replay(path):
+    """Use a recording instead of the live camera (CAMERA_REPLAY in globals.py)."""
+    global camera_url, camera_stream
+    camera_url = path
+    camera_stream = recorder.ReplaySource(path, loop=True).start()
+    set_startup_status("Camera", f"replaying {path}")
+
+
+def frame_distance(captured_at):
+    """Distance to tag a frame with: the reading closest to its arrival; replays use the recorded value."""
+    if isinstance(camera_stream, recorder.ReplaySource):
+        return camera_stream.distance
+    distance = control.distance_history.nearest(last_stream_time or captured_at)
+    return control.current_distance if distance is None else int(distance[0])
+
+
+def toggle_recording():
+    global frame_recorder
+    if frame_recorder is None:
+        frame_recorder = recorder.FrameRecorder(distance=lambda: control.current_distance)
+        if isinstance(camera_stream, camera.MjpegStreamClient):
+            camera_stream.listeners.append(frame_recorder.write)
+        record_button.config(text="Stop recording")
+        logger.info("Recording to %s", frame_recorder.path)
+    else:
+        stop_recording()
+
+
+def stop_recording():
+    global frame_recorder
+    if frame_recorder is None:
+        return
+    if isinstance(camera_stream, camera.MjpegStreamClient) and frame_recorder.write in camera_stream.listeners:
+        camera_stream.listeners.remove(frame_recorder.write)
+    frame_recorder.close()
+    logger.info("Recorded %d frames to %s", frame_recorder.frames_written, frame_recorder.path)
+    frame_recorder = None
+    record_button.config(text="Record")
+
+
+def connect_daemon_stream():
+    """Show the daemon's annotated feed; detection already ran there."""
+    global camera_url, camera_stream
+    camera_url = control.stream_url
+    camera_url_entry.delete(0, tk.END)
+    camera_url_entry.insert(0, camera_url)
+    camera_stream = camera.MjpegStreamClient(control.stream_url).start()
+    set_startup_status("Camera", f"daemon at {DAEMON_URL}")
+
+
+def on_camera_discovered(url):
+    global camera_url, camera_stream, camera_connected, camera_tuner
+    camera_url = url
+    camera_url_entry.delete(0, tk.END)
+    camera_url_entry.insert(0, camera_url)
+
+    stream_url = camera.stream_url_from_capture_url(camera_url)
+    if stream_url:
+        camera_connected = True
+        camera_stream = camera.MjpegStreamClient(stream_url).start()
+        if frame_recorder is not None:
+            camera_stream.listeners.append(frame_recorder.write)
+        set_startup_status("Camera", "found")
+        if CAMERA_AUTO_TUNE:
+            camera_tuner = camera_tuning.CameraTuner(
+                camera_tuning.camera_base_url(camera_url), camera_stream, app_metrics,
+                on_change=lambda framesize, quality: set_startup_status("Camera", f"{framesize}, quality {quality}")
+            ).start()
+    else:
+        set_startup_status("Camera", "not found")
 
-        ser.write((message + '\n').encode())
-        print(f"Sent to serial: {message.strip()}")
 
-        history.append(value)
-        if len(history) > 3:
-            history.pop(0)
-        slider_history[slider_number] = history
+def on_scale_change(slider_number, val):
+    """Pass the slider value to the controller; echoes of setpoints the slider already shows are not resent."""
+    value = int(float(val))
+    if control.angles.get(slider_number) != value:
+        control.set_servos({slider_number: value})
 
 
 def create_slider(root, row, slider_number):
-    """Create and return a labeled slider with a Tkinter Scale widget."""
-    value_label = ttk.Label(root, text=f"Slider {slider_number} - Value: 90")
+    """Create and return a labeled slider with a Tkinter Scale widget, limited to the servo's range."""
+    low, high = arm_model.servo_limits[slider_number]
+    initial = 45 if slider_number == 5 else 90
+
+    value_label = ttk.Label(root, text=f"Slider {slider_number} - Value: {initial}")
     value_label.grid(row=row + 1, column=0, padx=5, pady=5)
 
-    if slider_number == 5:
-        slider = ttk.Scale(
-            root,
-            from_=0,
-            to=90,
-            orient="horizontal",
-            length=400,
-            command=lambda val: (on_scale_change(slider_number, val),
-                                 value_label.config(text=f"Slider {slider_number} - Value: {int(float(val))}"))
-        )
-        slider.set(45)
-    else:
-        slider = ttk.Scale(
-            root,
-            from_=17,
-            to=180,
-            orient="horizontal",
-            length=400,
-            command=lambda val: (on_scale_change(slider_number, val),
-                                 value_label.config(text=f"Slider {slider_number} - Value: {int(float(val))}"))
-        )
-        slider.set(90)
+    slider = ttk.Scale(
+        root,
+        from_=low,
+        to=high,
+        orient="horizontal",
+        length=400,
+        command=lambda val: (on_scale_change(slider_number, val),
+                             value_label.config(text=f"Slider {slider_number} - Value: {int(float(val))}"))
+    )
+    slider.set(initial)
 
     slider.grid(row=row + 1, column=1, padx=10, pady=5)
     return slider
@@ -94,180 +257,214 @@ def create_sliders():
 
 
 def update_serial_port(portName):
-    """Update serial port and read distance if connected."""
-    global ser
-    if ser and ser.is_open:
-        ser.close()
+    """Open the serial port; protocol negotiation and I/O start in the background."""
     try:
-        ser = serial.Serial(portName, BAUDRATE)
-        print(f"Connected to serial port: {portName}")
-        get_data_from_serial()
+        control.open_port(portName)
     except serial.SerialException as e:
         messagebox.showerror("Serial Port Error", f"Could not open serial port {portName}: {e}")
-        print(f"Could not open serial port {portName}: {e}")
+        logger.error("Could not open serial port %s: %s", portName, e)
+
+
+def on_control_event(event):
+    """Any thread: queue a controller event for the UI and schedule one drain per batch."""
+    if event["type"] in ("power", "detections"):
+        return  # the power plot reads the ring on its own timer
+    with control_events_lock:
+        schedule = not control_events
+        control_events.append(event)
+    if schedule:
+        root.after(0, drain_control_events)
+
+
+def drain_control_events():
+    """Handle every event queued since the last drain, in one UI pass."""
+    with control_events_lock:
+        batch = list(control_events)
+        control_events.clear()
+
+    targets = {}
+    distance = None
+    for event in batch:
+        kind = event["type"]
+        if kind == "setpoints":
+            targets.update(event["targets"])
+        elif kind == "distance":
+            distance = event["value"]  # only the newest reading matters for the label
+        elif kind == "script":
+            on_script_state(event)
+        elif kind == "stopped":
+            on_emergency_stop(event["reason"])
+        elif kind == "message":
+            handle_info_message(event["text"])
+        elif kind == "error":
+            handle_error_message(event["text"])
+    if targets:
+        update_sliders(targets)
+    if distance is not None:
+        handle_distance_message(distance)
+
+
+def on_emergency_stop(reason):
+    ui.show_toast(f"Motion stopped: {reason}", "Error")
+
+
+def on_script_state(event):
+    if event["state"] == "paused":
+        script_status_label.config(text=f"Script: paused at {event['progress']:.0%}")
+    else:
+        script_status_label.config(text=f"Script: {event['state']}")
 
 
-def get_data_from_serial():
-    global current_distance
-    if ser and ser.is_open:
-        try:
-            if ser.in_waiting > 0:
-                message = ser.readline().decode('utf-8').strip()
-                if message.startswith("Distance: "):
-                    handle_distance_message(message)
-                elif message.startswith("Message: "):
-                    handle_info_message(message)
-                elif message.startswith("Error: "):
-                    handle_error_message(message)
-        except Exception as e:
-            print(f"Error reading data: {e}")
-    root.after(100, get_data_from_serial)
+def update_power_plot():
+    power_plot.update(time.perf_counter())
+    root.after(POWER_PLOT_INTERVAL_MS, update_power_plot)
 
 
-def handle_distance_message(message):
-    global current_distance
-    try:
-        distance_value = int(message.split(": ")[1])
-        current_distance = distance_value
-        distance_label.config(text=f"Distance: {distance_value} cm")
-        print(f"Distance: {distance_value} cm")
-    except ValueError:
-        print("Invalid distance value")
+def handle_distance_message(distance):
+    distance_label.config(text=f"Distance: {distance} cm")
+    logger.debug("Distance: %s cm", distance)
 
 
-def handle_info_message(message):
+def handle_info_message(text):
     """Handle 'Info' type messages."""
-    info = message.split(": ", 1)[1] if ": " in message else "No details"
-    print(f"Info Message: {info}")
-    ui.show_toast(f"Info: {info}", "Info")
+    logger.info("Info Message: %s", text)
+    ui.show_toast(f"Info: {text}", "Info")
 
 
-def handle_error_message(message):
+def handle_error_message(text):
     """Handle 'Error' type messages."""
-    error_info = message.split(": ", 1)[1] if ": " in message else "No details"
-    print(f"Error Message: {error_info}")
-    ui.show_toast(f"Error: {error_info}", "Error")
-
-
-def detect_objects(image, distance):
-    """Detect objects in the image using YOLOv4 and display color and distance information."""
-    blob = cv2.dnn.blobFromImage(image, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-    net.setInput(blob)
-    detections = net.forward(output_layers)
-
-    height, width, channels = image.shape
-    boxes, confidences, class_ids = [], [], []
-
-    for out in detections:
-        for detection in out:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-            if confidence > 0.5:  # Confidence threshold
-                center_x = int(detection[0] * width)
-                center_y = int(detection[1] * height)
-                w = int(detection[2] * width)
-                h = int(detection[3] * height)
-
-                x = int(center_x - w / 2)
-                y = int(center_y - h / 2)
-
-                boxes.append([x, y, w, h])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
-
-    # Apply Non-Maximum Suppression (NMS)
-    indices = cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)
-
-    # Indices is a tuple, so we need to handle it accordingly
-    if len(indices) > 0:
-        indices = indices.flatten()  # Flatten if it's not empty
-
-        for i in indices:
-            x, y, w, h = boxes[i]
-            label = f"{CLASS_NAMES[class_ids[i]]}: {confidences[i]:.2f}, Dist: {distance} cm"
-
-            # Draw bounding box and label
-            color = (0, 255, 0)
-            cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
-            cv2.putText(image, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    logger.warning("Error Message: %s", text)
+    ui.show_toast(f"Error: {text}", "Error")
 
-    return image
+
+def detect_objects(image, distance, timings=None):
+    """Detect objects in the image and display class, confidence and distance information."""
+    return draw_detections(image, yolo.detect(image, timings), distance)
+
+
+def draw_detections(image, detections, distance):
+    """Draw the boxes with class, confidence and distance labels onto the image."""
+    return detector.draw_detections(image, detections, CLASS_NAMES, distance)
 
 def get_image_from_camera():
-    """Capture image from the camera URL."""
+    """Return the newest frame from the camera stream, falling back to polling the capture URL."""
     global camera_connected
-    if not camera_connected:
-        return None
+    if camera_stream is not None and camera_stream.connected:
+        camera_connected = True
+        return camera_stream.read_image()
+    if not camera_connected or DAEMON_URL:
+        return None  # the daemon feed is a stream only; its client reconnects by itself
     try:
-        response = requests.get(camera_url, timeout=5)
+        with app_metrics.timed("fetch"):
+            response = requests.get(camera_url, timeout=5)
         if response.status_code == 200:
-            image_array = np.array(bytearray(response.content), dtype=np.uint8)
-            return cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+            if frame_recorder is not None:
+                frame_recorder.write(response.content)
+            with app_metrics.timed("jpeg"):
+                return camera.decode_jpeg(response.content)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.warning("Could not fetch a frame from %s: %s", camera_url, e)
         camera_connected = False
     return None
 
 
-def update_image_in_thread():
-    """Обрабатывает изображения в отдельном потоке и отправляет их в UI-поток."""
-    while True:
-        image = get_image_from_camera()
-        if image is not None:
-            # Обработка изображения
-            image = detect_objects(image, current_distance)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Конвертация из OpenCV BGR в RGB
-            img = Image.fromarray(image)
-        else:
-            # Создаем заглушку "No Camera Found"
-            width, height = 640, 480
-            img = Image.new('RGB', (width, height), color=(240, 240, 240))  # Серый фон
-            draw = ImageDraw.Draw(img)
-            font_large = ImageFont.load_default()
-            text = "No Camera Found"
-            subtext = "Please check your camera connection."
-
-            # Рассчитываем координаты для текста
-            text_bbox = draw.textbbox((0, 0), text, font=font_large)
-            subtext_bbox = draw.textbbox((0, 0), subtext, font=font_large)
-            text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
-            subtext_width, subtext_height = subtext_bbox[2] - subtext_bbox[0], subtext_bbox[3] - subtext_bbox[1]
-
-            draw.text(
-                ((width - text_width) // 2, height // 2 - text_height),
-                text,
-                fill="black",
-                font=font_large
-            )
-            draw.text(
-                ((width - subtext_width) // 2, height // 2 + text_height),
-                subtext,
-                fill="gray",
-                font=font_large
-            )
-
-        # Обновляем UI через основной поток
-        tk_image = ImageTk.PhotoImage(image=img)
-        root.after(0, update_ui_image, tk_image)  # Передача изображения в UI
-        time.sleep(0.1)  # Задержка, чтобы уменьшить нагрузку на CPU
-
-
-def update_ui_image(tk_image):
-    """Обновляет изображение в виджете Tkinter."""
-    camera_label.imgtk = tk_image
-    camera_label.configure(image=tk_image)
-
-
-def execute_command(servo_number, angle):
-    """Sets a specified servo to a given angle and sends the command to the serial port."""
-    sliders[servo_number].set(angle)
-    print(f"Servo {servo_number} set to angle {angle}")
-    on_scale_change(servo_number, angle)
+def capture_frame():
+    """Capture stage: wait for the next stream frame, or poll the capture URL without a stream."""
+    global last_stream_seq, last_stream_time, camera_connected
+    last_stream_time = None
+    if camera_stream is not None and camera_stream.connected:
+        camera_connected = True
+        with app_metrics.timed("fetch"):
+            frame = camera_stream.wait_for_frame(last_stream_seq, timeout=1.0)
+        if frame is None:
+            return None
+        last_stream_seq, last_stream_time = frame[0], frame[1]
+        with app_metrics.timed("jpeg"):
+            return camera.decode_jpeg(frame[2])
+    return get_image_from_camera()
+
+
+def process_frame(frame):
+    """Inference stage: detect objects and convert the frame into a PIL image for display (None without camera)."""
+    if frame.image is None:
+        return None
+    image = frame.image
+    if frame.detections is not None:
+        image = draw_detections(image, frame.detections, frame.distance)
+    elif yolo is not None:
+        image = detect_objects(image, frame.distance, frame.timings)
+    started = time.perf_counter()
+    image = display_buffers.convert(image)  # BGR -> RGBA в заранее выделенный буфер, без копий PIL
+    frame.timings["color"] = time.perf_counter() - started
+    return image
+
+
+@functools.lru_cache(maxsize=1)
+def create_placeholder_image():
+    """Создает заглушку "No Camera Found"."""
+    width, height = 640, 480
+    img = Image.new('RGB', (width, height), color=(240, 240, 240))  # Серый фон
+    draw = ImageDraw.Draw(img)
+    font_large = ImageFont.load_default()
+    text = "No Camera Found"
+    subtext = "Please check your camera connection."
+
+    # Рассчитываем координаты для текста
+    text_bbox = draw.textbbox((0, 0), text, font=font_large)
+    subtext_bbox = draw.textbbox((0, 0), subtext, font=font_large)
+    text_width, text_height = text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
+    subtext_width, subtext_height = subtext_bbox[2] - subtext_bbox[0], subtext_bbox[3] - subtext_bbox[1]
+
+    draw.text(
+        ((width - text_width) // 2, height // 2 - text_height),
+        text,
+        fill="black",
+        font=font_large
+    )
+    draw.text(
+        ((width - subtext_width) // 2, height // 2 + text_height),
+        subtext,
+        fill="gray",
+        font=font_large
+    )
+    return img
+
+
+def update_ui_image(img):
+    """Обновляет изображение в виджете Tkinter (вызывается в UI-потоке)."""
+    if img is None:
+        camera_display.show_static(create_placeholder_image())
+        return
+    with app_metrics.timed("photoimage"):
+        camera_display.show(img)
+    mark_startup("first frame displayed")  # a camera frame, not the placeholder
+
+
+def render_loop():
+    """Render stage: show the newest processed frame and reschedule on the Tk event loop."""
+    video_pipeline.poll_render()
+    root.after(RENDER_INTERVAL_MS, render_loop)
+
+
+def update_metrics_overlay():
+    """Refresh the FPS / p50 / p99 overlay while it is switched on."""
+    if not show_metrics.get():
+        metrics_overlay.place_forget()
+        return
+    metrics_overlay.config(text=app_metrics.format_overlay(OVERLAY_STAGES) or "No samples yet")
+    metrics_overlay.place(in_=camera_label, x=5, y=5)
+    root.after(METRICS_OVERLAY_INTERVAL_MS, update_metrics_overlay)
+
+
+def export_metrics():
+    filename = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+    if filename:
+        rows = app_metrics.export_csv(filename)
+        logger.info("Exported %d timing samples to %s", rows, filename)
 
 
 def load_commands_from_json(filename):
-    """Load and execute servo commands and repeatable sequences from a JSON file."""
+    """Compile servo commands and repeatable sequences from a JSON file and run them in the background."""
     with open(filename, 'r') as file:
         try:
             data = json.load(file)
@@ -275,21 +472,27 @@ def load_commands_from_json(filename):
             messagebox.showerror("JSON Error", f"Error decoding JSON in file: {filename}")
             return
 
-    # Iterate over the commands in the JSON
-    for item in data.get("commands", []):
-        if "servo" in item and "angle" in item:
-            # Single command for a servo
-            servo_number = item["servo"]
-            angle = item["angle"]
-            execute_command(servo_number, angle)
+    logger.info("Running %s", filename)
+    control.run_script(data)  # the status label follows the controller's script events
+
+
+def update_sliders(targets):
+    """Mirror setpoints from scripts, jogging and other clients on the sliders."""
+    for servo_number, angle in targets.items():
+        if int(float(sliders[servo_number].get())) != angle:
+            sliders[servo_number].set(angle)
+
+
+def pause_or_resume_script():
+    state = control.script_status["state"]
+    if state == "paused":
+        control.resume_script()
+    elif state == "running":
+        control.pause_script()
+
 
-        elif "repeatable" in item:
-            repeat_count = item["repeatable"]["repeats"]
-            for _ in range(repeat_count):
-                for cmd in item["repeatable"]["sequence"]:
-                    # Executing each command in the repeatable sequence
-                    execute_command(cmd["servo"], cmd["angle"])
-                    time.sleep(1)
+def abort_script():
+    control.abort_script()
 
 
 def load_commands_from_file():
@@ -315,12 +518,14 @@ root.iconphoto(True, icon)
 # UI elements for serial port, distance, and sliders
 ttk.Label(root, text="Select Serial Port:").grid(row=0, column=0, padx=5, pady=5)
 available_ports = [port.device for port in serial.tools.list_ports.comports()]
+if SIMULATOR_SERIAL_PORT:
+    available_ports.append(SIMULATOR_SERIAL_PORT)
 port_combobox = ttk.Combobox(root, values=available_ports, state="readonly")
 port_combobox.set("Select a Port")
 port_combobox.grid(row=0, column=1, padx=5, pady=5)
 port_combobox.bind("<<ComboboxSelected>>", lambda event: update_serial_port(port_combobox.get()))
 
-distance_label = ttk.Label(root, text=f"Distance: {current_distance}", justify="left", anchor="w")
+distance_label = ttk.Label(root, text=f"Distance: {control.current_distance}", justify="left", anchor="w")
 distance_label.grid(row=2, column=2, padx=5, pady=10)
 
 ttk.Label(root, text="Camera URL:").grid(row=0, column=2, padx=5, pady=10)
@@ -328,8 +533,13 @@ camera_url_entry = ttk.Entry(root, width=30)
 camera_url_entry.insert(0, camera_url)
 camera_url_entry.grid(row=0, column=3, padx=10, pady=10)
 
+status_label = ttk.Label(root, text="Model: loading...   Camera: searching...", justify="left", anchor="w")
+status_label.grid(row=3, column=2, columnspan=2, padx=5, pady=5, sticky="w")
+
 camera_label = ttk.Label(root)
 camera_label.grid(row=8, column=0, rowspan=8, columnspan=3, padx=5, pady=10)
+display_buffers = display.RgbBufferRing()
+camera_display = display.PhotoDisplay(camera_label, display_buffers)
 
 connect_camera_button = ttk.Button(root, text="Try to reconnect", command=get_image_from_camera)
 connect_camera_button.grid(row=1, column=2, padx=5, pady=10)
@@ -337,6 +547,28 @@ connect_camera_button.grid(row=1, column=2, padx=5, pady=10)
 load_file_button = ttk.Button(root, text="Load Commands from File", command=load_commands_from_file)
 load_file_button.grid(row=1, column=3, padx=5, pady=10)
 
+script_frame = ttk.Frame(root)
+script_frame.grid(row=2, column=3, padx=5, pady=5)
+ttk.Button(script_frame, text="Pause/Resume", command=pause_or_resume_script).pack(side=tk.LEFT, padx=2)
+ttk.Button(script_frame, text="Abort", command=abort_script).pack(side=tk.LEFT, padx=2)
+script_status_label = ttk.Label(script_frame, text="Script: idle")
+script_status_label.pack(side=tk.LEFT, padx=5)
+
+record_button = ttk.Button(root, text="Record", command=toggle_recording)
+record_button.grid(row=3, column=3, padx=5, pady=5, sticky="e")
+
+metrics_frame = ttk.Frame(root)
+metrics_frame.grid(row=4, column=2, columnspan=2, padx=5, pady=5, sticky="w")
+show_metrics = tk.BooleanVar(value=False)
+ttk.Checkbutton(metrics_frame, text="Show metrics", variable=show_metrics,
+                command=update_metrics_overlay).pack(side=tk.LEFT, padx=2)
+ttk.Button(metrics_frame, text="Export metrics CSV", command=export_metrics).pack(side=tk.LEFT, padx=2)
+metrics_overlay = tk.Label(root, justify="left", anchor="nw", font=("Courier", 9), bg="black", fg="lime")
+
+power_canvas = tk.Canvas(root, width=420, height=110, bg="white", highlightthickness=0)
+power_canvas.grid(row=5, column=2, columnspan=2, rowspan=3, padx=5, pady=5, sticky="nw")
+power_plot = telemetry.PowerPlot(power_canvas, control.power_history)
+
 
 # Add Keybinding Description
 keybind_description = (
@@ -373,124 +605,44 @@ root.bind("z", lambda event: helpers.decrease_slider(5))
 # Create sliders
 create_sliders()
 
-video_thread = threading.Thread(target=update_image_in_thread, daemon=True)
-video_thread.start()
-
-base_height = 12  # см - высота основания
-link_lengths = [7, 12, 26]  # длины звеньев
-current_angles_deg = [90, 90, 90]  # начальные углы для суставов 1, 2, 4
-
-def degrees_to_radians(angles_deg):
-    return [math.radians(a) for a in angles_deg]
-
-def radians_to_degrees(angles_rad):
-    return [math.degrees(a) for a in angles_rad]
-
-def forward_kinematics(angles_deg):
-    theta1, theta2, theta3 = degrees_to_radians(angles_deg)
-    x1 = link_lengths[0] * math.cos(theta1)
-    y1 = link_lengths[0] * math.sin(theta1)
-    z1 = base_height
-    x2 = x1 + link_lengths[1] * math.cos(theta1 + theta2)
-    y2 = y1 + link_lengths[1] * math.sin(theta1 + theta2)
-    z2 = z1
-    x3 = x2 + link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-    y3 = y2 + link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-    z3 = z2
-    return (x3, y3, z3)
-
-def move_gripper_direction(direction, step=1.0):
-    global current_angles_deg
-    current_angles_rad = degrees_to_radians(current_angles_deg)
-    theta1, theta2, theta3 = current_angles_rad
-
-    J11 = -link_lengths[0] * math.sin(theta1) - link_lengths[1] * math.sin(theta1 + theta2) - link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-    J12 = -link_lengths[1] * math.sin(theta1 + theta2) - link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-    J13 = -link_lengths[2] * math.sin(theta1 + theta2 + theta3)
-
-    J21 = link_lengths[0] * math.cos(theta1) + link_lengths[1] * math.cos(theta1 + theta2) + link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-    J22 = link_lengths[1] * math.cos(theta1 + theta2) + link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-    J23 = link_lengths[2] * math.cos(theta1 + theta2 + theta3)
-
-    det = J11 * J22 - J12 * J21
-    if abs(det) < 1e-6:
-        print("Якобиан вырожден. Невозможно двигать.")
-        return current_angles_deg
-
-    dx, dy, dz = direction
-    dtheta1 = (J22 * dx - J12 * dy) / det * math.radians(step)
-    dtheta2 = (-J21 * dx + J11 * dy) / det * math.radians(step)
-    dtheta3 = 0  # z не используется
-
-    new_angles_rad = [
-        theta1 + dtheta1,
-        theta2 + dtheta2,
-        theta3 + dtheta3
-    ]
-
-    new_angles_deg = radians_to_degrees(new_angles_rad)
-    new_angles_deg = [max(0, min(180, angle)) for angle in new_angles_deg]
-    current_angles_deg = new_angles_deg
-    return new_angles_deg
-
-def apply_angles_to_servos(angles_deg):
-    """Применяет углы к слайдерам 1, 2, 4"""
-    servo_mapping = [1, 2, 4]
-    for servo_index, angle in zip(servo_mapping, angles_deg):
-        sliders[servo_index].set(angle)
-        on_scale_change(servo_index, angle)
-
-def move_and_update(direction):
-    new_angles = move_gripper_direction(direction, step=2)
-    apply_angles_to_servos(new_angles)
-    print(new_angles)
-
-def inverse_kinematics(target_x, target_y):
-    """Вычисляет углы theta1, theta2, theta3 для достижения точки (target_x, target_y)"""
-    L1, L2, L3 = link_lengths
-    x, y = target_x, target_y
-
-    dist = math.hypot(x, y)
-    if dist > L1 + L2 + L3:
-        print("Точка вне досягаемости")
-        return None
-
-    # Учитываем, что theta3 = 0 для упрощения
-    theta3 = 0
-
-    # Длина между первым и третьим суставами
-    L23 = L2 + L3
-
-    # Косинус угла при L1
-    cos_angle2 = (x**2 + y**2 - L1**2 - L23**2) / (2 * L1 * L23)
-    if not -1 <= cos_angle2 <= 1:
-        print("Невозможно достичь точки: cos вне диапазона")
-        return None
-
-    theta2 = math.acos(cos_angle2)
-
-    # Найдём theta1
-    k1 = L1 + L23 * math.cos(theta2)
-    k2 = L23 * math.sin(theta2)
-    theta1 = math.atan2(y, x) - math.atan2(k2, k1)
-
-    # Переводим в градусы
-    theta1_deg = math.degrees(theta1)
-    theta2_deg = math.degrees(theta2)
-    theta3_deg = math.degrees(theta3)
-
-    # Ограничение диапазонов
-    angles = [theta1_deg, theta2_deg, theta3_deg]
-    angles = [max(0, min(180, a)) for a in angles]
-
-    return angles
-
+if inference_workers is not None:
+    video_pipeline = pipeline.PooledVideoPipeline(
+        capture_frame, process_frame, update_ui_image, inference_workers, distance=frame_distance, metrics=app_metrics
+    ).start()
+else:
+    video_pipeline = pipeline.VideoPipeline(
+        capture_frame, process_frame, update_ui_image, distance=frame_distance, metrics=app_metrics
+    ).start()
+render_loop()
+update_power_plot()
+
+# Heavy startup work runs in the background so the window is usable immediately
+control.add_listener(on_control_event)
+if DAEMON_URL:
+    control.start()
+    set_startup_status("Model", "runs in the daemon")
+    root.after_idle(connect_daemon_stream)
+else:
+    load_model_in_background()
+    if CAMERA_REPLAY:
+        start_replay(CAMERA_REPLAY)
+    elif CAMERA_URL:
+        root.after_idle(on_camera_discovered, CAMERA_URL)
+    else:
+        discover_camera_in_background()
+root.after_idle(mark_startup, "window interactive")
 
-# Биндим стрелки на движение схвата
-root.bind("<Left>", lambda event: move_and_update((-5, 0, 0)))
-root.bind("<Right>", lambda event: move_and_update((5, 0, 0)))
-root.bind("<Up>", lambda event: move_and_update((0, 5, 0)))
-root.bind("<Down>", lambda event: move_and_update((0, -5, 0)))
+# Биндим стрелки на движение схвата: схват движется, пока клавиша удерживается
+for key, direction in (("Left", (-1, 0, 0)), ("Right", (1, 0, 0)), ("Up", (0, 1, 0)), ("Down", (0, -1, 0))):
+    root.bind(f"<KeyPress-{key}>", lambda event, d=direction: control.jog_press(d))
+    root.bind(f"<KeyRelease-{key}>", lambda event, d=direction: control.jog_release(d))
 
 # Run main loop
-root.mainloop()
\ No newline at end of file
+root.mainloop()
+control.close()
+if camera_tuner is not None:
+    camera_tuner.stop()
+if frame_recorder is not None:
+    frame_recorder.close()
+if inference_workers is not None:
+    inference_workers.stop()
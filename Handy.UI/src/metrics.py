@@ -0,0 +1,109 @@
+import csv
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from globals import METRICS_WINDOW
+
+
+class StageStats:
+    """
+    Fixed-size ring buffer of (timestamp, seconds) samples for one stage.
+
+    add() takes no lock: every stage has a single writer thread, which fills the
+    slot before advancing count. Readers copy the buffers, so a snapshot taken
+    while a sample is being written can at worst contain one stale slot.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.count = 0
+        self._timestamps = np.zeros(window)
+        self._durations = np.zeros(window)
+
+    def add(self, seconds, timestamp=None):
+        i = self.count % self.window
+        self._durations[i] = seconds
+        self._timestamps[i] = time.perf_counter() if timestamp is None else timestamp
+        self.count += 1
+
+    def samples(self):
+        """(timestamps, durations) currently in the buffer, oldest first."""
+        count = self.count
+        size = min(count, self.window)
+        order = (np.arange(count - size, count)) % self.window
+        return self._timestamps[order], self._durations[order]
+
+    def summary(self):
+        timestamps, durations = self.samples()
+        if not len(durations):
+            return {"count": self.count, "last": 0.0, "mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0, "fps": 0.0}
+        span = timestamps[-1] - timestamps[0]
+        p50, p99 = np.percentile(durations, (50, 99))
+        return {
+            "count": self.count,
+            "last": float(durations[-1]),
+            "mean": float(durations.mean()),
+            "p50": float(p50),
+            "p99": float(p99),
+            "max": float(durations.max()),
+            "fps": float((len(timestamps) - 1) / span) if span > 0 else 0.0,
+        }
+
+
+class Metrics:
+    """Named StageStats shared by the pipeline, detector and serial threads."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.stages = {}
+
+    def stage(self, name):
+        """The StageStats for name, created on first use."""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages.setdefault(name, StageStats(self.window))
+        return stats
+
+    def register(self, name, stats):
+        """Include an existing StageStats (e.g. SerialReader.latency) under name."""
+        self.stages[name] = stats
+        return stats
+
+    def record(self, name, seconds):
+        self.stage(name).add(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(name).add(time.perf_counter() - started)
+
+    def summary(self):
+        return {name: stats.summary() for name, stats in list(self.stages.items())}
+
+    def format_overlay(self, names=None):
+        """One line per stage: rate, p50 and p99 in milliseconds."""
+        summary = self.summary()
+        lines = []
+        for name in names or summary:
+            if name in summary and summary[name]["count"]:
+                s = summary[name]
+                lines.append(f"{name:<12} {s['fps']:5.1f}/s  p50 {s['p50'] * 1000:6.1f}  p99 {s['p99'] * 1000:6.1f} ms")
+        return "\n".join(lines)
+
+    def export_csv(self, path):
+        """Write every buffered sample as stage, timestamp, milliseconds. Returns the row count."""
+        rows = 0
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["stage", "timestamp", "ms"])
+            for name, stats in list(self.stages.items()):
+                timestamps, durations = stats.samples()
+                for timestamp, seconds in zip(timestamps, durations):
+                    writer.writerow([name, f"{timestamp:.6f}", f"{seconds * 1000:.3f}"])
+                    rows += 1
+        return rows
@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Frame:
+    """A frame travelling through the pipeline. image is None when the camera is unavailable."""
+    seq: int
+    captured_at: float
+    image: Any = None
+    distance: int = 0
+    timings: dict = field(default_factory=dict)
+    detections: Any = None  # filled in by an inference pool, None when process() detects itself
+
+
+class LatestSlot:
+    """Single-slot queue where put() replaces any unread item, so stale frames are dropped."""
+
+    def __init__(self):
+        self._item = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.put_count += 1
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Wait for an item and take it; returns None on timeout or after close()."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            return item
+
+    def get_nowait(self):
+        with self._cond:
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class VideoPipeline:
+    """
+    Capture -> inference -> render pipeline joined by LatestSlot queues.
+
+    capture() returns a BGR image or None and runs on its own thread,
+    process(frame) runs on the inference worker and returns the object to
+    render, render(result) is called from poll_render() on the UI thread.
+    Each stage only ever sees the newest output of the previous one, so
+    latency is bounded by the slowest stage rather than the sum of stages.
+    """
+
+    STAGES = ("capture", "inference", "render", "latency")
+
+    def __init__(self, capture, process, render, distance=lambda captured_at: 0, idle_delay=0.1, metrics=None):
+        self.capture = capture
+        self.process = process
+        self.render = render
+        self.distance = distance
+        self.idle_delay = idle_delay
+
+        self.inference_slot = LatestSlot()
+        self.display_slot = LatestSlot()
+        self.metrics = metrics or Metrics()
+        self.stats = {name: self.metrics.stage(name) for name in self.STAGES}
+
+        self._seq = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.inference_slot.close()
+        self.display_slot.close()
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                image = self.capture()
+            except Exception as e:
+                logger.warning("Capture stage error: %s", e)
+                image = None
+            self._seq += 1
+            captured_at = time.perf_counter()
+            frame = Frame(self._seq, captured_at, image, self.distance(captured_at))
+            frame.timings["capture"] = frame.captured_at - started
+            self.stats["capture"].add(frame.timings["capture"])
+            self.inference_slot.put(frame)
+            if image is None:
+                self._stop.wait(self.idle_delay)
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            frame = self.inference_slot.get(timeout=0.5)
+            if frame is not None:
+                self._process_inline(frame)
+
+    def _process_inline(self, frame):
+        recorded = set(frame.timings)
+        started = time.perf_counter()
+        try:
+            result = self.process(frame)
+        except Exception as e:
+            logger.warning("Inference stage error: %s", e)
+            return
+        frame.timings["inference"] = time.perf_counter() - started
+        self.stats["inference"].add(frame.timings["inference"])
+        self._record_timings(frame, recorded | {"inference"})
+        self.display_slot.put((frame, result))
+
+    def _record_timings(self, frame, recorded):
+        for name in frame.timings.keys() - recorded:
+            self.metrics.record(name, frame.timings[name])
+
+    def poll_render(self, timeout=None):
+        """
+        Render the newest processed frame, if any. Call periodically from the UI thread,
+        or with a timeout from a thread of its own to wait for the next frame (daemon.py).
+        """
+        item = self.display_slot.get_nowait() if timeout is None else self.display_slot.get(timeout)
+        if item is None:
+            return False
+        frame, result = item
+        started = time.perf_counter()
+        self.render(result)
+        finished = time.perf_counter()
+        frame.timings["render"] = finished - started
+        self.stats["render"].add(frame.timings["render"])
+        self.stats["latency"].add(finished - frame.captured_at)
+        return True
+
+    def summary(self):
+        """Per-stage timing summaries plus drop counters for each queue."""
+        result = {name: stats.summary() for name, stats in self.stats.items()}
+        result["dropped"] = {
+            "inference": self.inference_slot.dropped,
+            "display": self.display_slot.dropped,
+        }
+        return result
+
+    def format_summary(self):
+        summary = self.summary()
+        parts = [f"{name} {summary[name]['p50'] * 1000:.0f} ms" for name in self.STAGES]
+        dropped = summary["dropped"]
+        parts.append(f"dropped {dropped['inference']}/{dropped['display']}")
+        return ", ".join(parts)
+
+
+class PooledVideoPipeline(VideoPipeline):
+    """
+    VideoPipeline whose detection runs in an inference_pool.InferencePool.
+
+    A dispatch thread hands the newest captured frame to the pool as soon as a
+    shared-memory slot is free, so several frames are in flight at once. A
+    collector thread takes results in capture order, stores them in
+    frame.detections and runs process(frame) for drawing and conversion.
+    "inference" is the time from submission to the pool's result.
+
+    Once the pool reports an error (no worker could load the model, or every
+    worker exited) frames bypass it and process(frame) runs here with
+    frame.detections left None, as in VideoPipeline.
+    """
+
+    def __init__(self, capture, process, render, pool, distance=lambda captured_at: 0, idle_delay=0.1,
+                 metrics=None):
+        super().__init__(capture, process, render, distance, idle_delay, metrics)
+        self.pool = pool
+        self.stats["process"] = self.metrics.stage("process")
+
+    def start(self):
+        super().start()
+        collector = threading.Thread(target=self._collect_loop, name="pool-collector", daemon=True)
+        collector.start()
+        self._threads.append(collector)
+        return self
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            frame = self.inference_slot.get(timeout=0.5)
+            # While every slot is busy newer frames replace this one in inference_slot
+            while frame is not None and not self._stop.is_set():
+                if frame.image is None or self.pool.error is not None:
+                    self._process_inline(frame)
+                    break
+                if self._submit(frame):
+                    break
+                frame = self.inference_slot.get_nowait() or frame
+
+    def _submit(self, frame):
+        """Hand frame to the pool; False when no slot freed up in time. Frames the pool refuses run inline."""
+        frame.timings["submitted"] = time.perf_counter()
+        try:
+            if self.pool.submit(frame.image, tag=frame, timeout=0.1) is not None:
+                return True
+        except Exception as e:
+            logger.warning("Inference pool rejected frame %d: %s", frame.seq, e)
+            del frame.timings["submitted"]
+            self._process_inline(frame)
+            return True
+        del frame.timings["submitted"]
+        return False
+
+    def _collect_loop(self):
+        while not self._stop.is_set():
+            item = self.pool.get(timeout=0.5)
+            if item is None:
+                continue
+            frame, detections, timings = item
+            frame.detections = detections
+            frame.timings["inference"] = time.perf_counter() - frame.timings.pop("submitted")
+            self.stats["inference"].add(frame.timings["inference"])
+            recorded = set(frame.timings)
+            frame.timings.update(timings)  # forward, boxes, nms measured in the worker
+
+            started = time.perf_counter()
+            try:
+                result = self.process(frame)
+            except Exception as e:
+                logger.warning("Process stage error: %s", e)
+                continue
+            frame.timings["process"] = time.perf_counter() - started
+            self.stats["process"].add(frame.timings["process"])
+            self._record_timings(frame, recorded | {"process"})
+            self.display_slot.put((frame, result))
@@ -0,0 +1,255 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from globals import RECORDINGS_FOLDER
+from camera import decode_jpeg
+
+# One fixed-size record per frame in <name>.index; the JPEG bytes are appended
+# unchanged to <name>.frames, so both files can be memory-mapped for replay.
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("timestamp", "<f8"),
+    ("distance", "<i4"),
+])
+
+
+def recording_paths(path):
+    """Return the (.frames, .index) file names for a recording path with or without extension."""
+    base, _ = os.path.splitext(path)
+    return base + ".frames", base + ".index"
+
+
+def new_recording_path(folder=RECORDINGS_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, time.strftime("recording-%Y%m%d-%H%M%S"))
+
+
+class FrameRecorder:
+    """
+    Append-only recorder for raw camera JPEGs. write() can be used directly as a
+    stream listener: it stores the bytes as received, without re-encoding.
+    """
+
+    def __init__(self, path=None, distance=lambda: 0, flush_every=30):
+        self.path = path or new_recording_path()
+        self.distance = distance
+        self.flush_every = flush_every
+        self.frames_written = 0
+        self.bytes_written = 0
+
+        frames_path, index_path = recording_paths(self.path)
+        self._frames = open(frames_path, "ab")
+        self._index = open(index_path, "ab")
+        self._offset = self._frames.tell()
+        self._record = np.zeros(1, dtype=INDEX_DTYPE)
+        self._lock = threading.Lock()
+
+    def write(self, jpeg, timestamp=None):
+        with self._lock:
+            if self._frames.closed:
+                return
+            self._frames.write(jpeg)
+            record = self._record
+            record["offset"] = self._offset
+            record["length"] = len(jpeg)
+            record["timestamp"] = time.time() if timestamp is None else timestamp
+            record["distance"] = self.distance()
+            self._index.write(record.tobytes())
+
+            self._offset += len(jpeg)
+            self.frames_written += 1
+            self.bytes_written += len(jpeg)
+            if self.frames_written % self.flush_every == 0:
+                self._flush()
+
+    def _flush(self):
+        # Data before index, so a crash never leaves an index entry without its bytes
+        self._frames.flush()
+        self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._frames.closed:
+                self._flush()
+                self._frames.close()
+                self._index.close()
+
+
+class Recording:
+    """Read-only, memory-mapped view of a recording."""
+
+    def __init__(self, path):
+        frames_path, index_path = recording_paths(path)
+        self.index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+        # Drop a trailing entry whose bytes did not make it to disk
+        size = os.path.getsize(frames_path)
+        self.index = self.index[self.index["offset"] + self.index["length"] <= size]
+        self.data = np.memmap(frames_path, dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    def jpeg(self, i):
+        """Frame i as a zero-copy view into the mapped file."""
+        offset, length = int(self.index["offset"][i]), int(self.index["length"][i])
+        return self.data[offset:offset + length]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield float(self.index["timestamp"][i]), int(self.index["distance"][i]), self.jpeg(i)
+
+    @property
+    def duration(self):
+        return float(self.index["timestamp"][-1] - self.index["timestamp"][0]) if len(self) > 1 else 0.0
+
+
+class ReplaySource:
+    """
+    Feeds a recording back with the same interface as camera.MjpegStreamClient.
+    speed=1.0 replays at recorded timing, speed=None as fast as consumers take frames.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.recording = Recording(path)
+        self.speed = speed
+        self.loop = loop
+
+        self.frames_received = 0
+        self.connected = False
+        self.distance = 0  # recorded distance of the newest frame
+
+        self._latest = None
+        self._taken = True
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            self._mark_taken()
+            return self._latest
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stop.is_set() or (self._latest is not None and self._latest[0] > after_seq),
+                timeout
+            )
+            if self._latest is not None and self._latest[0] > after_seq:
+                self._mark_taken()
+                return self._latest
+        return None
+
+    def _mark_taken(self):
+        # In max-speed mode the next frame is only published once this one was taken
+        self._taken = True
+        self._cond.notify_all()
+
+    def read_image(self):
+        frame = self.latest()
+        return None if frame is None else decode_jpeg(frame[2])
+
+    def _run(self):
+        self.connected = len(self.recording) > 0
+        while self.connected and not self._stop.is_set():
+            started = time.monotonic()
+            first = None
+            for timestamp, distance, jpeg in self.recording:
+                if self._stop.is_set():
+                    break
+                first = timestamp if first is None else first
+                if self.speed:
+                    delay = (timestamp - first) / self.speed - (time.monotonic() - started)
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                else:
+                    # Max speed: wait until the previous frame has been taken
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._taken or self._stop.is_set())
+                self._publish(jpeg, distance)
+            if not self.loop:
+                break
+        self.connected = False
+
+    def _publish(self, jpeg, distance):
+        with self._cond:
+            self.frames_received += 1
+            self.distance = distance
+            self._latest = (self.frames_received, time.perf_counter(), jpeg)
+            self._taken = False
+            self._cond.notify_all()
+
+
+def benchmark_detector(path, backend=None, limit=None):
+    """
+    Run decode + detection over a recording at maximum speed, frame by frame.
+    Returns throughput and latency percentiles in milliseconds.
+    """
+    import detector
+
+    model = detector.create_detector(backend) if backend else detector.create_detector()
+    recording = Recording(path)
+    count = len(recording) if limit is None else min(limit, len(recording))
+
+    latencies = np.empty(count)
+    started = time.perf_counter()
+    for i in range(count):
+        frame_started = time.perf_counter()
+        model.detect(decode_jpeg(recording.jpeg(i)))
+        latencies[i] = time.perf_counter() - frame_started
+    elapsed = time.perf_counter() - started
+
+    return {
+        "frames": count,
+        "fps": count / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000) if count else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99) * 1000) if count else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Camera recordings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    info = commands.add_parser("info", help="show what a recording contains")
+    info.add_argument("path")
+
+    bench = commands.add_parser("bench", help="benchmark the detector on a recording")
+    bench.add_argument("path")
+    bench.add_argument("--backend", help="detector backend from DETECTOR_MODELS")
+    bench.add_argument("--limit", type=int)
+
+    export = commands.add_parser("export", help="write frames as JPEG files (e.g. for detector.py --frames)")
+    export.add_argument("path")
+    export.add_argument("folder")
+
+    args = parser.parse_args()
+    if args.command == "info":
+        rec = Recording(args.path)
+        size = int(rec.index["length"].sum()) if len(rec) else 0
+        print(f"{len(rec)} frames, {rec.duration:.1f} s, {size / 1e6:.1f} MB")
+    elif args.command == "bench":
+        result = benchmark_detector(args.path, args.backend, args.limit)
+        print(f"{result['frames']} frames: {result['fps']:.1f} FPS, "
+              f"latency p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms")
+    else:
+        os.makedirs(args.folder, exist_ok=True)
+        for i, (_, _, jpeg) in enumerate(Recording(args.path)):
+            with open(os.path.join(args.folder, f"{i:06d}.jpg"), "wb") as f:
+                f.write(jpeg.tobytes())
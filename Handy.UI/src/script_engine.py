@@ -0,0 +1,278 @@
+import bisect
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from globals import SERVO_LIMITS, SERVO_MAX_VELOCITY, SCRIPT_CONTROL_RATE_HZ
+
+# Smoothstep s(u) = 3u^2 - 2u^3 peaks at ds/du = 1.5, so a move of d degrees at
+# velocity limit v needs 1.5 * d / v seconds.
+SMOOTHSTEP_PEAK = 1.5
+
+
+def smoothstep(u):
+    return u * u * (3 - 2 * u)
+
+
+def slew_step(position, velocity, target, max_velocity, max_acceleration, dt):
+    """One updateSlew() step of AllInOne.ino for one servo; returns (position, velocity)."""
+    remaining = target - position
+    if remaining == 0 and velocity == 0:
+        return position, velocity
+    direction = 1 if remaining >= 0 else -1
+    speed = velocity * direction
+    if max_velocity <= 0 or max_acceleration <= 0:
+        speed = abs(remaining) / dt
+    elif speed > 0 and speed * speed / (2 * max_acceleration) >= abs(remaining):
+        speed = max(speed - max_acceleration * dt, max_acceleration * dt)
+    else:
+        speed = min(speed + max_acceleration * dt, max_velocity)
+    step = speed * dt
+    if step >= abs(remaining):
+        return float(target), 0.0
+    return position + direction * step, direction * speed
+
+
+def slew_duration(distance, max_velocity, max_acceleration):
+    """
+    Seconds updateSlew() needs for a move of `distance` degrees from rest: a trapezoid,
+    or a triangle when the move is too short to reach max_velocity. A limit of 0 jumps.
+    """
+    distance = abs(distance)
+    if distance == 0 or max_velocity <= 0 or max_acceleration <= 0:
+        return 0.0
+    if distance <= max_velocity * max_velocity / max_acceleration:
+        return 2 * math.sqrt(distance / max_acceleration)
+    return distance / max_velocity + max_velocity / max_acceleration
+
+
+def clamp_angle(servo, angle):
+    low, high = SERVO_LIMITS[servo]
+    return max(low, min(high, angle))
+
+
+@dataclass
+class Segment:
+    """Simultaneous move of one or more servos, starting at start seconds into the script."""
+    start: float
+    duration: float
+    moves: dict  # servo -> (from_angle, to_angle)
+    dwell: float = 0.0
+
+    @property
+    def end(self):
+        return self.start + self.duration + self.dwell
+
+
+class Trajectory:
+    """Time-parameterized servo trajectory compiled from a command script."""
+
+    def __init__(self, segments, start_angles):
+        self.segments = segments
+        self.start_angles = dict(start_angles)
+        self._starts = [segment.start for segment in segments]
+
+        # Angles held by every servo at the start of each segment
+        self._held = []
+        held = dict(start_angles)
+        for segment in segments:
+            self._held.append(dict(held))
+            for servo, (_, target) in segment.moves.items():
+                held[servo] = target
+        self.final_angles = held
+
+    @property
+    def duration(self):
+        return self.segments[-1].end if self.segments else 0.0
+
+    def sample(self, t):
+        """Return {servo: angle} at t seconds into the script."""
+        index = bisect.bisect_right(self._starts, t) - 1
+        if index < 0:
+            return dict(self.start_angles)
+        if t >= self.duration:
+            return dict(self.final_angles)
+
+        segment = self.segments[index]
+        angles = dict(self._held[index])
+        u = 1.0 if segment.duration <= 0 else min(1.0, (t - segment.start) / segment.duration)
+        s = smoothstep(u)
+        for servo, (start, target) in segment.moves.items():
+            angles[servo] = start + (target - start) * s
+        return angles
+
+    def targets(self, t):
+        """Return {servo: angle} the servos are heading to at t seconds (end of the current move)."""
+        index = bisect.bisect_right(self._starts, t) - 1
+        if index < 0:
+            return dict(self.start_angles)
+        if t >= self.duration:
+            return dict(self.final_angles)
+        angles = dict(self._held[index])
+        for servo, (_, target) in self.segments[index].moves.items():
+            angles[servo] = target
+        return angles
+
+
+def _segment_duration(moves, max_velocity, max_acceleration=None):
+    if max_acceleration is not None:
+        return max((slew_duration(target - start, max_velocity[servo], max_acceleration[servo])
+                    for servo, (start, target) in moves.items()), default=0.0)
+    return max(
+        (abs(target - start) * SMOOTHSTEP_PEAK / max_velocity[servo] for servo, (start, target) in moves.items()),
+        default=0.0
+    )
+
+
+def compile_script(data, start_angles, max_velocity=SERVO_MAX_VELOCITY, max_acceleration=None):
+    """
+    Compile the JSON command script format (see tests/test1.json) into a Trajectory.
+
+    Moves are timed for host-side smoothstep streaming. With max_acceleration (firmware
+    slew) they are timed by the firmware's trapezoid instead, so each move has ended on
+    the board before the next target is sent.
+
+    Consecutive top-level commands are sent at once by the original loader, so they
+    become one simultaneous move (split when a servo repeats). Every step of a
+    "repeatable" sequence is its own move, replacing the fixed one-second sleep with
+    the time the slowest servo needs at its velocity limit. Any command may carry an
+    optional "dwell" in seconds to hold the pose afterwards.
+    """
+    steps = []  # list of ({servo: angle}, dwell)
+    group = {}
+
+    def close_group():
+        if group:
+            steps.append((dict(group), 0.0))
+            group.clear()
+
+    for item in data.get("commands", []):
+        if "servo" in item and "angle" in item:
+            if item["servo"] in group:
+                close_group()
+            group[item["servo"]] = item["angle"]
+            if item.get("dwell"):
+                steps.append((dict(group), float(item["dwell"])))
+                group.clear()
+        elif "repeatable" in item:
+            close_group()
+            repeatable = item["repeatable"]
+            for _ in range(repeatable["repeats"]):
+                for cmd in repeatable["sequence"]:
+                    steps.append(({cmd["servo"]: cmd["angle"]}, float(cmd.get("dwell", 0.0))))
+    close_group()
+
+    segments = []
+    current = dict(start_angles)
+    t = 0.0
+    for targets, dwell in steps:
+        moves = {}
+        for servo, angle in targets.items():
+            angle = clamp_angle(servo, angle)
+            moves[servo] = (current.get(servo, angle), angle)
+            current[servo] = angle
+        segment = Segment(t, _segment_duration(moves, max_velocity, max_acceleration), moves, dwell)
+        segments.append(segment)
+        t = segment.end
+    return Trajectory(segments, start_angles)
+
+
+def load_script(filename, start_angles, max_velocity=SERVO_MAX_VELOCITY, max_acceleration=None):
+    with open(filename, "r") as file:
+        return compile_script(json.load(file), start_angles, max_velocity, max_acceleration)
+
+
+class TrajectoryExecutor:
+    """
+    Streams trajectory setpoints at a fixed control rate from a background thread.
+
+    send({servo: angle}) receives only servos whose rounded angle changed since
+    the previous tick. on_finished(completed) is called when the script ends or
+    is aborted. With firmware_slew the firmware interpolates, so only the target
+    of each move is sent, once, when the move starts.
+    """
+
+    def __init__(self, trajectory, send, rate_hz=SCRIPT_CONTROL_RATE_HZ, on_finished=None, firmware_slew=False):
+        self.trajectory = trajectory
+        self.send = send
+        self.rate_hz = rate_hz
+        self.on_finished = on_finished
+        self.firmware_slew = firmware_slew
+
+        self._elapsed = 0.0
+        self._resume = threading.Event()
+        self._resume.set()
+        self._abort = threading.Event()
+        self._thread = None
+        self._last_sent = {}
+
+    @property
+    def progress(self):
+        """Fraction of the script already executed, 0..1."""
+        duration = self.trajectory.duration
+        return 1.0 if duration <= 0 else min(1.0, self._elapsed / duration)
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="script-executor", daemon=True)
+        self._thread.start()
+        return self
+
+    def pause(self):
+        self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    def abort(self):
+        self._abort.set()
+        self._resume.set()
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        previous = time.monotonic()
+        next_tick = previous
+        while not self._abort.is_set():
+            if not self._resume.is_set():
+                self._resume.wait()
+                previous = next_tick = time.monotonic()  # paused time does not advance the script
+                continue
+
+            now = time.monotonic()
+            self._elapsed += now - previous
+            previous = now
+            if self.firmware_slew:
+                self._tick(self.trajectory.targets(self._elapsed))
+            else:
+                self._tick(self.trajectory.sample(self._elapsed))
+            if self._elapsed >= self.trajectory.duration:
+                break
+
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._abort.wait(delay)
+            else:
+                next_tick = time.monotonic()  # fell behind, don't try to catch up with a burst
+
+        if self.on_finished:
+            self.on_finished(not self._abort.is_set())
+
+    def _tick(self, angles):
+        changed = {}
+        for servo, angle in angles.items():
+            angle = int(round(angle))
+            if self._last_sent.get(servo) != angle:
+                changed[servo] = angle
+        if changed:
+            self._last_sent.update(changed)
+            self.send(changed)
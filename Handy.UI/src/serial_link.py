@@ -0,0 +1,535 @@
+import argparse
+import collections
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from globals import SERVO_WRITE_RATE_HZ, SERIAL_EVENT_QUEUE_SIZE
+from metrics import StageStats
+
+logger = logging.getLogger(__name__)
+
+# Binary frame understood by AllInOne.ino: header, servo bitmask, one byte per angle, checksum.
+# Angles are at most 180 and text commands are ASCII, so the header byte never appears otherwise.
+FRAME_HEADER = 0xFF
+SERVO_COUNT = 6
+PROTOCOL_VERSION = 5
+SLEW_PROTOCOL_VERSION = 3  # firmware interpolates towards targets, limits set with VEL/ACC
+RANGING_PROTOCOL_VERSION = 4  # interrupt-timed ranging, rate set with RANGE
+POWER_PROTOCOL_VERSION = 5  # INA3221 "Power:" lines (POWER <hz>) and STOP
+SUPPORTED_BAUDRATES = (9600, 19200, 38400, 57600, 115200)
+
+
+def encode_text_commands(targets):
+    """Encode {servo: angle} as the AllInOne.ino text protocol, one "<servo> <angle>" line per servo."""
+    return "".join(f"{servo} {angle}\n" for servo, angle in sorted(targets.items())).encode()
+
+
+def encode_binary_commands(targets):
+    """Encode {servo: angle} as one binary frame; six servos fit in 9 bytes."""
+    mask = 0
+    angles = bytearray()
+    for servo in range(SERVO_COUNT):
+        if servo in targets:
+            mask |= 1 << servo
+            angles.append(max(0, min(180, int(targets[servo]))))
+    checksum = (mask + sum(angles)) & 0xFF
+    return bytes((FRAME_HEADER, mask)) + bytes(angles) + bytes((checksum,))
+
+
+PROTOCOLS = {
+    "text": encode_text_commands,
+    "binary": encode_binary_commands,
+}
+
+
+class CommandParser:
+    """
+    Host-side mirror of the AllInOne.ino command reader: feed() it raw bytes and
+    it returns the (servo, angle) commands they contain, in order. Used by the
+    loopback benchmark and the hardware simulator.
+    """
+
+    def __init__(self):
+        self.line = bytearray()
+        self.frame = None
+        self.errors = 0
+        self.last_error = None  # firmware wording of the newest frame error
+        self.lines = []  # non-servo text lines (HELLO, BAUD ...), for the caller to handle
+
+    def feed(self, data):
+        commands = []
+        for b in data:
+            if self.frame is not None:
+                self._feed_frame_byte(b, commands)
+            elif b == FRAME_HEADER:
+                self.frame = bytearray()
+            elif b == 0x0A:
+                self._handle_line(self.line.decode(errors="replace"), commands)
+                self.line.clear()
+            elif b != 0x0D and len(self.line) < 31:
+                self.line.append(b)
+        return commands
+
+    def _feed_frame_byte(self, b, commands):
+        frame = self.frame
+        frame.append(b)
+        mask = frame[0]
+        if mask & ~0x3F or mask == 0:
+            self.frame = None
+            self.errors += 1
+            self.last_error = "Bad frame mask."
+            return
+        if len(frame) < 2 + bin(mask).count("1"):
+            return
+        self.frame = None
+        if sum(frame[:-1]) & 0xFF != frame[-1]:
+            self.errors += 1
+            self.last_error = "Bad frame checksum."
+            return
+        angles = iter(frame[1:-1])
+        for servo in range(SERVO_COUNT):
+            if mask & (1 << servo):
+                commands.append((servo, next(angles)))
+
+    def _handle_line(self, line, commands):
+        servo, separator, angle = line.partition(" ")
+        if separator and servo.strip().lstrip("-").isdigit():
+            try:
+                commands.append((int(servo), int(angle)))
+                return
+            except ValueError:
+                pass
+        self.lines.append(line)
+
+
+def _read_ack(ser, expected, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        line = ser.readline().decode(errors="replace").strip()
+        if line.startswith(expected):
+            return line
+    return None
+
+
+def negotiate(ser, baudrate=115200, hello_timeout=3.0):
+    """
+    Negotiate the protocol with the firmware on a freshly opened port.
+
+    Returns (protocol, version): "binary" and the version from the HELLO
+    answer (switching to baudrate when the firmware also acknowledged BAUD and
+    answered HELLO again at the new rate), or ("text", 0) for older firmware,
+    which stays on the original baud rate.
+    """
+    original_timeout = ser.timeout
+    ser.timeout = 0.2
+    try:
+        # Opening the port resets an Uno, so keep asking while the bootloader runs
+        version = _retry_hello(ser, hello_timeout)
+        if not version:
+            return "text", 0
+        if baudrate == ser.baudrate or baudrate not in SUPPORTED_BAUDRATES:
+            return "binary", version
+
+        default_baudrate = ser.baudrate
+        ser.write(f"BAUD {baudrate}\n".encode())
+        if _read_ack(ser, "Ack: BAUD", 1.0) is None:
+            return "binary", version
+        time.sleep(0.05)
+        ser.baudrate = baudrate
+        ser.reset_input_buffer()
+        if not _retry_hello(ser, 1.0):
+            # Firmware falls back to the default rate on its own when HELLO never arrives
+            ser.baudrate = default_baudrate
+            time.sleep(2.1)
+            ser.reset_input_buffer()
+            version = _retry_hello(ser, 1.0)
+            return ("binary", version) if version else ("text", 0)
+        return "binary", version
+    finally:
+        ser.timeout = original_timeout
+
+
+def _retry_hello(ser, timeout):
+    """Send HELLO until it is acknowledged; returns the firmware protocol version, 0 without an answer."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ser.write(b"HELLO\n")
+        ack = _read_ack(ser, "Ack: HELLO", 0.3)
+        if ack is not None:
+            version = ack[len("Ack: HELLO"):].strip()
+            return int(version) if version.isdigit() else 2
+    return 0
+
+
+def configure_slew(ser, max_velocity, max_acceleration, timeout=1.0):
+    """
+    Send per-servo velocity (deg/s) and acceleration (deg/s^2) limits to firmware
+    with SLEW_PROTOCOL_VERSION, before the reader thread owns the port.
+    Returns True when every limit was acknowledged.
+    """
+    acknowledged = True
+    for command, limits in (("VEL", max_velocity), ("ACC", max_acceleration)):
+        for servo, limit in enumerate(limits):
+            acknowledged &= _send_setting(ser, f"{command} {servo} {limit:g}", timeout)
+    return acknowledged
+
+
+def configure_ranging(ser, rate_hz, timeout=1.0):
+    """Set the ultrasonic ranging rate of firmware with RANGING_PROTOCOL_VERSION; 0 stops ranging."""
+    return _send_setting(ser, f"RANGE {int(rate_hz)}", timeout)
+
+
+def configure_power(ser, rate_hz, timeout=1.0):
+    """Start INA3221 telemetry on firmware with POWER_PROTOCOL_VERSION; False when the sensor is missing."""
+    return _send_setting(ser, f"POWER {int(rate_hz)}", timeout)
+
+
+def _send_setting(ser, line, timeout):
+    """Send one setting line and wait for the firmware to echo it back as "Ack: <line>"."""
+    original_timeout = ser.timeout
+    ser.timeout = 0.2
+    try:
+        ser.write(f"{line}\n".encode())
+        if _read_ack(ser, f"Ack: {line}", timeout) is None:
+            logger.warning("Firmware did not acknowledge %r", line)
+            return False
+        return True
+    finally:
+        ser.timeout = original_timeout
+
+
+class ServoCommandWriter:
+    """
+    Background serial writer that keeps only the latest target per servo.
+
+    submit() never blocks the caller: it replaces any unsent target for the
+    servo. A flush thread sends all pending servos in one write at most
+    rate_hz times per second, and never faster than the baud rate can drain
+    the previous write. Targets equal to the last sent angle are skipped.
+    """
+
+    def __init__(self, port=None, baudrate=9600, rate_hz=SERVO_WRITE_RATE_HZ, encode=encode_text_commands,
+                 history_size=3):
+        self.port = port
+        self.baudrate = baudrate
+        self.rate_hz = rate_hz
+        self.encode = encode
+        self.history_size = history_size
+
+        self.pending = {}
+        self.last_sent = {}
+        self.history = {}  # servo -> last few angles actually sent
+        self.write_time = StageStats()  # duration of port.write(), seconds
+
+        self.counters = {
+            "submitted": 0,
+            "dropped": 0,  # targets replaced by a newer one before they were sent
+            "skipped": 0,  # targets equal to the last sent angle
+            "writes": 0,
+            "commands_sent": 0,
+            "bytes_sent": 0,
+            "write_errors": 0,
+            "max_queue_depth": 0,
+        }
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._next_write = 0.0
+        self._write_lock = threading.Lock()
+        self._halts = 0  # bumped by halt(): batches taken before it are never written after STOP
+        self._thread = None
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self.pending)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="servo-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        if flush:
+            self.flush()
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def submit(self, servo, angle):
+        """Queue a target angle for a servo, replacing any target not yet sent."""
+        angle = int(angle)
+        with self._cond:
+            self.counters["submitted"] += 1
+            if servo in self.pending:
+                self.counters["dropped"] += 1
+            if self.last_sent.get(servo) == angle:
+                self.pending.pop(servo, None)
+                self.counters["skipped"] += 1
+                return
+            self.pending[servo] = angle
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], len(self.pending))
+            self._cond.notify_all()
+
+    def halt(self, data=b"STOP\n"):
+        """
+        Drop every pending target and write data (the firmware STOP command) right
+        away, ahead of the rate limit. Safe to call from any thread.
+        """
+        with self._cond:
+            self.counters["dropped"] += len(self.pending)
+            self.pending = {}
+            self.last_sent.clear()  # the firmware now holds other angles than the ones sent
+            self._halts += 1
+        with self._write_lock:
+            port = self.port
+            if not (port and port.is_open):
+                return
+            try:
+                port.write(data)
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                logger.error("Error writing to serial: %s", e)
+
+    def reset(self):
+        """Forget sent angles, e.g. after reopening the port, so the next targets are always sent."""
+        with self._cond:
+            self.last_sent.clear()
+
+    def flush(self):
+        """Send everything pending right now on the caller's thread."""
+        with self._cond:
+            batch, self.pending, halts = self.pending, {}, self._halts
+        if batch:
+            self._write(batch, halts)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self.pending or self._stop.is_set())
+                if self._stop.is_set():
+                    return
+            delay = self._next_write - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            with self._cond:
+                batch, self.pending, halts = self.pending, {}, self._halts
+            if batch:
+                self._write(batch, halts)
+
+    def _write(self, batch, halts):
+        with self._write_lock:
+            if halts != self._halts:
+                self.counters["dropped"] += len(batch)
+                return
+            self._write_locked(batch)
+
+    def _write_locked(self, batch):
+        port = self.port
+        if not (port and port.is_open):
+            return
+        data = self.encode(batch)
+        started = time.perf_counter()
+        try:
+            port.write(data)
+        except Exception as e:
+            self.counters["write_errors"] += 1
+            logger.error("Error writing to serial: %s", e)
+            return
+        self.write_time.add(time.perf_counter() - started)
+
+        # 10 bits per byte on the wire (start + 8 data + stop)
+        drain_time = len(data) * 10 / self.baudrate
+        self._next_write = time.monotonic() + max(1.0 / self.rate_hz, drain_time)
+
+        with self._cond:
+            self.counters["writes"] += 1
+            self.counters["commands_sent"] += len(batch)
+            self.counters["bytes_sent"] += len(data)
+            for servo, angle in batch.items():
+                self.last_sent[servo] = angle
+                history = self.history.setdefault(servo, [])
+                history.append(angle)
+                if len(history) > self.history_size:
+                    history.pop(0)
+        logger.debug("Sent to serial: %s", batch)
+
+
+@dataclass
+class SerialEvent:
+    """A parsed line from the firmware. kind is distance, power, info, error, ack or unknown."""
+    kind: str
+    text: str
+    value: object = None
+    received_at: float = 0.0
+
+
+EVENT_PREFIXES = (
+    ("Distance: ", "distance"),
+    ("Power: ", "power"),
+    ("Message: ", "info"),
+    ("Error: ", "error"),
+    ("Ack: ", "ack"),
+)
+
+
+def parse_line(line, received_at=0.0):
+    """Turn one firmware line into a SerialEvent."""
+    for prefix, kind in EVENT_PREFIXES:
+        if line.startswith(prefix):
+            text = line[len(prefix):].strip() or "No details"
+            value = None
+            try:
+                if kind == "distance":
+                    value = int(text)
+                elif kind == "power":
+                    value = tuple(int(v) for v in text.split())  # bus mV, mA per INA3221 channel
+            except ValueError:
+                return SerialEvent("unknown", line, None, received_at)
+            return SerialEvent(kind, text, value, received_at)
+    return SerialEvent("unknown", line, None, received_at)
+
+
+class SerialReader:
+    """
+    Dedicated thread that blocks on the port, parses lines into SerialEvents
+    and hands them to the UI in batches.
+
+    Events go into a bounded queue (the oldest are dropped when it is full).
+    notify() is called once when the queue goes from empty to non-empty, so the
+    UI can schedule a single drain() instead of polling on a timer.
+    on_event(event), if given, sees every event first on the reader thread,
+    for telemetry that must not wait for the UI.
+    """
+
+    def __init__(self, port, notify, max_queue=SERIAL_EVENT_QUEUE_SIZE, on_event=None):
+        self.port = port
+        self.notify = notify
+        self.on_event = on_event
+        self.events = collections.deque(maxlen=max_queue)
+        self.latency = StageStats()  # line received -> drained by the UI, seconds
+        self.counters = {"lines": 0, "dropped": 0, "batches": 0, "read_errors": 0, "max_backlog": 0}
+
+        self._lock = threading.Lock()
+        self._notified = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def backlog(self):
+        """Events waiting for the UI plus bytes still waiting in the OS serial buffer."""
+        with self._lock:
+            pending = len(self.events)
+        try:
+            waiting = self.port.in_waiting
+        except Exception:
+            waiting = 0
+        return {"events": pending, "bytes": waiting}
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="serial-reader", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                raw = self.port.readline()
+            except Exception as e:
+                if not self._stop.is_set():
+                    self.counters["read_errors"] += 1
+                    logger.error("Error reading data: %s", e)
+                return
+            if not raw:
+                continue  # read timeout, lets stop() take effect
+            event = parse_line(raw.decode("utf-8", errors="replace").strip(), time.perf_counter())
+            if self.on_event is not None:
+                self.on_event(event)
+            self._push(event)
+
+    def _push(self, event):
+        with self._lock:
+            self.counters["lines"] += 1
+            if len(self.events) == self.events.maxlen:
+                self.counters["dropped"] += 1
+            self.events.append(event)
+            self.counters["max_backlog"] = max(self.counters["max_backlog"], len(self.events))
+            should_notify = not self._notified
+            self._notified = True
+        if should_notify:
+            self.notify()
+
+    def drain(self):
+        """Take every queued event. Call from the UI thread after notify()."""
+        with self._lock:
+            batch = list(self.events)
+            self.events.clear()
+            self._notified = False
+            self.counters["batches"] += 1
+        now = time.perf_counter()
+        for event in batch:
+            self.latency.add(now - event.received_at)
+        return batch
+
+
+class LoopbackSerial:
+    """
+    Fake serial port that feeds written bytes into a CommandParser and keeps
+    the time the bytes would need on a real wire at the configured baud rate.
+    """
+
+    def __init__(self, baudrate=9600):
+        self.baudrate = baudrate
+        self.is_open = True
+        self.parser = CommandParser()
+        self.commands_received = 0
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        self.commands_received += len(self.parser.feed(data))
+        return len(data)
+
+    @property
+    def wire_time(self):
+        return self.bytes_written * 10 / self.baudrate
+
+
+def benchmark_protocols(updates=2000, servos=SERVO_COUNT, baudrates=(9600, 115200)):
+    """
+    Push the same stream of full-arm updates through both encoders and report
+    servo commands per second, limited by whichever is slower: the host or the wire.
+    """
+    results = {}
+    for protocol, encode in PROTOCOLS.items():
+        for baudrate in baudrates:
+            port = LoopbackSerial(baudrate)
+            started = time.perf_counter()
+            for i in range(updates):
+                port.write(encode({servo: (i + servo) % 180 for servo in range(servos)}))
+            host_time = time.perf_counter() - started
+            assert port.commands_received == updates * servos and port.parser.errors == 0
+            results[(protocol, baudrate)] = {
+                "bytes_per_update": port.bytes_written / updates,
+                "commands_per_sec": port.commands_received / max(host_time, port.wire_time),
+            }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serial protocol loopback benchmark")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--servos", type=int, default=SERVO_COUNT)
+    args = parser.parse_args()
+
+    for (protocol, baudrate), result in benchmark_protocols(args.updates, args.servos).items():
+        print(f"{protocol:>6} @ {baudrate:>6} baud: {result['bytes_per_update']:5.1f} bytes/update, "
+              f"{result['commands_per_sec']:8.0f} servo commands/s")
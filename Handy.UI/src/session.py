@@ -0,0 +1,361 @@
+import argparse
+import logging
+import threading
+import time
+
+import cv2
+
+from globals import (CAMERA_URL, CAMERA_REPLAY, CAMERA_AUTO_TUNE, DETECTOR_MOTION_GATING, DETECTOR_BATCH_WAIT,
+                     DAEMON_STREAM_QUALITY, ARM_SESSIONS)
+import arm
+import camera
+import camera_tuning
+import controller
+import detector
+import helpers
+import metrics
+import pipeline
+import recorder
+import tracking
+
+logger = logging.getLogger(__name__)
+
+
+class VideoService:
+    """
+    Video path of one arm's camera: stream (or a recording) -> detection -> annotated
+    JPEG. Frames are tagged with the arm's distance reading closest to their arrival.
+
+    Standalone it runs its own VideoPipeline and detector. With standalone=False
+    it only provides the camera side, next_frame() and annotate(), for a
+    BatchedInference shared by several cameras.
+
+    on_detections(event) gets the boxes of every frame; publish(jpeg) gets the
+    annotated frame, which is only drawn and encoded while viewers > 0.
+    """
+
+    def __init__(self, arm_controller, app_metrics, camera_url=CAMERA_URL, replay=CAMERA_REPLAY, detect=True,
+                 standalone=True, quality=DAEMON_STREAM_QUALITY):
+        self.arm = arm_controller
+        self.metrics = app_metrics
+        self.camera_url = camera_url
+        self.replay = replay
+        self.detect = detect and standalone
+        self.standalone = standalone
+        self.quality = quality
+        self.publish = lambda jpeg: None
+        self.on_detections = lambda event: None
+
+        self.viewers = 0
+        self.stream = None
+        self.tuner = None
+        self.model = None
+        self.class_names = []
+        self.status = {"camera": "searching", "model": "loading" if self.detect else "off"}
+        self.pipeline = None
+        if standalone:
+            self.pipeline = pipeline.VideoPipeline(self._capture, self._process, self._render,
+                                                   distance=self._distance, metrics=app_metrics)
+
+        self._last_seq = 0
+        self._last_time = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.pipeline is not None:
+            self.pipeline.start()
+            threading.Thread(target=self._render_loop, name="video-publish", daemon=True).start()
+        if self.detect:
+            threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+        if self.replay:
+            self.stream = recorder.ReplaySource(self.replay, loop=True).start()
+            self.status["camera"] = f"replaying {self.replay}"
+        else:
+            threading.Thread(target=self._connect_camera, name="camera-discovery", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.tuner is not None:
+            self.tuner.stop()
+        if self.stream is not None:
+            self.stream.stop()
+
+    def _load_model(self):
+        try:
+            names = detector.load_class_names()
+            model = detector.create_detector()
+        except Exception as e:
+            logger.error("Could not load detector: %s", e)
+            self.status["model"] = "failed, detection disabled"
+            return
+        self.class_names = names
+        self.model = tracking.InferenceScheduler(model) if DETECTOR_MOTION_GATING else model
+        self.status["model"] = f"{model.name} ready"
+
+    def _connect_camera(self):
+        url = self.camera_url or helpers.find_esp32_camera()
+        stream_url = camera.stream_url_from_capture_url(url)
+        if stream_url is None:
+            self.status["camera"] = "not found"
+            return
+        self.camera_url = url
+        self.stream = camera.MjpegStreamClient(stream_url).start()
+        self.status["camera"] = url
+        if CAMERA_AUTO_TUNE:
+            self.tuner = camera_tuning.CameraTuner(camera_tuning.camera_base_url(url), self.stream, self.metrics).start()
+
+    def _capture(self, timeout=1.0):
+        self._last_time = None
+        if self.stream is None or not self.stream.connected:
+            return None
+        with self.metrics.timed("fetch"):
+            frame = self.stream.wait_for_frame(self._last_seq, timeout=timeout)
+        if frame is None:
+            return None
+        self._last_seq, self._last_time = frame[0], frame[1]
+        with self.metrics.timed("jpeg"):
+            return camera.decode_jpeg(frame[2])
+
+    def _distance(self, captured_at):
+        if isinstance(self.stream, recorder.ReplaySource):
+            return self.stream.distance
+        distance = self.arm.distance_history.nearest(self._last_time or captured_at)
+        return self.arm.current_distance if distance is None else int(distance[0])
+
+    def next_frame(self, timeout):
+        """The next unseen camera frame, decoded and tagged like a pipeline capture, or None."""
+        started = time.perf_counter()
+        image = self._capture(timeout)
+        if image is None:
+            return None
+        captured_at = time.perf_counter()
+        frame = pipeline.Frame(self._last_seq, captured_at, image, self._distance(captured_at))
+        frame.timings["capture"] = captured_at - started
+        return frame
+
+    def annotate(self, frame, detections):
+        """Report the frame's boxes and return the annotated JPEG, or None without viewers."""
+        self.on_detections({"type": "detections", "distance": frame.distance, "objects": [
+            {"class": self.class_names[class_id], "confidence": round(float(confidence), 3),
+             "box": [int(v) for v in box]}
+            for class_id, confidence, box in detections
+        ]})
+        if not self.viewers:
+            return None
+        image = detector.draw_detections(frame.image, detections, self.class_names, frame.distance)
+        started = time.perf_counter()
+        jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes()
+        frame.timings["encode"] = time.perf_counter() - started
+        return jpeg
+
+    def _process(self, frame):
+        if frame.image is None:
+            return None
+        detections = self.model.detect(frame.image, frame.timings) if self.model is not None else []
+        return self.annotate(frame, detections)
+
+    def _render(self, jpeg):
+        if jpeg is not None:
+            self.publish(jpeg)
+
+    def _render_loop(self):
+        while not self._stop.is_set():
+            self.pipeline.poll_render(timeout=0.5)
+
+
+class ArmSession:
+    """
+    One arm of the cell: its serial link, arm model and motion/telemetry state (an
+    ArmController) and its own camera (a VideoService). Sessions share no state, so
+    one process can run any number of them; with batched=True the cameras share one
+    detector through BatchedInference instead of each running its own.
+    """
+
+    def __init__(self, name, serial_port=None, camera_url=None, replay=None, video=True, detect=True,
+                 batched=False):
+        self.name = name
+        self.serial_port = serial_port
+        self.metrics = metrics.Metrics()
+        self.arm = controller.ArmController(arm.ArmModel(), app_metrics=self.metrics)
+        self.video = None
+        if video:
+            self.video = VideoService(self.arm, self.metrics, camera_url, replay, detect=detect,
+                                      standalone=not batched)
+
+    def start(self):
+        if self.serial_port:
+            self.arm.open_port(self.serial_port)
+        if self.video is not None:
+            self.video.start()
+        return self
+
+    def stop(self):
+        if self.video is not None:
+            self.video.stop()
+        self.arm.close()
+
+
+def create_sessions(configs=ARM_SESSIONS, detect=True):
+    """ArmSessions from ARM_SESSIONS-style dicts; several cameras share a BatchedInference (None otherwise)."""
+    videos = sum(1 for config in configs if config.get("camera") or config.get("replay"))
+    batched = detect and videos > 1
+    sessions = {}
+    for config in configs:
+        name = config["name"]
+        if name in sessions:
+            raise ValueError(f"Two arms are called {name!r}")
+        has_camera = bool(config.get("camera") or config.get("replay"))
+        sessions[name] = ArmSession(name, config.get("serial"), config.get("camera"), config.get("replay"),
+                                    video=has_camera, detect=detect, batched=batched)
+    inference = None
+    if batched:
+        inference = BatchedInference([session.video for session in sessions.values() if session.video is not None])
+    return sessions, inference
+
+
+class BatchedInference:
+    """
+    One detector for the cameras of every session. Each round takes the next frame
+    of each camera, waiting at most batch_wait in total, and runs the network once
+    for the whole batch (Detector.detect_batch: one blobFromImages/net.forward).
+    With motion gating each camera keeps its own InferenceScheduler, and cameras
+    whose scene is still or tracked stay out of the batch.
+    """
+
+    def __init__(self, services, batch_wait=DETECTOR_BATCH_WAIT, motion_gating=DETECTOR_MOTION_GATING,
+                 idle_delay=0.1, app_metrics=None):
+        self.services = services
+        self.batch_wait = batch_wait
+        self.motion_gating = motion_gating
+        self.idle_delay = idle_delay
+        self.metrics = app_metrics or metrics.Metrics()
+
+        self.model = None
+        self.schedulers = {}
+        self.status = "loading"
+        self.counters = {"rounds": 0, "frames": 0, "forwards": 0, "forward_frames": 0}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="batched-inference", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def use_model(self, model, class_names):
+        """Share a detector between the cameras (normally loaded by the inference thread)."""
+        self.model = model
+        for service in self.services:
+            service.class_names = class_names
+            service.status["model"] = f"{model.name}, batched over {len(self.services)} cameras"
+            if self.motion_gating:
+                self.schedulers[service] = tracking.InferenceScheduler(model)
+        self.status = f"{model.name} ready"
+
+    def _load_model(self):
+        try:
+            self.use_model(detector.create_detector(), detector.load_class_names())
+        except Exception as e:
+            logger.error("Could not load detector: %s", e)
+            self.status = "failed, detection disabled"
+            for service in self.services:
+                service.status["model"] = self.status
+
+    def _run(self):
+        if self.model is None:
+            self._load_model()
+        while not self._stop.is_set():
+            frames = self._collect()
+            if not frames:
+                self._stop.wait(self.idle_delay)  # every camera is down
+                continue
+            self.process(frames)
+
+    def _collect(self):
+        deadline = time.perf_counter() + self.batch_wait
+        frames = []
+        for service in self.services:
+            frame = service.next_frame(timeout=max(0.0, deadline - time.perf_counter()))
+            if frame is not None:
+                frames.append((service, frame))
+        return frames
+
+    def process(self, frames):
+        """Detect on [(service, frame)] with at most one forward pass, then annotate and publish each frame."""
+        self.counters["rounds"] += 1
+        self.counters["frames"] += len(frames)
+        results = {}
+        pending = []
+        for service, frame in frames:
+            scheduler = self.schedulers.get(service)
+            detections = scheduler.reuse(frame.image, frame.timings) if scheduler is not None else None
+            if detections is None and self.model is not None:
+                pending.append((service, frame))
+            else:
+                results[service] = detections or []
+
+        if pending:
+            timings = {}
+            started = time.perf_counter()
+            batch = self.model.detect_batch([frame.image for _, frame in pending], timings)
+            self.metrics.record("batch", time.perf_counter() - started)
+            for name, seconds in timings.items():
+                self.metrics.record(name, seconds)
+            self.counters["forwards"] += 1
+            self.counters["forward_frames"] += len(pending)
+            for (service, frame), detections in zip(pending, batch):
+                scheduler = self.schedulers.get(service)
+                results[service] = scheduler.accept(frame.image, detections) if scheduler is not None else detections
+
+        for service, frame in frames:
+            jpeg = service.annotate(frame, results[service])
+            service.metrics.record("latency", time.perf_counter() - frame.captured_at)
+            if jpeg is not None:
+                service.publish(jpeg)
+
+
+def benchmark_batching(frames_per_camera, cameras, backend=None, warmup=2):
+    """
+    Time the detector on `cameras` copies of a frame set: one forward per frame against one
+    batched forward per round. Returns ms per round for both and the speedup.
+    """
+    model = detector.create_detector(backend) if backend else detector.create_detector()
+    rounds = [[frame] * cameras for frame in frames_per_camera]
+    for images in rounds[:warmup]:
+        model.detect_batch(images)
+
+    started = time.perf_counter()
+    for images in rounds:
+        for image in images:
+            model.detect(image)
+    single = (time.perf_counter() - started) / len(rounds)
+
+    started = time.perf_counter()
+    for images in rounds:
+        model.detect_batch(images)
+    batched = (time.perf_counter() - started) / len(rounds)
+    return {"model": model.name, "cameras": cameras, "single_ms": single * 1000, "batched_ms": batched * 1000,
+            "speedup": single / batched}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched cross-camera inference benchmark")
+    parser.add_argument("--frames", required=True, help="folder with .jpg frames (e.g. recorder.py export)")
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend")
+    parser.add_argument("--limit", type=int, default=30)
+    args = parser.parse_args()
+
+    frame_set = detector.load_frames(args.frames, args.limit)
+    for count in args.cameras:
+        result = benchmark_batching(frame_set, count, args.backend)
+        print(f"{result['model']}, {count} cameras: {result['single_ms']:.0f} ms per round one by one, "
+              f"{result['batched_ms']:.0f} ms batched ({result['speedup']:.2f}x)")
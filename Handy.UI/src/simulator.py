@@ -0,0 +1,559 @@
+import argparse
+import bisect
+import collections
+import http.server
+import json
+import math
+import os
+import random
+import re
+import select
+import threading
+import time
+import tty
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+from globals import (SERVO_LIMITS, SERVO_MAX_VELOCITY, SERVO_MAX_ACCELERATION, SIMULATOR_HTTP_PORT,
+                     SIMULATOR_STREAM_PORT)
+from serial_link import CommandParser, SUPPORTED_BAUDRATES, PROTOCOL_VERSION
+from recorder import Recording
+from camera_tuning import FRAMESIZES
+from script_engine import slew_step
+
+# Same values as AllInOne.ino
+DEFAULT_BAUD = 9600
+BAUD_CONFIRM_TIMEOUT = 2.0
+ULTRASONIC_PERIOD = 0.05  # RANGING_DEFAULT_HZ
+RANGING_MAX_HZ = 25
+RANGING_MEDIAN = 5
+RANGING_MISSES_DISCONNECTED = 20
+POWER_MAX_HZ = 50
+# Simulated INA3221: servos 0-2 on channel 0, 3-5 on channel 1, the board on channel 2
+POWER_RAILS = ((0, 1, 2), (3, 4, 5), ())
+POWER_IDLE_MA = (150, 60, 80)
+POWER_MA_PER_DEG_S = (8.0, 3.0, 0.0)
+POWER_SUPPLY_MV = 5000
+POWER_SOURCE_OHMS = 0.25
+SLEW_PERIOD = 0.01
+
+PART_BOUNDARY = "123456789000000000000987654321"
+
+
+def synthetic_distance(t):
+    """Slowly moving object between 10 and 40 cm."""
+    return int(25 + 15 * math.sin(t / 4))
+
+
+def loop_period(offsets):
+    """Length of one loop over frames at `offsets` seconds: the last frame lasts one average frame period."""
+    return offsets[-1] + (offsets[-1] / max(1, len(offsets) - 1) or 0.04)
+
+
+def recorded_distance(recording):
+    """distance(t) replaying a recording's readings on the frame timestamps FakeCamera plays them at."""
+    offsets = (recording.index["timestamp"] - recording.index["timestamp"][0]).tolist()
+    distances = recording.index["distance"]
+    period = loop_period(offsets)
+
+    def distance(t):
+        return int(distances[max(0, bisect.bisect_right(offsets, t % period) - 1)])
+    return distance
+
+
+def _atof(text):
+    match = re.match(r"\s*[-+]?(\d+\.?\d*|\.\d+)", text)
+    return float(match.group(0)) if match else 0.0
+
+
+def _atoi(text):
+    """C atoi(): leading integer of the string, 0 if there is none."""
+    text = text.lstrip()
+    end = 1 if text[:1] in ("-", "+") else 0
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    try:
+        return int(text[:end])
+    except ValueError:
+        return 0
+
+
+class FakeArduino:
+    """
+    Pseudo-terminal that behaves like AllInOne.ino (POSIX only).
+
+    Open port_name with pyserial like a real board. Bytes are delivered at the
+    current baud rate in both directions, text and binary commands are checked
+    against SERVO_LIMITS with the firmware's error lines, HELLO/BAUD negotiation
+    works including the fallback to 9600, servos slew to their targets with the
+    VEL/ACC limits like updateSlew(), and the ultrasonic sensor reports
+    the median of distance(t) every ultrasonic_period seconds (RANGE <hz> changes
+    it, 0 stops it), INA3221 "Power:" lines follow the servo speeds once POWER
+    <hz> is sent (stall() adds a stall current) and STOP holds every servo.
+    A distance of 0 means no echo;
+    dropout is the probability of a reading without echo.
+    """
+
+    def __init__(self, distance=synthetic_distance, ultrasonic_period=ULTRASONIC_PERIOD, dropout=0.0,
+                 baudrate=DEFAULT_BAUD):
+        self.distance = distance
+        self.ultrasonic_period = ultrasonic_period
+        self.dropout = dropout
+        self.baudrate = baudrate
+
+        self.angles = [90.0] * len(SERVO_LIMITS)  # current positions, moving towards targets
+        self.targets = [90] * len(SERVO_LIMITS)
+        self.velocities = [0.0] * len(SERVO_LIMITS)
+        self.max_velocity = [float(v) for v in SERVO_MAX_VELOCITY]
+        self.max_acceleration = [float(a) for a in SERVO_MAX_ACCELERATION]
+        self.counters = {"bytes_received": 0, "commands": 0, "lines_sent": 0, "errors_sent": 0, "stops": 0}
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port_name = os.ttyname(self._slave)
+
+        self._parser = CommandParser()
+        self._parser_errors = 0
+        self._baud_deadline = None
+        self._sensor_connected = True
+        self._misses = 0
+        self._next_ranging = 0.0
+        self.power_period = 0
+        self._next_power = 0.0
+        self._stalls = {}  # channel -> (extra mA, until)
+        self._echoes = collections.deque(maxlen=RANGING_MEDIAN)
+        self._started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-arduino", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _run(self):
+        # Single loop like the firmware's loop(): a slow Serial.print delays everything else
+        self._next_ranging = time.monotonic() + self.ultrasonic_period
+        last_slew = time.monotonic()
+        while not self._stop.is_set():
+            timeout = max(0.0, min(self._next_ranging - time.monotonic(), SLEW_PERIOD))
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self._master, 256)
+                except OSError:
+                    return
+                # The bytes only finish arriving after their wire time
+                time.sleep(len(data) * 10 / self.baudrate)
+                self.counters["bytes_received"] += len(data)
+                self._handle_bytes(data)
+
+            now = time.monotonic()
+            if now - last_slew >= SLEW_PERIOD:
+                self._update_slew(min(now - last_slew, 5 * SLEW_PERIOD))
+                last_slew = now
+            if self._baud_deadline is not None and now >= self._baud_deadline:
+                self._baud_deadline = None
+                self.baudrate = DEFAULT_BAUD
+            if self.power_period and now >= self._next_power:
+                self._power(now)
+                self._next_power = now + self.power_period
+            if self.ultrasonic_period and now >= self._next_ranging:
+                self._ultrasonic(now - self._started)
+                self._next_ranging = now + self.ultrasonic_period
+
+    def _handle_bytes(self, data):
+        for servo, angle in self._parser.feed(data):
+            self._move_servo(servo, angle)
+        if self._parser.errors != self._parser_errors:
+            self._parser_errors = self._parser.errors
+            self._println(f"Error: {self._parser.last_error}")
+        while self._parser.lines:
+            self._handle_line(self._parser.lines.pop(0))
+
+    def _handle_line(self, line):
+        if line == "HELLO":
+            self._baud_deadline = None
+            self._println(f"Ack: HELLO {PROTOCOL_VERSION}")
+        elif line.startswith("BAUD "):
+            baud = _atoi(line[5:])
+            if baud in SUPPORTED_BAUDRATES:
+                self._println(f"Ack: BAUD {baud}")
+                self.baudrate = baud
+                self._baud_deadline = time.monotonic() + BAUD_CONFIRM_TIMEOUT
+            else:
+                self._println("Error: Unsupported baud rate.")
+        elif line == "STOP":
+            for servo, angle in enumerate(self.angles):
+                self.targets[servo] = round(angle)
+                self.angles[servo] = float(self.targets[servo])
+                self.velocities[servo] = 0.0
+            self.counters["stops"] += 1
+            self._println("Ack: STOP " + " ".join(str(target) for target in self.targets))
+        elif line.startswith("POWER "):
+            hz = _atoi(line[6:])
+            if 0 <= hz <= POWER_MAX_HZ:
+                self.power_period = 1.0 / hz if hz else 0
+                self._next_power = time.monotonic()
+                self._println(f"Ack: POWER {hz}")
+            else:
+                self._println("Error: Unsupported power rate.")
+        elif line.startswith("RANGE "):
+            hz = _atoi(line[6:])
+            if 0 <= hz <= RANGING_MAX_HZ:
+                self.ultrasonic_period = 1.0 / hz if hz else 0
+                self._next_ranging = time.monotonic()
+                self._println(f"Ack: RANGE {hz}")
+            else:
+                self._println("Error: Unsupported ranging rate.")
+        elif line.startswith("VEL ") or line.startswith("ACC "):
+            self._set_limit(line[4:], self.max_velocity if line.startswith("VEL") else self.max_acceleration,
+                            line[:3])
+        elif " " in line:
+            # Non-numeric servo lines still reach moveServo() through atoi() on the board
+            servo, _, angle = line.partition(" ")
+            self._move_servo(_atoi(servo), _atoi(angle))
+
+    def _move_servo(self, servo, angle):
+        if not 0 <= servo < len(SERVO_LIMITS):
+            self._println("Error: Invalid servo index.")
+            return
+        low, high = SERVO_LIMITS[servo]
+        if low <= angle <= high:
+            self.targets[servo] = angle
+            if self.max_velocity[servo] <= 0 or self.max_acceleration[servo] <= 0:
+                self.angles[servo] = float(angle)
+                self.velocities[servo] = 0.0
+            self.counters["commands"] += 1
+        else:
+            self._println(f"Error: Servo {servo} angle out of range. Allowed: {low}-{high}")
+
+    def _set_limit(self, args, limits, name):
+        first, separator, value = args.partition(" ")
+        servos = [_atoi(first)] if separator else list(range(len(limits)))
+        value = _atof(value if separator else args)
+        if not 0 <= servos[0] < len(limits) or value < 0:
+            self._println("Error: Invalid limit.")
+            return
+        for servo in servos:
+            limits[servo] = value
+        self._println(f"Ack: {name} {args}")
+
+    def _update_slew(self, dt):
+        for servo, target in enumerate(self.targets):
+            self.angles[servo], self.velocities[servo] = slew_step(
+                self.angles[servo], self.velocities[servo], target,
+                self.max_velocity[servo], self.max_acceleration[servo], dt)
+
+    def _ultrasonic(self, t):
+        # handleEcho(): median of the last echoes, a disconnect after many misses in a row
+        distance = 0 if random.random() < self.dropout else self.distance(t)
+        if distance <= 0:
+            self._misses += 1
+            if self._misses == RANGING_MISSES_DISCONNECTED and self._sensor_connected:
+                self._sensor_connected = False
+                self._println("Error: Ultrasonic sensor disconnected.")
+            return
+        self._misses = 0
+        if not self._sensor_connected:
+            self._sensor_connected = True
+            self._println("Message: Ultrasonic sensor connected.")
+        self._echoes.append(distance)
+        self._println(f"Distance: {sorted(self._echoes)[len(self._echoes) // 2]}")
+
+    def stall(self, channel, milliamps, seconds):
+        """Add milliamps to a channel for the next seconds, like a blocked MG995."""
+        self._stalls[channel] = (milliamps, time.monotonic() + seconds)
+
+    def _power(self, now):
+        fields = []
+        for channel, servos in enumerate(POWER_RAILS):
+            milliamps = POWER_IDLE_MA[channel] + POWER_MA_PER_DEG_S[channel] * sum(
+                abs(self.velocities[servo]) for servo in servos)
+            extra, until = self._stalls.get(channel, (0, 0))
+            if now < until:
+                milliamps += extra
+            millivolts = POWER_SUPPLY_MV - milliamps * POWER_SOURCE_OHMS
+            fields += [int(millivolts), int(milliamps)]
+        self._println("Power: " + " ".join(map(str, fields)))
+
+    def _println(self, line):
+        data = (line + "\r\n").encode()
+        try:
+            os.write(self._master, data)
+        except OSError:
+            return
+        self.counters["lines_sent"] += 1
+        if line.startswith("Error: "):
+            self.counters["errors_sent"] += 1
+        # Serial.print blocks once the 64 byte TX buffer is full
+        time.sleep(len(data) * 10 / self.baudrate)
+
+
+def synthetic_frames(count=30, size=(320, 240)):
+    """Numbered test frames with a moving square, for running without a recording."""
+    width, height = size
+    frames = []
+    for i in range(count):
+        image = np.full((height, width, 3), 200, np.uint8)
+        x = int((width - 60) * i / max(1, count - 1))
+        cv2.rectangle(image, (x, height // 2 - 30), (x + 60, height // 2 + 30), (40, 120, 220), -1)
+        cv2.putText(image, str(i), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        frames.append(cv2.imencode(".jpg", image)[1].tobytes())
+    return frames
+
+
+class FrameSource:
+    """
+    Plays recorded (or synthetic) JPEGs on a wall clock, looping, and applies
+    the framesize and quality set through /control by re-encoding.
+    """
+
+    def __init__(self, recording_path=None, fps=None, bandwidth=None):
+        if recording_path:
+            recording = Recording(recording_path)
+            self.frames = [recording.jpeg(i) for i in range(len(recording))]
+            timestamps = recording.index["timestamp"] - recording.index["timestamp"][0]
+        else:
+            self.frames = synthetic_frames()
+            timestamps = np.arange(len(self.frames)) / 25.0
+        if fps or len(self.frames) < 2:
+            timestamps = np.arange(len(self.frames)) / (fps or 25.0)
+        self.offsets = timestamps.tolist()
+        self.period = loop_period(self.offsets)
+
+        self.status = {"framesize": 5, "quality": 12}  # QVGA, as set in CameraWebServer.ino
+        self.bandwidth = bandwidth  # bytes/s of the simulated WiFi link, None for unlimited
+        self._changed = False  # serve recorded bytes untouched until /control is used
+        self._started = time.monotonic()
+        self._cache = {}
+
+    def control(self, variable, value):
+        if variable not in self.status:
+            return False
+        self.status[variable] = value
+        self._changed = True
+        self._cache.clear()
+        return True
+
+    def current(self):
+        """(index, jpeg) of the frame that is on air right now."""
+        t = (time.monotonic() - self._started) % self.period
+        index = max(0, bisect.bisect_right(self.offsets, t) - 1)
+        return index, self._encoded(index)
+
+    def next_change(self):
+        """Seconds until the next frame is on air."""
+        t = (time.monotonic() - self._started) % self.period
+        index = bisect.bisect_right(self.offsets, t)
+        following = self.offsets[index] if index < len(self.offsets) else self.period
+        return max(0.001, following - t)
+
+    def _encoded(self, index):
+        if not self._changed:
+            return bytes(self.frames[index])
+        if index not in self._cache:
+            image = cv2.imdecode(np.frombuffer(self.frames[index], np.uint8), cv2.IMREAD_COLOR)
+            image = cv2.resize(image, FRAMESIZES.get(self.status["framesize"], (320, 240)), interpolation=cv2.INTER_AREA)
+            # ESP32 quality is 0 (best) .. 63 (worst)
+            quality = int(np.clip(100 - self.status["quality"] * 1.5, 5, 100))
+            self._cache[index] = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+        return self._cache[index]
+
+
+class _CameraHandler(http.server.BaseHTTPRequestHandler):
+    source = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/capture":
+            _, jpeg = self.source.current()
+            self._reply(200, "image/jpeg", jpeg)
+        elif url.path == "/status":
+            self._reply(200, "application/json", json.dumps(self.source.status).encode())
+        elif url.path == "/control":
+            query = parse_qs(url.query)
+            if "var" not in query or "val" not in query:
+                self._reply(404, "text/plain", b"")
+            elif self.source.control(query["var"][0], _atoi(query["val"][0])):
+                self._reply(200, "text/plain", b"")
+            else:
+                self._reply(500, "text/plain", b"")
+        elif url.path == "/stream":
+            self._stream()
+        else:
+            self._reply(404, "text/plain", b"")
+
+    def _reply(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self):
+        # Same framing as stream_handler in app_httpd.cpp
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={PART_BOUNDARY}")
+        self.end_headers()
+        last = None
+        try:
+            while True:
+                index, jpeg = self.source.current()
+                if index != last:
+                    last = index
+                    now = time.time()
+                    header = (f"\r\n--{PART_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                              f"Content-Length: {len(jpeg)}\r\nX-Timestamp: {int(now)}.{int(now % 1 * 1e6):06d}\r\n\r\n")
+                    self.wfile.write(header.encode() + jpeg)
+                    self.wfile.flush()
+                    if self.source.bandwidth:
+                        # Frames that air while this one is "on the link" are skipped, as on a slow WiFi
+                        time.sleep(len(jpeg) / self.source.bandwidth)
+                time.sleep(self.source.next_change())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeCamera:
+    """
+    Local stand-in for the ESP32-CAM web server: /capture, /status and /control
+    on port, /stream on stream_port (the board uses 80 and 81).
+    """
+
+    def __init__(self, recording_path=None, host="127.0.0.1", port=SIMULATOR_HTTP_PORT,
+                 stream_port=SIMULATOR_STREAM_PORT, fps=None, bandwidth=None):
+        self.source = FrameSource(recording_path, fps, bandwidth)
+        handler = type("CameraHandler", (_CameraHandler,), {"source": self.source})
+        self.servers = [http.server.ThreadingHTTPServer((host, p), handler) for p in (port, stream_port)]
+        for server in self.servers:
+            server.daemon_threads = True
+        self.capture_url = f"http://{host}:{self.servers[0].server_address[1]}/capture"
+        self.stream_url = f"http://{host}:{self.servers[1].server_address[1]}/stream"
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, name="fake-camera", daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+def load_test(duration=10.0, baudrate=115200, submit_rate=1000, ultrasonic_period=0.01, recording_path=None):
+    """
+    Drive the servo writer, serial reader and video pipeline against the
+    simulator at rates far above normal use and return their counters.
+    """
+    import serial
+    import camera
+    import pipeline
+    import serial_link
+
+    arduino = FakeArduino(ultrasonic_period=ultrasonic_period, dropout=0.05).start()
+    fake_camera = FakeCamera(recording_path, port=0, stream_port=0).start()
+    port = serial.Serial(arduino.port_name, DEFAULT_BAUD, timeout=0.5)
+    protocol, _ = serial_link.negotiate(port, baudrate)
+
+    writer = serial_link.ServoCommandWriter(port, port.baudrate, encode=serial_link.PROTOCOLS[protocol]).start()
+    events = []
+    reader = serial_link.SerialReader(port, notify=lambda: None).start()
+    stream = camera.MjpegStreamClient(fake_camera.stream_url).start()
+    seq = [0]
+
+    def capture():
+        frame = stream.wait_for_frame(seq[0], timeout=1.0)
+        if frame is None:
+            return None
+        seq[0] = frame[0]
+        return camera.decode_jpeg(frame[2])
+
+    video = pipeline.VideoPipeline(capture, lambda frame: frame.image, lambda image: None).start()
+
+    started = time.monotonic()
+    submitted = 0
+    while time.monotonic() - started < duration:
+        servo = submitted % 5
+        writer.submit(servo, 45 + (submitted // 5) % 90)
+        submitted += 1
+        if submitted % 50 == 0:
+            events.extend(reader.drain())
+            video.poll_render()
+        time.sleep(1.0 / submit_rate)
+    time.sleep(0.5)
+    events.extend(reader.drain())
+
+    writer.stop()
+    reader.stop()
+    video.stop()
+    stream.stop()
+    fake_camera.stop()
+    port.close()
+    arduino.stop()
+
+    kinds = {}
+    for event in events:
+        kinds[event.kind] = kinds.get(event.kind, 0) + 1
+    return {
+        "protocol": f"{protocol} @ {port.baudrate}",
+        "writer": writer.counters,
+        "arduino": arduino.counters,
+        "reader": dict(reader.counters, events=kinds, latency=reader.latency.summary()),
+        "video": video.summary(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hardware-free Arduino and ESP32-CAM simulator")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="serve a fake arm and camera until interrupted")
+    run.add_argument("--recording", help="recording to serve (recorder.py); synthetic frames otherwise")
+    run.add_argument("--fps", type=float, help="override the recorded frame timing")
+    run.add_argument("--bandwidth", type=float, help="limit the camera stream to this many KB/s")
+    run.add_argument("--port", type=int, default=SIMULATOR_HTTP_PORT)
+    run.add_argument("--stream-port", type=int, default=SIMULATOR_STREAM_PORT)
+    run.add_argument("--ultrasonic-period", type=float, default=ULTRASONIC_PERIOD)
+    run.add_argument("--dropout", type=float, default=0.0, help="probability of a reading without echo")
+
+    load = commands.add_parser("loadtest", help="stress the serial and video paths against the simulator")
+    load.add_argument("--duration", type=float, default=10.0)
+    load.add_argument("--baudrate", type=int, default=115200)
+    load.add_argument("--submit-rate", type=float, default=1000)
+    load.add_argument("--recording")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        distance_source = recorded_distance(Recording(args.recording)) if args.recording else synthetic_distance
+        arduino = FakeArduino(distance_source, args.ultrasonic_period, args.dropout).start()
+        fake_camera = FakeCamera(args.recording, port=args.port, stream_port=args.stream_port, fps=args.fps,
+                                 bandwidth=args.bandwidth and args.bandwidth * 1024).start()
+        print(f"Serial port: {arduino.port_name}")
+        print(f"Camera:      {fake_camera.capture_url} (stream on {fake_camera.stream_url})")
+        print("Set SIMULATOR_SERIAL_PORT and CAMERA_URL to these values and "
+              f"CAMERA_STREAM_PORT = {args.stream_port} in globals.py. Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"Servos: {[round(angle) for angle in arduino.angles]}  {arduino.counters}")
+        except KeyboardInterrupt:
+            fake_camera.stop()
+            arduino.stop()
+    else:
+        result = load_test(args.duration, args.baudrate, args.submit_rate, recording_path=args.recording)
+        for name, value in result.items():
+            print(f"{name}: {value}")
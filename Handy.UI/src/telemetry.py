@@ -0,0 +1,147 @@
+import numpy as np
+
+from globals import (POWER_CHANNEL_NAMES, POWER_OVERCURRENT_MA, POWER_STALL_MA, POWER_STALL_TIME, POWER_MIN_BUS_MV,
+                     POWER_PLOT_SECONDS)
+
+
+class SampleRing:
+    """
+    Fixed-size ring buffer of timestamped firmware samples (time.perf_counter()
+    clock, like SerialEvent.received_at) with one or more channels.
+
+    Like StageStats, add() takes no lock: there is a single writer (the serial
+    reader thread) and readers copy the buffers. samples() checks count after
+    copying and drops the oldest slots add() may have rewritten meanwhile, so a
+    copy stays in time order.
+    """
+
+    def __init__(self, size, channels=1, dtype=np.float32):
+        self.size = size
+        self.channels = channels
+        self.count = 0
+        self._timestamps = np.zeros(size)
+        self._values = np.zeros((size, channels), dtype=dtype)
+
+    def add(self, timestamp, values):
+        i = self.count % self.size
+        self._values[i] = values
+        self._timestamps[i] = timestamp
+        self.count += 1
+
+    def samples(self, since=None):
+        """(timestamps, values) in the buffer, oldest first; values has one column per channel."""
+        count = self.count
+        size = min(count, self.size)
+        order = np.arange(count - size, count) % self.size
+        timestamps, values = self._timestamps[order], self._values[order]
+        # Samples up to count_after - size + 1 (the +1 is an add() still writing) reuse slots we copied
+        overwritten = min(max(self.count - self.size + 1 - (count - size), 0), size)
+        if overwritten:
+            timestamps, values = timestamps[overwritten:], values[overwritten:]
+        if since is not None:
+            keep = timestamps >= since
+            timestamps, values = timestamps[keep], values[keep]
+        return timestamps, values
+
+    def latest(self, default=None):
+        if not self.count:
+            return default
+        return self._values[(self.count - 1) % self.size].copy()
+
+    def nearest(self, timestamp, default=None):
+        """Values of the sample closest in time to timestamp."""
+        timestamps, values = self.samples()
+        if not len(timestamps):
+            return default
+        i = int(np.searchsorted(timestamps, timestamp))
+        if i == len(timestamps) or (i > 0 and timestamp - timestamps[i - 1] <= timestamps[i] - timestamp):
+            i -= 1
+        return values[i]
+
+
+class PowerMonitor:
+    """
+    Checks every INA3221 sample (bus mV, mA per channel) for overcurrent, a
+    stall (current above stall_ma for stall_time seconds) and supply sag.
+
+    check() runs on the serial reader thread, so a fault is seen as soon as its
+    sample arrives. It returns a description once per fault and re-arms when a
+    sample is clean again.
+    """
+
+    def __init__(self, names=POWER_CHANNEL_NAMES, overcurrent_ma=POWER_OVERCURRENT_MA, stall_ma=POWER_STALL_MA,
+                 stall_time=POWER_STALL_TIME, min_bus_mv=POWER_MIN_BUS_MV):
+        self.names = names
+        self.overcurrent_ma = overcurrent_ma
+        self.stall_ma = stall_ma
+        self.stall_time = stall_time
+        self.min_bus_mv = min_bus_mv
+
+        self.faults = 0
+        self.last_fault = None
+        self._above_since = [None] * len(names)
+        self._active = False
+
+    def check(self, timestamp, sample):
+        fault = None
+        for channel, name in enumerate(self.names):
+            millivolts, milliamps = sample[2 * channel], sample[2 * channel + 1]
+            if milliamps > self.stall_ma[channel]:
+                if self._above_since[channel] is None:
+                    self._above_since[channel] = timestamp
+            else:
+                self._above_since[channel] = None
+
+            if fault is not None:
+                continue
+            if milliamps > self.overcurrent_ma[channel]:
+                fault = f"Overcurrent on {name}: {milliamps} mA"
+            elif (self._above_since[channel] is not None
+                  and timestamp - self._above_since[channel] >= self.stall_time):
+                fault = f"Stall on {name}: {milliamps} mA for {timestamp - self._above_since[channel]:.1f} s"
+            elif 1000 < millivolts < self.min_bus_mv:  # below 1 V the channel is not connected
+                fault = f"Supply sag on {name}: {millivolts} mV"
+
+        if fault is None:
+            self._active = False
+            return None
+        if self._active:
+            return None
+        self._active = True
+        self.faults += 1
+        self.last_fault = fault
+        return fault
+
+
+class PowerPlot:
+    """
+    Live current plot on a Tk canvas. update() redraws the last `seconds` of the
+    ring with one coords() call per channel line, on a timer rather than per sample.
+    """
+
+    COLORS = ("red", "blue", "green")
+
+    def __init__(self, canvas, ring, names=POWER_CHANNEL_NAMES, seconds=POWER_PLOT_SECONDS,
+                 full_scale_ma=max(POWER_OVERCURRENT_MA)):
+        self.canvas = canvas
+        self.ring = ring
+        self.names = names
+        self.seconds = seconds
+        self.full_scale_ma = full_scale_ma
+        self.lines = [canvas.create_line(0, 0, 0, 0, fill=color) for color in self.COLORS[:len(names)]]
+        self.label = canvas.create_text(4, 2, anchor="nw", font=("Courier", 8))
+
+    def update(self, now):
+        width = int(self.canvas.winfo_width())
+        height = int(self.canvas.winfo_height())
+        timestamps, values = self.ring.samples(since=now - self.seconds)
+        if len(timestamps) < 2 or width < 2:
+            return
+
+        x = (timestamps - (now - self.seconds)) * (width / self.seconds)
+        for channel, line in enumerate(self.lines):
+            y = height - np.clip(values[:, 2 * channel + 1] / self.full_scale_ma, 0, 1) * (height - 12)
+            self.canvas.coords(line, *np.column_stack((x, y)).ravel().tolist())
+        latest = values[-1]
+        self.canvas.itemconfigure(self.label, text="  ".join(
+            f"{name} {latest[2 * i + 1]:.0f} mA {latest[2 * i] / 1000:.2f} V" for i, name in enumerate(self.names)))
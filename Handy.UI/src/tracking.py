@@ -0,0 +1,199 @@
+import argparse
+import time
+
+import cv2
+
+from globals import (DETECTOR_BACKEND, DETECTOR_MOTION_THRESHOLD, DETECTOR_STILL_THRESHOLD, DETECTOR_MAX_SKIP,
+                     DETECTOR_TRACKER)
+
+MOTION_SIZE = (64, 48)
+MOTION_PIXEL_DELTA = 16  # grey levels; smaller differences are sensor/JPEG noise
+
+# Fastest first; the legacy and KCF/CSRT trackers need opencv-contrib
+TRACKER_FACTORIES = (
+    ("mosse", lambda: cv2.legacy.TrackerMOSSE_create()),
+    ("kcf", lambda: cv2.TrackerKCF_create()),
+    ("csrt", lambda: cv2.TrackerCSRT_create()),
+    ("mil", lambda: cv2.TrackerMIL_create()),
+)
+
+
+def motion_thumbnail(image):
+    """Small grayscale copy of a BGR frame used for motion scores."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def motion_score(a, b):
+    """Fraction of thumbnail pixels that changed by more than MOTION_PIXEL_DELTA, 0 .. 1."""
+    if a is None or b is None:
+        return 1.0
+    return cv2.countNonZero(cv2.compare(cv2.absdiff(a, b), MOTION_PIXEL_DELTA, cv2.CMP_GT)) / a.size
+
+
+def tracker_factory(name=DETECTOR_TRACKER):
+    """
+    Return (name, factory) for the requested tracker, or the first one this
+    OpenCV build has for "auto". ("none", None) disables tracking.
+    """
+    if name == "none":
+        return "none", None
+    for candidate, factory in TRACKER_FACTORIES:
+        if name not in ("auto", candidate):
+            continue
+        try:
+            factory()
+        except (AttributeError, cv2.error):
+            continue
+        return candidate, factory
+    return "none", None
+
+
+class InferenceScheduler:
+    """
+    Wraps a Detector and only runs the network when the scene changed.
+
+    Every frame gets a motion score against the last detection. Above
+    motion_threshold, after max_skip frames, or when a tracker loses its object
+    the detector runs again. Otherwise the previous boxes are kept while the
+    frame is still (below still_threshold) and moved by one OpenCV tracker per
+    box when it is not. detect() returns the same list as Detector.detect().
+    """
+
+    def __init__(self, detector, motion_threshold=DETECTOR_MOTION_THRESHOLD,
+                 still_threshold=DETECTOR_STILL_THRESHOLD, max_skip=DETECTOR_MAX_SKIP, tracker=DETECTOR_TRACKER):
+        self.detector = detector
+        self.name = detector.name
+        self.motion_threshold = motion_threshold
+        self.still_threshold = still_threshold
+        self.max_skip = max_skip
+        self.tracker_name, self._tracker_factory = tracker_factory(tracker)
+
+        self.detections = []
+        self.counters = {"frames": 0, "detections": 0, "tracked": 0, "reused": 0, "lost": 0}
+
+        self._trackers = []
+        self._detected_thumb = None
+        self._updated_thumb = None
+        self._pending_thumb = None
+        self._since_detection = 0
+
+    def detect(self, image, timings=None):
+        detections = self.reuse(image, timings)
+        if detections is None:
+            detections = self.accept(image, self.detector.detect(image, timings))
+        return detections
+
+    def reuse(self, image, timings=None):
+        """
+        Boxes for the image without the network (kept or tracked), or None when the detector
+        has to run; its result then goes to accept(). Lets a caller batch the network runs.
+        """
+        started = time.perf_counter()
+        thumb = motion_thumbnail(image)
+        change = motion_score(self._detected_thumb, thumb)
+        if timings is not None:
+            timings["motion"] = time.perf_counter() - started
+
+        self.counters["frames"] += 1
+        self._since_detection += 1
+        if change > self.motion_threshold or self._since_detection > self.max_skip:
+            self._pending_thumb = thumb
+            return None
+        if motion_score(self._updated_thumb, thumb) < self.still_threshold or self._tracker_factory is None:
+            self.counters["reused"] += 1
+            return self.detections
+
+        started = time.perf_counter()
+        tracked = []
+        for (class_id, confidence, _), tracker in zip(self.detections, self._trackers):
+            ok, box = tracker.update(image)
+            if not ok:
+                self.counters["lost"] += 1
+                self._pending_thumb = thumb
+                return None
+            tracked.append((class_id, confidence, tuple(int(v) for v in box)))
+        if timings is not None:
+            timings["track"] = time.perf_counter() - started
+
+        self.counters["tracked"] += 1
+        self.detections = tracked
+        self._updated_thumb = thumb
+        return tracked
+
+    def accept(self, image, detections):
+        """Take the detector's boxes for the image reuse() returned None for."""
+        self.detections = detections
+        self.counters["detections"] += 1
+        self._detected_thumb = self._updated_thumb = self._pending_thumb
+        self._since_detection = 0
+
+        self._trackers = []
+        if self._tracker_factory is not None:
+            for _, _, box in self.detections:
+                tracker = self._tracker_factory()
+                tracker.init(image, tuple(int(v) for v in box))
+                self._trackers.append(tracker)
+        return self.detections
+
+
+def benchmark_scheduler(frames, backend=DETECTOR_BACKEND, **options):
+    """
+    Run the detector on every frame, then the scheduler on the same frames.
+    Returns timings, how often the network ran and the mAP proxy of the
+    scheduled boxes against per-frame detection.
+    """
+    import detector
+
+    model = detector.create_detector(backend)
+    model.detect(frames[0])  # warm-up
+
+    started = time.perf_counter()
+    reference = [model.detect(frame) for frame in frames]
+    full_time = time.perf_counter() - started
+
+    scheduler = InferenceScheduler(model, **options)
+    started = time.perf_counter()
+    scheduled = [list(scheduler.detect(frame)) for frame in frames]
+    scheduled_time = time.perf_counter() - started
+
+    return {
+        "frames": len(frames),
+        "tracker": scheduler.tracker_name,
+        "full_ms": full_time / len(frames) * 1000,
+        "scheduled_ms": scheduled_time / len(frames) * 1000,
+        "counters": scheduler.counters,
+        "map_proxy": detector.average_precision(reference, scheduled),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Motion-gated inference benchmark")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--frames", help="folder with .jpg frames (e.g. recorder.py export)")
+    source.add_argument("--recording", help="recording made with the Record button")
+    parser.add_argument("--backend", default=DETECTOR_BACKEND)
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--tracker", default=DETECTOR_TRACKER)
+    parser.add_argument("--max-skip", type=int, default=DETECTOR_MAX_SKIP)
+    parser.add_argument("--motion-threshold", type=float, default=DETECTOR_MOTION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.recording:
+        from recorder import Recording
+        from camera import decode_jpeg
+        recording = Recording(args.recording)
+        frame_set = [decode_jpeg(recording.jpeg(i)) for i in range(min(args.limit, len(recording)))]
+    else:
+        from detector import load_frames
+        frame_set = load_frames(args.frames, args.limit)
+
+    result = benchmark_scheduler(frame_set, args.backend, tracker=args.tracker, max_skip=args.max_skip,
+                                 motion_threshold=args.motion_threshold)
+    counters = result["counters"]
+    print(f"{result['frames']} frames, tracker: {result['tracker']}")
+    print(f"  every frame: {result['full_ms']:.1f} ms/frame")
+    print(f"  scheduled:   {result['scheduled_ms']:.1f} ms/frame, network ran on "
+          f"{counters['detections']}/{counters['frames']} frames "
+          f"({counters['tracked']} tracked, {counters['reused']} reused, {counters['lost']} lost)")
+    print(f"  mAP proxy vs every-frame detection: {result['map_proxy']:.3f}")
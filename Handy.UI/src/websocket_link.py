@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import os
+import struct
+
+# Minimal RFC 6455 framing for daemon.py and its clients: no extensions, no subprotocols.
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+MAX_MESSAGE_SIZE = 1 << 20  # commands and telemetry are small; anything bigger is a broken peer
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key."""
+    return base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+
+
+def new_key():
+    return base64.b64encode(os.urandom(16)).decode()
+
+
+def apply_mask(data, key):
+    """XOR data with the 4-byte masking key (masking and unmasking are the same operation)."""
+    if not data:
+        return b""
+    count = len(data)
+    repeated = (key * (count // 4 + 1))[:count]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")).to_bytes(count, "big")
+
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    """One unfragmented frame. Clients must mask their frames, servers must not."""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = apply_mask(payload, key)
+    return bytes(header) + payload
+
+
+def _parse_header(head):
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    masked = bool(head[1] & 0x80)
+    return fin, opcode, masked, head[1] & 0x7F
+
+
+def _payload_length(code, extended):
+    length = code if code < 126 else struct.unpack("!H" if code == 126 else "!Q", extended)[0]
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Frame of {length} bytes")
+    return length
+
+
+def _extended_size(code):
+    return {126: 2, 127: 8}.get(code, 0)
+
+
+def read_frame(read_exactly):
+    """Read one frame with a blocking read_exactly(n); returns (fin, opcode, payload)."""
+    fin, opcode, masked, code = _parse_header(read_exactly(2))
+    length = _payload_length(code, read_exactly(_extended_size(code)))
+    key = read_exactly(4) if masked else None
+    payload = read_exactly(length)
+    return fin, opcode, apply_mask(payload, key) if masked else payload
+
+
+async def read_frame_async(reader):
+    """read_frame() for an asyncio.StreamReader."""
+    fin, opcode, masked, code = _parse_header(await reader.readexactly(2))
+    length = _payload_length(code, await reader.readexactly(_extended_size(code)))
+    key = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length)
+    return fin, opcode, apply_mask(payload, key) if masked else payload
+
+
+class MessageAssembler:
+    """Joins fragmented data frames. feed() returns (opcode, payload) for complete messages and control frames."""
+
+    def __init__(self):
+        self._opcode = None
+        self._parts = []
+
+    def feed(self, fin, opcode, payload):
+        if opcode >= OP_CLOSE:
+            return opcode, payload  # control frames may arrive between fragments
+        if opcode != OP_CONTINUATION:
+            self._opcode, self._parts = opcode, []
+        elif self._opcode is None:
+            raise ProtocolError("Continuation frame without a message")
+        self._parts.append(payload)
+        if sum(len(part) for part in self._parts) > MAX_MESSAGE_SIZE:
+            raise ProtocolError("Message too large")
+        if not fin:
+            return None
+        message = (self._opcode, b"".join(self._parts))
+        self._opcode, self._parts = None, []
+        return message